@@ -0,0 +1,39 @@
+"""p50/p99 latency of the event endpoints under concurrent clients.
+
+Usage: python -m benchmarks.bench_async <base_url> [plant_id] [requests_per_client]
+
+Run it against a server started with db_async=false and again with
+db_async=true to compare the two request paths.
+"""
+import asyncio
+import sys
+from time import perf_counter
+import httpx
+
+CONCURRENCY_LEVELS = (50, 100, 250, 500)
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def client(http: httpx.AsyncClient, plant_id: int, requests: int, latencies: list):
+    for i in range(requests):
+        start = perf_counter()
+        response = await http.put("/events/plant/humidity", json={"plant_id": plant_id, "humidity_event": float(i % 100)})
+        response.raise_for_status()
+        latencies.append(perf_counter() - start)
+
+async def run(base_url: str, concurrency: int, plant_id: int, requests: int):
+    latencies = []
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as http:
+        await asyncio.gather(*(client(http, plant_id, requests, latencies) for _ in range(concurrency)))
+    return percentile(latencies, 50), percentile(latencies, 99)
+
+if __name__ == "__main__":
+    base_url = sys.argv[1]
+    plant_id = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    requests = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    for concurrency in CONCURRENCY_LEVELS:
+        p50, p99 = asyncio.run(run(base_url, concurrency, plant_id, requests))
+        print(f"{concurrency:>4} clients: p50 {p50 * 1000:8.1f} ms  p99 {p99 * 1000:8.1f} ms")
@@ -0,0 +1,49 @@
+"""Cold-start time of the API: process launch until /health/live and /health/ready answer 200.
+
+Usage: python -m benchmarks.bench_cold_start [uvicorn|gunicorn] [runs]
+
+Starts the app on port 8765 `runs` times (default 5) and prints the median
+time to live and to ready, plus the import and startup split that the
+worker reports in /health/ready.
+"""
+import statistics
+import subprocess
+import sys
+import time
+import httpx
+
+PORT = 8765
+COMMANDS = {
+    "uvicorn": [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--log-level", "warning"],
+    "gunicorn": [sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{PORT}"],
+}
+
+def _wait_for(url: str, started: float, timeout: float = 60.0):
+    while time.perf_counter() - started < timeout:
+        try:
+            response = httpx.get(url, timeout=1.0)
+            if response.status_code == 200:
+                return time.perf_counter() - started, response.json()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.02)
+    raise TimeoutError(f"{url} did not answer 200 within {timeout} s")
+
+def run_once(launcher: str):
+    started = time.perf_counter()
+    process = subprocess.Popen(COMMANDS[launcher], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        live_seconds, _ = _wait_for(f"http://127.0.0.1:{PORT}/health/live", started)
+        ready_seconds, ready = _wait_for(f"http://127.0.0.1:{PORT}/health/ready", started)
+        return live_seconds, ready_seconds, ready["import_seconds"], ready["startup_seconds"]
+    finally:
+        process.terminate()
+        process.wait()
+
+if __name__ == "__main__":
+    launcher = sys.argv[1] if len(sys.argv) > 1 else "uvicorn"
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    results = [run_once(launcher) for _ in range(runs)]
+    live, ready, imports, startup = (statistics.median(column) for column in zip(*results))
+    print(f"{launcher}: live {live:.2f} s, ready {ready:.2f} s "
+          f"(worker imports {imports:.2f} s, lifespan startup {startup:.2f} s; median of {runs})")
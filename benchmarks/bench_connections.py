@@ -0,0 +1,29 @@
+"""Connections per second with NullPool vs the pooled engine.
+
+Usage: python -m benchmarks.bench_connections [iterations]
+
+Uses the database configured in `.env`. Each iteration checks out a
+connection, runs `SELECT 1` and returns it, which is what every request
+did with NullPool.
+"""
+import sys
+from time import perf_counter
+from sqlalchemy import text
+from utils.db import create_db_engine
+
+def run(pool: str, iterations: int):
+    engine = create_db_engine(pool=pool)
+    try:
+        start = perf_counter()
+        for _ in range(iterations):
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+        elapsed = perf_counter() - start
+    finally:
+        engine.dispose()
+    return iterations / elapsed
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for pool in ("null", "queue"):
+        print(f"{pool:>5}: {run(pool, iterations):8.1f} connections/s")
@@ -0,0 +1,181 @@
+"""Fleet load test of the event endpoints, with baseline comparison.
+
+Usage: python -m benchmarks.bench_events <base_url> [--plants N] [--devices N] [--clients N]
+           [--duration S] [--rate R] [--save results.json] [--baseline baseline.json] [--tolerance 0.1]
+
+Simulates `clients` nodes, each owning a slice of the seeded plants
+(python -m benchmarks.seed_fixtures) and sending event updates with the mix
+in ENDPOINT_MIX for `duration` seconds, `rate` updates per second per client
+(0 sends the next update as soon as the last one returns). Reports
+throughput, p50/p95/p99 latency and errors per endpoint, plus the SQL
+statements per request read from the server's /metrics before and after
+the run (start the server with a single worker, or with
+PROMETHEUS_MULTIPROC_DIR set, so /metrics covers every request).
+
+--save writes the results as JSON. --baseline compares them with a saved
+run and exits with status 1 when a latency percentile grows or throughput
+falls by more than `tolerance`, or SQL statements per request increase.
+Latency and throughput are only compared for endpoints with
+MIN_COMPARE_REQUESTS requests in both runs.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+from time import perf_counter
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+from benchmarks.bench_async import percentile
+
+# Endpoint -> (relative weight, payload for a plant or device id)
+ENDPOINT_MIX = {
+    "/events/plant/humidity": (30, lambda plant_id: {"plant_id": plant_id, "humidity_event": round(random.uniform(0, 100), 1)}),
+    "/events/plant/luminosity": (30, lambda plant_id: {"plant_id": plant_id, "luminosity_event": round(random.uniform(0, 100), 1)}),
+    "/events/plant/led": (10, lambda plant_id: {"plant_id": plant_id, "led_intensity_event": random.randint(0, 100)}),
+    "/events/plant/valve": (10, lambda plant_id: {"plant_id": plant_id, "valve_event": random.random() < 0.5}),
+    "/events/plant/mode": (5, lambda plant_id: {"plant_id": plant_id, "mode": random.randint(1, 4)}),
+    "/events/device/pump": (15, lambda iot_dev_id: {"iot_dev_id": iot_dev_id, "pump_event": random.random() < 0.5}),
+}
+PERCENTILES = (50, 95, 99)
+# Percentiles of an endpoint with fewer requests than this are too noisy to compare
+MIN_COMPARE_REQUESTS = 100
+
+def _owned_ids(client: int, clients: int, count: int) -> list:
+    return list(range(client + 1, count + 1, clients)) or [client % count + 1]
+
+async def fleet_client(http: httpx.AsyncClient, client: int, args, deadline: float, samples: dict):
+    plants = _owned_ids(client, args.clients, args.plants)
+    devices = _owned_ids(client, args.clients, args.devices)
+    paths = list(ENDPOINT_MIX)
+    weights = [ENDPOINT_MIX[path][0] for path in paths]
+    interval = 1 / args.rate if args.rate else 0
+    next_send = perf_counter() + random.uniform(0, interval)
+    while next_send < deadline:
+        if interval:
+            await asyncio.sleep(max(0.0, next_send - perf_counter()))
+        path = random.choices(paths, weights)[0]
+        payload = ENDPOINT_MIX[path][1](random.choice(devices if path.startswith("/events/device") else plants))
+        start = perf_counter()
+        try:
+            response = await http.put(path, json=payload)
+            ok = response.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        latencies, errors = samples.setdefault(path, ([], [0]))
+        latencies.append(perf_counter() - start)
+        errors[0] += not ok
+        next_send = next_send + interval if interval else perf_counter()
+
+async def scrape_sql_counts(http: httpx.AsyncClient) -> dict:
+    """route -> (SQL statements, requests) from http_request_sql_queries; empty when /metrics is unavailable."""
+    try:
+        response = await http.get("/metrics")
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return {}
+    counts = {}
+    for family in text_string_to_metric_families(response.text):
+        if family.name != "http_request_sql_queries":
+            continue
+        for sample in family.samples:
+            route = sample.labels.get("route")
+            statements, requests = counts.get(route, (0.0, 0.0))
+            if sample.name.endswith("_sum"):
+                counts[route] = (statements + sample.value, requests)
+            elif sample.name.endswith("_count"):
+                counts[route] = (statements, requests + sample.value)
+    return counts
+
+def _summary(latencies: list, errors: int, duration: float, statements=None) -> dict:
+    result = {"requests": len(latencies), "errors": errors, "throughput": len(latencies) / duration}
+    for pct in PERCENTILES:
+        result[f"p{pct}_ms"] = percentile(latencies, pct) * 1000 if latencies else None
+    result["sql_per_request"] = statements
+    return result
+
+async def run(args) -> dict:
+    limits = httpx.Limits(max_connections=args.clients)
+    samples = {}
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as http:
+        before = await scrape_sql_counts(http)
+        started = perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(fleet_client(http, client, args, deadline, samples) for client in range(args.clients)))
+        duration = perf_counter() - started
+        after = await scrape_sql_counts(http)
+
+    endpoints = {}
+    total_statements = total_requests = 0
+    for path, (latencies, errors) in sorted(samples.items()):
+        statements, requests = (after.get(path, (0, 0))[i] - before.get(path, (0, 0))[i] for i in range(2))
+        endpoints[path] = _summary(latencies, errors[0], duration, statements / requests if requests else None)
+        total_statements += statements
+        total_requests += requests
+    all_latencies = [latency for latencies, _ in samples.values() for latency in latencies]
+    total_errors = sum(errors[0] for _, errors in samples.values())
+    total_sql = total_statements / total_requests if total_requests else None
+    config = {key: value for key, value in vars(args).items() if key not in ("save", "baseline")}
+    return {"config": config, "duration": duration, "total": _summary(all_latencies, total_errors, duration, total_sql),
+            "endpoints": endpoints}
+
+def _format(value):
+    return "-" if value is None else f"{value:.1f}"
+
+def print_results(results: dict):
+    print(f"{'endpoint':<26} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'SQL/req':>7}")
+    for name, result in [*results["endpoints"].items(), ("total", results["total"])]:
+        sql = "-" if result["sql_per_request"] is None else f"{result['sql_per_request']:.2f}"
+        print(f"{name:<26} {result['requests']:>8} {result['errors']:>6} {result['throughput']:>8.1f} "
+              f"{_format(result['p50_ms']):>8} {_format(result['p95_ms']):>8} {_format(result['p99_ms']):>8} {sql:>7}")
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions of `results` against `baseline`, as printable lines."""
+    regressions = []
+    pairs = [("total", results["total"], baseline["total"])]
+    pairs += [(path, result, baseline["endpoints"][path])
+              for path, result in results["endpoints"].items() if path in baseline["endpoints"]]
+    for name, new, old in pairs:
+        if min(new["requests"], old["requests"]) >= MIN_COMPARE_REQUESTS:
+            for key in (f"p{pct}_ms" for pct in PERCENTILES):
+                if new[key] > old[key] * (1 + tolerance):
+                    regressions.append(f"{name}: {key} {old[key]:.1f} -> {new[key]:.1f}")
+            if new["throughput"] < old["throughput"] * (1 - tolerance):
+                regressions.append(f"{name}: req/s {old['throughput']:.1f} -> {new['throughput']:.1f}")
+        # Statement counts are deterministic, so any increase is a regression
+        if new["sql_per_request"] is not None and old["sql_per_request"] is not None \
+                and new["sql_per_request"] > old["sql_per_request"] + 0.01:
+            regressions.append(f"{name}: SQL/req {old['sql_per_request']:.2f} -> {new['sql_per_request']:.2f}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fleet load test of the event endpoints.")
+    parser.add_argument("base_url")
+    parser.add_argument("--plants", type=int, default=1000)
+    parser.add_argument("--devices", type=int, help="defaults to --plants")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--rate", type=float, default=0, help="updates per second per client (0: closed loop)")
+    parser.add_argument("--save")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+    args.devices = args.devices or args.plants
+
+    results = asyncio.run(run(args))
+    print_results(results)
+    if args.save:
+        with open(args.save, "w") as output:
+            json.dump(results, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main()
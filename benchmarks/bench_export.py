@@ -0,0 +1,37 @@
+"""Rows per second and peak RSS of the Log export.
+
+Usage: python -m benchmarks.bench_export [csv|ndjson|parquet] [plant_id]
+
+Exports from the database configured in `.env` and discards the output.
+Peak RSS should stay flat as the exported row count grows.
+"""
+import resource
+import sys
+from time import perf_counter
+from services.log_export import export_chunks, iter_log_batches, validate_export_format
+from utils.db import init_engines
+
+def run(export_format: str, plant_id: int = None):
+    validate_export_format(export_format)
+    rows = 0
+
+    def counted(batches):
+        nonlocal rows
+        for batch in batches:
+            rows += len(batch)
+            yield batch
+
+    start = perf_counter()
+    size = sum(len(chunk) for chunk in export_chunks(export_format, counted(iter_log_batches(plant_id))))
+    elapsed = perf_counter() - start
+    return rows, size, elapsed
+
+if __name__ == "__main__":
+    init_engines()
+    export_format = sys.argv[1] if len(sys.argv) > 1 else "csv"
+    plant_id = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    rows, size, elapsed = run(export_format, plant_id)
+    # ru_maxrss is in KiB on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{export_format}: {rows} rows, {size / 1e6:.1f} MB in {elapsed:.2f} s "
+          f"({rows / elapsed if elapsed else 0:,.0f} rows/s), peak RSS {peak_rss_mb:.0f} MB")
@@ -0,0 +1,93 @@
+"""Log insert and last-temperature lookup latency as the Log table grows.
+
+Usage: python -m benchmarks.bench_log_growth [plant_id] [samples]
+
+Measures both operations on the database configured in `.env`, then grows
+`Log` to 10x and 100x its size with synthetic rows for `plant_id` spread
+over the last year, measuring again at each step. The synthetic rows are
+deleted at the end. Run it against a scratch copy of the database, once
+with a plain `Log` table and once after `python -m services.log_partitions migrate`.
+On a partitioned `Log`, the monthly partitions of the whole year are created
+first (and left in place), so no synthetic row lands in `Log_default`.
+"""
+import statistics
+import sys
+from datetime import datetime, timezone, timedelta
+from time import perf_counter
+from sqlalchemy import select, func, delete, text
+from models.schema import Log
+from services.log_service import insert_new_log_plant
+from services.log_partitions import is_partitioned, create_partition, month_start, next_month
+from utils.db import SessionLocal, init_engines
+
+GROWTH_FACTORS = (1, 10, 100)
+
+GROW_SQL = text("""
+INSERT INTO "Log" (entry_creation_time, entry_store_time, temperature, luminosity_state, humidity_state,
+                   valve_state, led_intensity_state, luminosity_event, humidity_event, valve_event,
+                   led_intensity_event, pump_state, pump_event, plant_id, mode_event, mode_state)
+SELECT t, t, 20 + random() * 10, random() * 100, random() * 100, false, 0, 0, 0, false, 0, false, false,
+       :plant_id, 1, 1
+FROM (SELECT now() - random() * interval '365 days' AS t FROM generate_series(1, :rows)) AS g
+""")
+
+def ensure_growth_partitions(session):
+    """Create the partitions of every month GROW_SQL spreads rows over."""
+    if not is_partitioned(session):
+        return
+    today = datetime.now(timezone.utc).date()
+    month = month_start(today - timedelta(days=365))
+    while month <= month_start(today):
+        create_partition(session, month)
+        month = next_month(month)
+    session.commit()
+
+def _median_ms(func_, samples: int) -> float:
+    timings = []
+    for _ in range(samples):
+        start = perf_counter()
+        func_()
+        timings.append((perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def measure(plant_id: int, samples: int):
+    with SessionLocal() as session:
+        last_temperature = (
+            select(Log.temperature).where(Log.plant_id == plant_id).order_by(Log.id.desc()).limit(1)
+        )
+        insert_ms = _median_ms(lambda: insert_new_log_plant(session, plant_id), samples)
+        lookup_ms = _median_ms(lambda: session.execute(last_temperature).scalar(), samples)
+    return insert_ms, lookup_ms
+
+def run(plant_id: int = 1, samples: int = 50):
+    with SessionLocal() as session:
+        ensure_growth_partitions(session)
+        base_rows = session.execute(select(func.count()).select_from(Log)).scalar()
+        first_synthetic_id = (session.execute(select(func.max(Log.id))).scalar() or 0) + 1
+
+    results = []
+    try:
+        for factor in GROWTH_FACTORS:
+            with SessionLocal() as session:
+                rows = session.execute(select(func.count()).select_from(Log)).scalar()
+                missing = max(base_rows, 1) * factor - rows
+                if missing > 0:
+                    session.execute(GROW_SQL, {"plant_id": plant_id, "rows": missing})
+                    session.commit()
+                    session.execute(text('ANALYZE "Log"'))
+                    session.commit()
+                    rows += missing
+            insert_ms, lookup_ms = measure(plant_id, samples)
+            results.append((factor, rows, insert_ms, lookup_ms))
+    finally:
+        with SessionLocal() as session:
+            session.execute(delete(Log).where(Log.id >= first_synthetic_id))
+            session.commit()
+    return results
+
+if __name__ == "__main__":
+    init_engines()
+    plant_id = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    for factor, rows, insert_ms, lookup_ms in run(plant_id, samples):
+        print(f"{factor:>4}x ({rows:>10,} rows): insert {insert_ms:.2f} ms, last temperature {lookup_ms:.2f} ms (median)")
@@ -0,0 +1,117 @@
+"""Logging cost per request: print() vs the queued JSON logger.
+
+Usage: python -m benchmarks.bench_logging [requests] [threads]
+
+Each simulated request emits the lines a plant event update used to print
+("Updating ...", "Updated ...", "New log entry ..."). stdout is an
+unbuffered pipe to a child process, as on a platform log drain, and the
+time is measured in the request threads only. The cases run once with a
+drain that keeps up and once with a drain limited to DRAIN_SLOW_BYTES_PER_S,
+where print() blocks on the full pipe. No database is needed.
+"""
+import io
+import logging
+import logging.handlers
+import queue
+import subprocess
+import sys
+import threading
+from time import perf_counter
+from uuid import uuid4
+from utils.log_config import (DroppingQueueHandler, JsonFormatter, RequestContextFilter, is_sampled,
+                              request_id, request_sampled)
+
+DRAIN_SLOW_BYTES_PER_S = 2_000_000
+_SLOW_READER = (
+    "import sys, time\n"
+    "while sys.stdin.buffer.read(4096):\n"
+    f"    time.sleep(4096 / {DRAIN_SLOW_BYTES_PER_S})\n"
+)
+
+def _drain(slow: bool):
+    """A pipe to a child process, flushed on every line like PYTHONUNBUFFERED stdout."""
+    command = [sys.executable, "-c", _SLOW_READER] if slow else ["cat"]
+    sink = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    return sink, io.TextIOWrapper(sink.stdin, line_buffering=True)
+
+def _print_request(stream, plant_id: int):
+    print(f"Updating humidity_event for plant ID {plant_id} to 55.0", file=stream, flush=True)
+    print(f"Updated humidity_event for plant ID {plant_id} to 55.0", file=stream, flush=True)
+    print(f"New log entry created for plant ID {plant_id}", file=stream, flush=True)
+
+def _log_request(logger, plant_id: int, sample_rate: float):
+    req_id = uuid4().hex
+    id_token = request_id.set(req_id)
+    sampled_token = request_sampled.set(is_sampled(req_id, sample_rate))
+    try:
+        logger.debug("Updating %s for plant ID %s to %s", "humidity_event", plant_id, 55.0, extra={"plant_id": plant_id})
+        logger.info("Updated %s for plant ID %s to %s", "humidity_event", plant_id, 55.0, extra={"plant_id": plant_id})
+        logger.debug("New log entry %s for plant ID %s", "created", plant_id, extra={"plant_id": plant_id})
+    finally:
+        request_sampled.reset(sampled_token)
+        request_id.reset(id_token)
+
+def _run_threads(work, requests: int, threads: int) -> float:
+    per_thread = requests // threads
+    def worker():
+        for i in range(per_thread):
+            work(i % 100 + 1)
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    start = perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return (perf_counter() - start) / (per_thread * threads)
+
+def bench_print(requests: int, threads: int, slow: bool) -> float:
+    sink, stream = _drain(slow)
+    try:
+        return _run_threads(lambda plant_id: _print_request(stream, plant_id), requests, threads)
+    finally:
+        stream.close()
+        sink.wait()
+
+def bench_logging(requests: int, threads: int, slow: bool, level: int, sample_rate: float, queued: bool) -> float:
+    sink, stream = _drain(slow)
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter())
+    logger = logging.getLogger(f"bench_logging.{uuid4().hex}")
+    logger.propagate = False
+    logger.setLevel(level)
+    listener = None
+    if queued:
+        handler = DroppingQueueHandler(queue.Queue(maxsize=requests * 3))
+        listener = logging.handlers.QueueListener(handler.queue, output)
+        listener.start()
+    else:
+        handler = output
+    handler.addFilter(RequestContextFilter())
+    logger.addHandler(handler)
+    try:
+        return _run_threads(lambda plant_id: _log_request(logger, plant_id, sample_rate), requests, threads)
+    finally:
+        if listener is not None:
+            listener.stop()
+        stream.close()
+        sink.wait()
+
+if __name__ == "__main__":
+    # As setup_logging() configures the app
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    print(f"{requests} requests on {threads} threads, microseconds per request in the request thread")
+    print(f"{'':>32}  {'fast drain':>10}  {'slow drain':>10}")
+    print(f"{'print() x3':>32}  {bench_print(requests, threads, False) * 1e6:10.1f}  "
+          f"{bench_print(requests, threads, True) * 1e6:10.1f}")
+    cases = (
+        ("json, DEBUG, direct", logging.DEBUG, 1.0, False),
+        ("json, DEBUG, queued", logging.DEBUG, 1.0, True),
+        ("json, INFO, queued", logging.INFO, 1.0, True),
+        ("json, INFO, queued, 10% sampled", logging.INFO, 0.1, True),
+    )
+    for name, *case in cases:
+        print(f"{name:>32}  {bench_logging(requests, threads, False, *case) * 1e6:10.1f}  "
+              f"{bench_logging(requests, threads, True, *case) * 1e6:10.1f}")
@@ -0,0 +1,112 @@
+"""Seed a scratch database with a plant fleet and Log history for the benchmarks.
+
+Usage: python -m benchmarks.seed_fixtures [--plants N] [--plants-per-device N] [--log-rows N] [--days N]
+
+Uses the database configured in `.env`; set database_url=sqlite:///bench.db
+to seed a local SQLite file instead of Postgres. Creates missing tables,
+then inserts `plants` plants, each with its own PlantState and PlantEvent
+(with the same id as the plant), one IotDev per `plants-per-device` plants,
+and `log-rows` Log rows spread over the last `days` days in id order. The
+Plant table must be empty: seed a scratch database, never the production one.
+"""
+import argparse
+import sys
+from time import perf_counter
+from sqlalchemy import insert, select, func, text
+from models.schema import Base, Plant, PlantState, PlantEvent, IotDev, IotDevState, IotDevEvent
+from utils.db import init_engines
+
+# Rows per INSERT ... SELECT when generating Log history
+LOG_CHUNK_ROWS = 200_000
+
+LOG_COLUMNS = """entry_creation_time, entry_store_time, temperature, luminosity_state, humidity_state,
+                 valve_state, led_intensity_state, luminosity_event, humidity_event, valve_event,
+                 led_intensity_event, pump_state, pump_event, plant_id, mode_event, mode_state"""
+
+POSTGRES_LOG_SQL = text(f"""
+INSERT INTO "Log" ({LOG_COLUMNS})
+SELECT t, t, 18 + random() * 12, random() * 100, random() * 100, random() < 0.5, (random() * 100)::int,
+       random() * 100, random() * 100, random() < 0.5, (random() * 100)::int, random() < 0.5, random() < 0.5,
+       1 + g % :plants, 1 + g % 4, 1 + g % 4
+FROM generate_series(:first, :last) AS g,
+     LATERAL (SELECT now() - make_interval(secs => (:rows - g) * :spacing) AS t) AS ts
+""")
+
+SQLITE_LOG_SQL = text(f"""
+WITH RECURSIVE g(n) AS (SELECT :first UNION ALL SELECT n + 1 FROM g WHERE n < :last)
+INSERT INTO "Log" ({LOG_COLUMNS})
+SELECT datetime('now', '-' || CAST((:rows - n) * :spacing AS INTEGER) || ' seconds'),
+       datetime('now', '-' || CAST((:rows - n) * :spacing AS INTEGER) || ' seconds'),
+       18 + (abs(random()) % 1200) / 100.0, abs(random()) % 100, abs(random()) % 100, abs(random()) % 2,
+       abs(random()) % 101, abs(random()) % 100, abs(random()) % 100, abs(random()) % 2, abs(random()) % 101,
+       abs(random()) % 2, abs(random()) % 2, 1 + n % :plants, 1 + n % 4, 1 + n % 4
+FROM g
+""")
+
+def seed_fleet(connection, plants: int, plants_per_device: int):
+    devices = (plants + plants_per_device - 1) // plants_per_device
+    connection.execute(insert(IotDevState), [{"id": i, "pump_state": False} for i in range(1, devices + 1)])
+    connection.execute(insert(IotDevEvent), [{"id": i, "pump_event": False} for i in range(1, devices + 1)])
+    connection.execute(insert(IotDev), [
+        {"id": i, "online_status": True, "dev_state_id": i, "dev_event_id": i} for i in range(1, devices + 1)
+    ])
+    connection.execute(insert(PlantState), [
+        {"id": i, "luminosity_state": 50.0, "humidity_state": 50.0, "valve_state": False,
+         "led_intensity_state": 0, "mode": 1}
+        for i in range(1, plants + 1)
+    ])
+    connection.execute(insert(PlantEvent), [
+        {"id": i, "luminosity_event": 50.0, "humidity_event": 50.0, "valve_event": False,
+         "led_intensity_event": 0, "mode": 1}
+        for i in range(1, plants + 1)
+    ])
+    connection.execute(insert(Plant), [
+        {"id": i, "error": False, "plant_state_id": i, "plant_event_id": i,
+         "iot_dev_id": (i - 1) // plants_per_device + 1}
+        for i in range(1, plants + 1)
+    ])
+    if connection.dialect.name == "postgresql":
+        # Explicit ids do not advance the serial sequences
+        for model in (IotDevState, IotDevEvent, IotDev, PlantState, PlantEvent, Plant):
+            table = model.__tablename__
+            connection.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), (SELECT max(id) FROM \"{table}\"))"
+            ))
+    return devices
+
+def seed_logs(engine, plants: int, rows: int, days: float):
+    sql = POSTGRES_LOG_SQL if engine.dialect.name == "postgresql" else SQLITE_LOG_SQL
+    spacing = days * 86400 / max(rows, 1)
+    for first in range(1, rows + 1, LOG_CHUNK_ROWS):
+        last = min(first + LOG_CHUNK_ROWS - 1, rows)
+        with engine.begin() as connection:
+            connection.execute(sql, {"first": first, "last": last, "rows": rows, "spacing": spacing, "plants": plants})
+        print(f"  {last}/{rows} Log rows", flush=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seed a scratch database for the benchmarks.")
+    parser.add_argument("--plants", type=int, default=1000)
+    parser.add_argument("--plants-per-device", type=int, default=1)
+    parser.add_argument("--log-rows", type=int, default=1_000_000)
+    parser.add_argument("--days", type=float, default=365)
+    args = parser.parse_args(argv)
+
+    engine = init_engines()
+    Base.metadata.create_all(engine)
+    with engine.connect() as connection:
+        if connection.execute(select(func.count()).select_from(Plant)).scalar():
+            sys.exit("Plant is not empty; seed_fixtures only seeds an empty scratch database")
+
+    start = perf_counter()
+    with engine.begin() as connection:
+        devices = seed_fleet(connection, args.plants, args.plants_per_device)
+    print(f"Seeded {args.plants} plants and {devices} devices in {perf_counter() - start:.1f} s")
+
+    start = perf_counter()
+    seed_logs(engine, args.plants, args.log_rows, args.days)
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+    print(f"Seeded {args.log_rows} Log rows in {perf_counter() - start:.1f} s")
+
+if __name__ == "__main__":
+    main()
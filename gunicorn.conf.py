@@ -0,0 +1,36 @@
+# Production launcher: gunicorn main:app -c gunicorn.conf.py
+import multiprocessing
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# One uvicorn worker per CPU unless web_concurrency says otherwise. Each worker
+# has its own connection pool: keep workers * (db_pool_size + db_max_overflow)
+# below the database's connection limit.
+workers = int(os.getenv("web_concurrency") or multiprocessing.cpu_count())
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"0.0.0.0:{os.getenv('app_port', 8000)}"
+
+# The app is imported in each worker, so engines, pools and background threads
+# are created after the fork by the FastAPI lifespan
+preload_app = False
+
+timeout = int(os.getenv("web_timeout", 60))
+graceful_timeout = int(os.getenv("web_graceful_timeout", 30))
+keepalive = 5
+# Proxies whose X-Forwarded-For/-Proto headers are trusted. Behind a platform
+# router (the Procfile deployment) every request comes from the router, so
+# set forwarded_allow_ips=* there; per-client rate limits and logs then see
+# the real client address. Leave it unset when the workers are reachable directly.
+forwarded_allow_ips = os.getenv("forwarded_allow_ips") or "127.0.0.1"
+accesslog = "-"
+errorlog = "-"
+
+
+def child_exit(server, worker):
+    # Drop a dead worker's live gauges from the shared /metrics files
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
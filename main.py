@@ -1,17 +1,112 @@
+from time import perf_counter
+IMPORT_STARTED = perf_counter()  # Measures cold start from the first import
+
+import asyncio
+import logging
 import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.exception_handlers import request_validation_exception_handler
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routers import events
-from utils.db import engine  # Import the engine from db.py
+from routers import events, admin, state, logs, stream, health, metrics
+from utils.db import init_engines, dispose_engines, ping_database, warm_up_pool, SessionLocal
+from services.log_buffer import log_buffer, LOG_WRITE_BEHIND
+from services.topology_cache import topology_cache, TOPOLOGY_CACHE, TOPOLOGY_LISTEN
+from services.state_cache import state_cache, STATE_CACHE
+from services.rollup_service import rollup_refresher, LOG_ROLLUPS
+from services.log_partitions import partition_maintainer, LOG_PARTITIONING
+from services.event_bus import event_bus, EVENT_STREAM_NOTIFY
+from services.mqtt_ingest import mqtt_ingestor, MQTT_INGEST
+from services.event_journal import event_journal, EVENT_JOURNAL
+from services.log_service import log_debouncer
+from services.log_debounce import LOG_DEBOUNCE_MS
+from services.idempotency import idempotency_store, idempotency_middleware
+from services.rate_limit import rate_limiter, rate_limit_middleware
+from utils.metrics import metrics_middleware
+from utils.log_config import setup_logging, request_context_middleware
+from utils.request_validation import validation_error_detail
+
+# JSON log lines, written from a background thread
+setup_logging()
+logger = logging.getLogger(__name__)
 
-# Initialize the database
-try:
-    with engine.connect() as connection:
-        print("Database connection successful!")
-except Exception as e:
-    print(f"Failed to connect to the database: {e}")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Each worker creates its own engine; an unreachable database does not stop startup,
+    # /health/ready reports it instead
+    started = perf_counter()
+    app.state.ready = False
+    init_engines()
+    try:
+        ping_database()
+        logger.info("Database connection successful!")
+        logger.info("Warmed up %s pooled connections", warm_up_pool())
+    except Exception as e:
+        logger.error("Failed to connect to the database: %s", e)
+    # Events published from handler threads are delivered on this loop
+    event_bus.bind(asyncio.get_running_loop())
+    if EVENT_STREAM_NOTIFY:
+        event_bus.start_listener()
+    if LOG_WRITE_BEHIND:
+        log_buffer.start()
+    if LOG_DEBOUNCE_MS:
+        log_debouncer.start()
+    if TOPOLOGY_CACHE:
+        try:
+            with SessionLocal() as session:
+                logger.info("Loaded topology for %s plants", topology_cache.load_all(session))
+        except Exception as e:
+            logger.warning("Failed to preload the topology cache: %s", e)
+        if TOPOLOGY_LISTEN:
+            topology_cache.start_listener()
+    if STATE_CACHE:
+        try:
+            state_cache.reload()
+        except Exception as e:
+            logger.warning("Failed to load the state cache: %s", e)
+        if EVENT_STREAM_NOTIFY:
+            # Events committed by other workers arrive through NOTIFY
+            event_bus.add_callback(state_cache.on_event)
+        state_cache.start()
+    if LOG_ROLLUPS:
+        rollup_refresher.start()
+    if LOG_PARTITIONING:
+        partition_maintainer.start()
+    if EVENT_JOURNAL:
+        # Replays events journaled while the database was unreachable
+        event_journal.start()
+    if MQTT_INGEST:
+        try:
+            mqtt_ingestor.start()
+        except ImportError:
+            logger.error("MQTT ingestion requires the paho-mqtt package")
+    app.state.import_seconds = IMPORT_SECONDS
+    app.state.startup_seconds = perf_counter() - started
+    app.state.ready = True
+    logger.info("Worker %s ready in %.2f s (imports %.2f s, startup %.2f s)", os.getpid(),
+                IMPORT_SECONDS + app.state.startup_seconds, IMPORT_SECONDS, app.state.startup_seconds)
+    yield
+    app.state.ready = False
+    # Apply queued MQTT messages before the caches and log buffer stop
+    mqtt_ingestor.stop()
+    event_journal.stop()
+    partition_maintainer.stop()
+    rollup_refresher.stop()
+    state_cache.stop()
+    topology_cache.stop_listener()
+    event_bus.stop_listener()
+    # Write pending debounced log rows, then drain the buffer they may go to
+    log_debouncer.stop()
+    # Drain buffered log rows before the process exits
+    if LOG_WRITE_BEHIND:
+        log_buffer.stop()
+    rate_limiter.close()
+    idempotency_store.close()
+    await dispose_engines()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -21,12 +116,36 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all headers
 )
 
+@app.exception_handler(RequestValidationError)
+async def event_validation_exception_handler(request: Request, exc: RequestValidationError):
+    # Event endpoints keep answering invalid values with a 400 and a one-line detail
+    if request.url.path.startswith("/events"):
+        return JSONResponse(status_code=400, content={"detail": validation_error_detail(exc.errors())})
+    return await request_validation_exception_handler(request, exc)
+
+# Replay responses to retried writes that carry an Idempotency-Key
+app.middleware("http")(idempotency_middleware)
+# Shed event writes over the per-device, per-client and concurrency limits with a 429
+app.middleware("http")(rate_limit_middleware)
+# Request latency and SQL statements per route
+app.middleware("http")(metrics_middleware)
+# Request id for log lines (registered last, so it wraps the others)
+app.middleware("http")(request_context_middleware)
+
 @app.get("/")
 def read_root():
     return {"message": "Universidad EIA"}
 
-# Include the events router
+# Include the events router (async services when db_async=true)
 app.include_router(events.router)
+app.include_router(state.router)
+app.include_router(logs.router)
+app.include_router(stream.router)
+app.include_router(admin.router)
+app.include_router(health.router)
+app.include_router(metrics.router)
+
+IMPORT_SECONDS = perf_counter() - IMPORT_STARTED
 
 if __name__ == "__main__":
     import uvicorn
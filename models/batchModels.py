@@ -0,0 +1,16 @@
+from typing import List, Literal, Optional
+from pydantic import BaseModel
+
+class BatchEventItem(BaseModel):
+    type: Literal["plant", "pump"]  # Which event table the update targets
+    plant_id: Optional[int] = None
+    mode: Optional[int] = None
+    luminosity_event: Optional[float] = None
+    humidity_event: Optional[float] = None
+    valve_event: Optional[bool] = None
+    led_intensity_event: Optional[int] = None
+    iot_dev_id: Optional[int] = None
+    pump_event: Optional[bool] = None
+
+class EventBatch(BaseModel):
+    items: List[BatchEventItem]
@@ -0,0 +1,17 @@
+from typing import Annotated, List, Optional
+from pydantic import BaseModel, Field, PositiveInt
+from models.plantModels import Percentage
+
+# Largest plant list accepted in one fleet control request
+MAX_FLEET_PLANTS = 10000
+
+class FleetControl(BaseModel):
+    # Selector: either an explicit plant list or every plant on one device
+    plant_ids: Optional[Annotated[List[PositiveInt], Field(min_length=1, max_length=MAX_FLEET_PLANTS)]] = None
+    iot_dev_id: Optional[PositiveInt] = None
+    # Event values applied to every selected plant
+    mode: Optional[Annotated[int, Field(ge=1, le=4)]] = None
+    luminosity_event: Optional[Percentage] = None
+    humidity_event: Optional[Percentage] = None
+    valve_event: Optional[bool] = None
+    led_intensity_event: Optional[Annotated[int, Field(ge=0, le=100)]] = None
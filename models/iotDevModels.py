@@ -1,5 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, PositiveInt
 
 class IoTDevPump(BaseModel):
-    iot_dev_id: int = 1
+    iot_dev_id: PositiveInt = 1
     pump_event: bool = False
\ No newline at end of file
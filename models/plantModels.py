@@ -1,13 +1,16 @@
-from typing import Optional
-from pydantic import BaseModel
+from typing import Annotated, Optional
+from pydantic import BaseModel, Field, PositiveInt
+
+# Ranges are enforced by pydantic when the request body is parsed
+Percentage = Annotated[float, Field(ge=0, le=100)]
 
 class PlantEventUpdate(BaseModel):
-    plant_id: int = None
-    mode: int = None  # The mode of the plant
-    luminosity_event: Optional[float] = None
-    humidity_event: Optional[float] = None
+    plant_id: Optional[PositiveInt] = None
+    mode: Optional[Annotated[int, Field(ge=1, le=4)]] = None  # The mode of the plant
+    luminosity_event: Optional[Percentage] = None
+    humidity_event: Optional[Percentage] = None
     valve_event: Optional[bool] = None
-    led_intensity_event: Optional[int] = None
+    led_intensity_event: Optional[Annotated[int, Field(ge=0, le=100)]] = None
 
 class InsertLogRequest(BaseModel):
     plant_id: int  # The ID of the plant for which the log entry is being created
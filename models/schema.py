@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, Float, Boolean, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, Float, Boolean, DateTime, ForeignKey, Index, String, PrimaryKeyConstraint
+from sqlalchemy.orm import relationship, declared_attr
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime, timezone
 
@@ -7,6 +7,12 @@ Base = declarative_base()
 
 class Log(Base):
     __tablename__ = "Log"
+    __table_args__ = (
+        # Latest log of a plant (last temperature lookup)
+        Index("ix_log_plant_id_id", "plant_id", "id"),
+        # Time-range queries per plant (/logs)
+        Index("ix_log_plant_id_entry_creation_time", "plant_id", "entry_creation_time"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     entry_creation_time = Column(DateTime, nullable=False)
@@ -114,4 +120,52 @@ class IotDevEvent(Base):
     last_updated = Column(DateTime, default=datetime.now(timezone.utc))
     pump_event = Column(Boolean, nullable=False)
 
-    iot_devs = relationship("IotDev", back_populates="dev_event")
\ No newline at end of file
+    iot_devs = relationship("IotDev", back_populates="dev_event")
+
+
+class LogRollupColumns:
+    """Per-plant aggregates of Log rows over one time bucket.
+
+    Sums (not averages) are stored so buckets can be merged incrementally
+    and re-aggregated into coarser buckets.
+    """
+    @declared_attr
+    def __table_args__(cls):
+        return (PrimaryKeyConstraint("plant_id", "bucket"),)
+
+    @declared_attr
+    def plant_id(cls):
+        return Column(Integer, ForeignKey("Plant.id"), nullable=False)
+
+    bucket = Column(DateTime, nullable=False)
+    count = Column(Integer, nullable=False)
+
+    temperature_sum = Column(Float, nullable=False)
+    temperature_min = Column(Float, nullable=False)
+    temperature_max = Column(Float, nullable=False)
+    luminosity_state_sum = Column(Float, nullable=False)
+    luminosity_state_min = Column(Float, nullable=False)
+    luminosity_state_max = Column(Float, nullable=False)
+    humidity_state_sum = Column(Float, nullable=False)
+    humidity_state_min = Column(Float, nullable=False)
+    humidity_state_max = Column(Float, nullable=False)
+
+    # Number of rows in the bucket with the pump on / valve open
+    pump_on_count = Column(Integer, nullable=False)
+    valve_open_count = Column(Integer, nullable=False)
+
+
+class LogRollupMinute(LogRollupColumns, Base):
+    __tablename__ = "LogRollupMinute"
+
+
+class LogRollupHour(LogRollupColumns, Base):
+    __tablename__ = "LogRollupHour"
+
+
+class RollupWatermark(Base):
+    __tablename__ = "RollupWatermark"
+
+    name = Column(String, primary_key=True)
+    last_log_id = Column(Integer, nullable=False, default=0)
+    last_updated = Column(DateTime, default=datetime.now(timezone.utc))
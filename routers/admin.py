@@ -0,0 +1,68 @@
+from typing import Optional
+from fastapi import APIRouter
+from utils.db import pool_stats
+from services.log_buffer import log_buffer
+from services.topology_cache import topology_cache
+from services.state_cache import state_cache
+from services.event_bus import event_bus
+from services.mqtt_ingest import mqtt_ingestor
+from services.event_journal import event_journal
+from services.event_service import write_stats
+from services.log_service import log_debouncer
+from services.idempotency import idempotency_store
+from services.rate_limit import rate_limiter
+from utils.log_config import logging_stats
+
+router = APIRouter(prefix="/admin", tags=["Admin"])
+
+@router.get("/pool")
+def get_pool_stats():
+    return pool_stats()
+
+@router.get("/log-buffer")
+def get_log_buffer_stats():
+    return log_buffer.stats()
+
+@router.get("/topology")
+def get_topology_cache_stats():
+    return topology_cache.stats()
+
+@router.post("/topology/invalidate")
+def invalidate_topology_cache(plant_id: Optional[int] = None):
+    topology_cache.invalidate(plant_id)
+    return {"message": "Topology cache invalidated", "plant_id": plant_id}
+
+@router.get("/state-cache")
+def get_state_cache_stats():
+    return state_cache.stats()
+
+@router.get("/mqtt")
+def get_mqtt_stats():
+    return mqtt_ingestor.stats()
+
+@router.get("/event-bus")
+async def get_event_bus_stats():
+    # Runs on the event loop, where subscriptions are added and removed
+    return event_bus.stats()
+
+@router.get("/writes")
+async def get_write_stats():
+    # Runs on the event loop, which owns the idempotency store
+    return {
+        "events": write_stats.stats(),
+        "idempotency": idempotency_store.stats(),
+        "log_debounce": log_debouncer.stats(),
+    }
+
+@router.get("/rate-limit")
+async def get_rate_limit_stats():
+    # Runs on the event loop, which owns the limiter
+    return rate_limiter.stats()
+
+@router.get("/journal")
+def get_event_journal_stats():
+    return event_journal.stats()
+
+@router.get("/logging")
+def get_logging_stats():
+    return logging_stats()
@@ -1,94 +1,86 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from utils.db import get_session
-from services.event_service import update_plant_event, update_device_event
-from services.log_service import insert_new_log_plant, insert_new_log_iotDev
+# Event write endpoints. The same handlers serve the sync services, or the
+# asyncpg-backed async ones when db_async=true.
+from contextlib import contextmanager
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
+from utils.db import get_session, get_async_session, DB_ASYNC
+from services.event_journal import write_plant_event, write_device_event, write_plant_event_async, write_device_event_async
 from models.plantModels import PlantEventUpdate
 from models.iotDevModels import IoTDevPump
-from fastapi import HTTPException, status
-from utils.request_validation import check_plant_event_exists, check_iot_dev_event_exists
-from utils.request_validation import validate_not_none, validate_positive_integer, validate_float, validate_range, validate_boolean
-router = APIRouter(prefix="/events", tags=["Events"])
+from models.batchModels import EventBatch
+from services.batch_service import apply_event_batch, apply_event_batch_async
+from models.fleetModels import FleetControl
+from services.fleet_service import apply_fleet_control, apply_fleet_control_async
+from utils.request_validation import validate_not_none
 
-@router.put("/plant/luminosity")
-def update_luminosity_event(data: PlantEventUpdate, session: Session = Depends(get_session)):
-    try:
-        validate_not_none(data.luminosity_event, "Luminosity event cannot be None.")
-        validate_not_none(data.plant_id, "Plant ID cannot be None.")
-        validate_positive_integer(data.plant_id, "Plant ID must be a positive integer.")    
-        validate_float(data.luminosity_event, "Luminosity event must be a float.")
-        validate_range(data.luminosity_event, 0, 100, "Luminosity event must be between 0 and 100.")
-        check_plant_event_exists(session, data.plant_id)
+# Plant event endpoints: path -> (PlantEvent column, name in validation errors, name in responses)
+PLANT_EVENT_ENDPOINTS = {
+    "/plant/luminosity": ("luminosity_event", "Luminosity event", "Luminosity event"),
+    "/plant/humidity": ("humidity_event", "Humidity event", "Humidity event"),
+    "/plant/valve": ("valve_event", "Valve event", "Valve event"),
+    "/plant/led": ("led_intensity_event", "LED event", "LED intensity event"),
+    "/plant/mode": ("mode", "Mode event", "Mode event"),
+}
 
-        update_plant_event(session, "luminosity_event", data.luminosity_event, data.plant_id)
-        insert_new_log_plant(session, data.plant_id)
-        return {"message": "Luminosity event updated", "plant_id": data.plant_id, "luminosity_event": data.luminosity_event}
-    except HTTPException as e:
-        raise e
+@contextmanager
+def server_errors():
+    """Turn unexpected failures into a 500 with the error; HTTPExceptions pass through."""
+    try:
+        yield
+    except HTTPException:
+        raise
     except Exception as e:
-         raise HTTPException(
+        raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Ocurrió un error en el servidor: " + str(e)
         )
-         
-         
-@router.put("/plant/humidity")
-def update_humidity_event(data: PlantEventUpdate, session: Session = Depends(get_session)):
-    validate_not_none(data.humidity_event, "Humidity event cannot be None.")
-    validate_not_none(data.plant_id, "Plant ID cannot be None.")
-    validate_positive_integer(data.plant_id, "Plant ID must be a positive integer.")
-    validate_float(data.humidity_event, "Humidity event must be a float.")
-    validate_range(data.humidity_event, 0, 100, "Humidity event must be between 0 and 100.")
-    check_plant_event_exists(session, data.plant_id)
-    
-    update_plant_event(session, "humidity_event", data.humidity_event, data.plant_id)
-    insert_new_log_plant(session, data.plant_id)
-    return {"message": "Humidity event updated", "plant_id": data.plant_id, "humidity_event": data.humidity_event}
 
-@router.put("/plant/valve")
-def update_valve_event(data: PlantEventUpdate, session: Session = Depends(get_session)):
-    validate_not_none(data.valve_event, "Valve event cannot be None.")
-    validate_not_none(data.plant_id, "Plant ID cannot be None.")
-    validate_positive_integer(data.plant_id, "Plant ID must be a positive integer.")
-    validate_boolean(data.valve_event, "Valve event must be a boolean.")
-    check_plant_event_exists(session, data.plant_id)
-    
-    update_plant_event(session, "valve_event", data.valve_event, data.plant_id)
-    insert_new_log_plant(session, data.plant_id)
-    return {"message": "Valve event updated", "plant_id": data.plant_id, "valve_event": data.valve_event}
+def build_router(asynchronous: bool = DB_ASYNC) -> APIRouter:
+    """The /events routes, bound to the async services or to the sync ones."""
+    router = APIRouter(prefix="/events", tags=["Events"])
+    get_db = get_async_session if asynchronous else get_session
+
+    async def call(sync_service, async_service, *args):
+        if asynchronous:
+            return await async_service(*args)
+        # Sync services run in the threadpool, as FastAPI runs sync handlers
+        return await run_in_threadpool(sync_service, *args)
+
+    def add_plant_event_route(path: str, column: str, label: str, message: str):
+        async def handler(data: PlantEventUpdate, response: Response, session=Depends(get_db)):
+            with server_errors():
+                value = getattr(data, column)
+                validate_not_none(value, f"{label} cannot be None.")
+                validate_not_none(data.plant_id, "Plant ID cannot be None.")
+                if not await call(write_plant_event, write_plant_event_async, session, column, value, data.plant_id):
+                    response.status_code = status.HTTP_202_ACCEPTED
+                return {"message": f"{message} updated", "plant_id": data.plant_id, column: value}
+
+        handler.__name__ = f"update_{path.rsplit('/', 1)[1]}_event"
+        router.put(path)(handler)
+
+    for path, (column, label, message) in PLANT_EVENT_ENDPOINTS.items():
+        add_plant_event_route(path, column, label, message)
 
-@router.put("/plant/led")
-def update_led_event(data: PlantEventUpdate, session: Session = Depends(get_session)):
-    validate_not_none(data.led_intensity_event, "LED event cannot be None.")
-    validate_not_none(data.plant_id, "Plant ID cannot be None.")
-    validate_positive_integer(data.plant_id, "Plant ID must be a positive integer.")
-    validate_range(data.led_intensity_event, 0, 100, "LED event must be between 0 and 100.")
-    check_plant_event_exists(session, data.plant_id)
+    @router.put("/device/pump")
+    async def update_pump_event(data: IoTDevPump, response: Response, session=Depends(get_db)):
+        with server_errors():
+            if not await call(write_device_event, write_device_event_async, session, data.pump_event, data.iot_dev_id):
+                response.status_code = status.HTTP_202_ACCEPTED
+            return {"message": "Pump event updated", "iot_dev_id": data.iot_dev_id, "pump_event": data.pump_event}
 
-    update_plant_event(session, "led_intensity_event", data.led_intensity_event, data.plant_id)
-    insert_new_log_plant(session, data.plant_id)
-    return {"message": "LED intensity event updated", "plant_id": data.plant_id, "led_intensity_event": data.led_intensity_event}
+    @router.post("/batch")
+    async def apply_events_batch(data: EventBatch, session=Depends(get_db)):
+        with server_errors():
+            results = await call(apply_event_batch, apply_event_batch_async, session, data.items)
+            return {"message": "Event batch processed", "results": results}
 
-@router.put("/plant/mode")
-def update_mode_event(data: PlantEventUpdate, session: Session = Depends(get_session)):
-    validate_not_none(data.mode, "Mode event cannot be None.")
-    validate_not_none(data.plant_id, "Plant ID cannot be None.")
-    validate_positive_integer(data.plant_id, "Plant ID must be a positive integer.")
-    validate_range(data.mode, 1, 4, "Mode event must be an integer between 1 and 4.")
-    check_plant_event_exists(session, data.plant_id)
+    @router.post("/fleet")
+    async def apply_fleet_control_event(data: FleetControl, session=Depends(get_db)):
+        with server_errors():
+            results = await call(apply_fleet_control, apply_fleet_control_async, session, data)
+            return {"message": "Fleet control applied", "results": results}
 
-    update_plant_event(session, "mode", data.mode, data.plant_id)
-    insert_new_log_plant(session, data.plant_id)
-    return {"message": "Mode event updated", "plant_id": data.plant_id, "mode": data.mode}
+    return router
 
-@router.put("/device/pump")
-def update_pump_event(data: IoTDevPump, session: Session = Depends(get_session)):
-    validate_not_none(data.pump_event, "Pump event cannot be None.")
-    validate_not_none(data.iot_dev_id, "IoT Device ID cannot be None.")
-    validate_positive_integer(data.iot_dev_id, "IoT Device ID must be a positive integer.")
-    validate_boolean(data.pump_event, "Pump event must be a boolean.")
-    check_iot_dev_event_exists(session, data.iot_dev_id)
-    
-    update_device_event(session, data.pump_event, data.iot_dev_id)
-    insert_new_log_iotDev(session, data.iot_dev_id)
-    return {"message": "Pump event updated", "iot_dev_id": data.iot_dev_id, "pump_event": data.pump_event}
+router = build_router()
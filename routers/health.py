@@ -0,0 +1,27 @@
+import os
+from fastapi import APIRouter, Request, Response, status
+from utils.db import ping_database
+router = APIRouter(prefix="/health", tags=["Health"])
+
+@router.get("/live")
+def liveness():
+    # The process is serving requests; the database is not checked
+    return {"status": "alive", "pid": os.getpid()}
+
+@router.get("/ready")
+def readiness(request: Request, response: Response):
+    state = request.app.state
+    if not getattr(state, "ready", False):
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "starting", "pid": os.getpid()}
+    try:
+        ping_database()
+    except Exception as e:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "database unavailable", "detail": str(e), "pid": os.getpid()}
+    return {
+        "status": "ready",
+        "pid": os.getpid(),
+        "import_seconds": state.import_seconds,
+        "startup_seconds": state.startup_seconds,
+    }
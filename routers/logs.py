@@ -0,0 +1,37 @@
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from utils.db import get_session
+from services.log_query_service import get_log_series
+from services.log_export import EXPORT_FORMATS, validate_export_format, export_chunks, iter_log_batches
+router = APIRouter(prefix="/logs", tags=["Logs"])
+
+@router.get("")
+def read_log_series(
+    plant_id: int,
+    start: datetime,
+    end: Optional[datetime] = None,
+    bucket: str = "hour",
+    limit: int = Query(500, ge=1, le=5000),
+    cursor: Optional[datetime] = None,
+    session: Session = Depends(get_session),
+):
+    return get_log_series(session, plant_id, start, end or datetime.now(timezone.utc), bucket, limit, cursor)
+
+@router.get("/export")
+def export_logs(
+    format: str = "csv",
+    plant_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    validate_export_format(format)
+    # The generator opens its own session so it lives as long as the response stream
+    chunks = export_chunks(format, iter_log_batches(plant_id, start, end))
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="logs.{format}"'},
+    )
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from models.schema import Plant
+from utils.db import get_session
+from services.log_service import log_snapshot_select
+from services.state_cache import state_cache, snapshot_from_log_row, STATE_CACHE
+from services.topology_cache import topology_cache
+router = APIRouter(prefix="/state", tags=["State"])
+
+@router.get("/{plant_id}")
+def get_plant_state(plant_id: int, session: Session = Depends(get_session)):
+    # Served from memory when the state cache is loaded, otherwise one SELECT
+    if STATE_CACHE and state_cache.loaded:
+        snapshot = state_cache.plant_snapshot(topology_cache.get(session, plant_id), plant_id)
+        if snapshot is not None:
+            return snapshot
+
+    row = session.execute(log_snapshot_select(plant_id).add_columns(Plant.iot_dev_id)).mappings().first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Plant with ID {plant_id} does not exist."
+        )
+    return snapshot_from_log_row(row, row["iot_dev_id"])
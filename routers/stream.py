@@ -0,0 +1,62 @@
+import asyncio
+import json
+from typing import Optional
+from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.websockets import WebSocketState
+from services.event_bus import event_bus
+router = APIRouter(tags=["Stream"])
+
+# Seconds between SSE keep-alive comments, so proxies keep idle streams open
+SSE_KEEPALIVE_SECONDS = 15
+
+async def _wait_for_disconnect(websocket: WebSocket):
+    """Read the socket until the client goes away; frames the client sends (pings, text) are ignored."""
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+
+@router.websocket("/ws/events")
+async def stream_events_ws(websocket: WebSocket, plant_id: Optional[int] = None, iot_dev_id: Optional[int] = None):
+    await websocket.accept()
+    subscription = event_bus.subscribe(plant_id, iot_dev_id)
+    # Reading from the socket is the only way to notice a client that went away while idle
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(websocket))
+    try:
+        while True:
+            next_event = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                next_event.cancel()
+                break
+            await websocket.send_json(next_event.result())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        disconnected.cancel()
+        subscription.close()
+        if websocket.client_state == WebSocketState.CONNECTED and websocket.application_state == WebSocketState.CONNECTED:
+            await websocket.close()
+
+@router.get("/events/stream")
+async def stream_events_sse(request: Request, plant_id: Optional[int] = None, iot_dev_id: Optional[int] = None):
+    subscription = event_bus.subscribe(plant_id, iot_dev_id)
+
+    async def event_source():
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
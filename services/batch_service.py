@@ -0,0 +1,223 @@
+import logging
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from models.schema import PlantEvent, IotDevEvent
+from services.event_service import plant_event_update_stmt, device_event_update_stmt, write_stats, EVENT_SKIP_UNCHANGED
+from services.log_service import log_snapshots_insert, log_snapshots_found
+from services.state_cache import state_cache
+from services.event_bus import event_bus, plant_event_message, pump_event_message
+from utils.request_validation import validate_plant_event_fields, validate_pump_event_fields
+from utils.metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+# Pump logs are written against this plant, as insert_new_log_iotDev does
+PUMP_LOG_PLANT_ID = 1
+
+class EventBatchPlan:
+    """Validated, merged view of an event batch.
+
+    Updates for the same plant (or device) are merged in request order so
+    each one becomes a single UPDATE, and every item keeps a result entry.
+    """
+
+    def __init__(self, items):
+        self.results = []
+        self.plant_updates = {}  # plant_id -> merged PlantEvent values
+        self.pump_updates = {}   # iot_dev_id -> pump_event
+        self._plant_items = {}   # plant_id -> indexes of the items touching it
+        self._pump_items = {}
+        self._unmatched = {}     # "plant"/"pump" -> ids whose UPDATE returned no row
+        self.unchanged = 0       # updates skipped because the values were already stored
+
+        for index, item in enumerate(items):
+            try:
+                if item.type == "plant":
+                    values = validate_plant_event_fields(item)
+                    self.plant_updates.setdefault(item.plant_id, {}).update(values)
+                    self._plant_items.setdefault(item.plant_id, []).append(index)
+                else:
+                    values = validate_pump_event_fields(item)
+                    self.pump_updates[item.iot_dev_id] = values["pump_event"]
+                    self._pump_items.setdefault(item.iot_dev_id, []).append(index)
+                self.results.append({"index": index, "status_code": status.HTTP_200_OK, "detail": "updated"})
+            except HTTPException as e:
+                self.results.append({"index": index, "status_code": e.status_code, "detail": e.detail})
+
+    def update_statements(self):
+        """(kind, id, UPDATE) for every merged plant and device update."""
+        for plant_id, values in list(self.plant_updates.items()):
+            yield "plant", plant_id, plant_event_update_stmt(values, plant_id)
+        for iot_dev_id, pump_event in list(self.pump_updates.items()):
+            yield "pump", iot_dev_id, device_event_update_stmt(pump_event, iot_dev_id)
+
+    def record_update(self, kind: str, event_id: int, matched: bool):
+        """Note whether an UPDATE ... RETURNING returned its row."""
+        if not matched:
+            self._unmatched.setdefault(kind, []).append(event_id)
+
+    def unmatched_queries(self):
+        """SELECTs of the unmatched ids that exist, i.e. that already held their values.
+
+        Only needed when unchanged values are skipped; otherwise an UPDATE
+        that returned no row means the event does not exist.
+        """
+        if not EVENT_SKIP_UNCHANGED:
+            return []
+        models = {"plant": PlantEvent, "pump": IotDevEvent}
+        return [(kind, select(models[kind].id).where(models[kind].id.in_(ids))) for kind, ids in self._unmatched.items()]
+
+    def resolve_unmatched(self, existing: dict):
+        """Mark unmatched updates unchanged (id in `existing[kind]`) or 404, and drop them."""
+        for kind, event_ids in self._unmatched.items():
+            updates, items, label = (
+                (self.plant_updates, self._plant_items, "PlantEvent") if kind == "plant"
+                else (self.pump_updates, self._pump_items, "IotDevEvent")
+            )
+            for event_id in event_ids:
+                del updates[event_id]
+                if event_id in existing.get(kind, ()):
+                    self.unchanged += 1
+                    result = {"detail": "unchanged"}
+                else:
+                    result = {"status_code": status.HTTP_404_NOT_FOUND, "detail": f"{label} with ID {event_id} does not exist."}
+                for index in items.pop(event_id):
+                    self.results[index].update(result)
+        self._unmatched = {}
+
+    def record_stats(self):
+        """Count the committed updates and the skipped ones."""
+        for _ in range(len(self.plant_updates) + len(self.pump_updates)):
+            write_stats.record(True)
+        for _ in range(self.unchanged):
+            write_stats.record(False)
+
+    def write_through(self):
+        """Push the committed event values into the state cache."""
+        for plant_id, values in self.plant_updates.items():
+            state_cache.update_plant_event(plant_id, values)
+        for iot_dev_id, pump_event in self.pump_updates.items():
+            state_cache.update_device_event(iot_dev_id, pump_event)
+
+    def messages(self) -> list:
+        """One push event per updated plant and device."""
+        events = [plant_event_message(plant_id, values) for plant_id, values in self.plant_updates.items()]
+        events += [pump_event_message(iot_dev_id, pump_event) for iot_dev_id, pump_event in self.pump_updates.items()]
+        return events
+
+    def _snapshots(self) -> list:
+        """(kind, id, (plant_id, iot_dev_id)) of the log row each update writes."""
+        snapshots = [("plant", plant_id, (plant_id, None)) for plant_id in self.plant_updates]
+        snapshots += [("pump", iot_dev_id, (PUMP_LOG_PLANT_ID, iot_dev_id)) for iot_dev_id in self.pump_updates]
+        return snapshots
+
+    def log_statement(self):
+        """One multi-row INSERT ... SELECT covering every updated plant and device."""
+        snapshots = [snapshot for _, _, snapshot in self._snapshots()]
+        return log_snapshots_insert(snapshots) if snapshots else None
+
+    def logged_all(self, inserted: int) -> bool:
+        """Whether the log INSERT wrote a row for every update."""
+        return inserted == len(self.plant_updates) + len(self.pump_updates)
+
+    def found_query(self):
+        """SELECT of the indexes (in log_statement order) of the snapshots that exist."""
+        return log_snapshots_found([snapshot for _, _, snapshot in self._snapshots()])
+
+    def drop_unlogged(self, found: set):
+        """Report the updates whose snapshot is missing (e.g. a PlantEvent without a Plant) and drop them.
+
+        Raises when nothing is missing, so a retry always has fewer updates.
+        """
+        missing = [(kind, event_id, plant_id) for index, (kind, event_id, (plant_id, _)) in enumerate(self._snapshots())
+                   if index not in found]
+        if not missing:
+            raise ValueError("Log rows missing for an event batch whose snapshots all exist")
+        for kind, event_id, plant_id in missing:
+            updates, items = (self.plant_updates, self._plant_items) if kind == "plant" else (self.pump_updates, self._pump_items)
+            del updates[event_id]
+            for index in items.pop(event_id):
+                self.results[index].update({
+                    "status_code": status.HTTP_404_NOT_FOUND,
+                    "detail": f"No plant/device snapshot found for plant ID {plant_id}",
+                })
+
+def apply_event_batch(session: Session, items) -> list:
+    """Validate, merge and apply a batch of plant/pump updates in one transaction."""
+    plan = EventBatchPlan(items)
+    try:
+        while True:
+            with stage_timer("batch_update"):
+                for kind, event_id, stmt in plan.update_statements():
+                    plan.record_update(kind, event_id, session.execute(stmt).first() is not None)
+            plan.resolve_unmatched({kind: set(session.execute(query).scalars()) for kind, query in plan.unmatched_queries()})
+            log_stmt = plan.log_statement()
+            if log_stmt is None:
+                break
+            with stage_timer("batch_log"):
+                inserted = session.execute(log_stmt).rowcount
+            if plan.logged_all(inserted):
+                break
+            # An update without a plant/device snapshot would commit with no log row:
+            # report it, undo the transaction and apply the rest again
+            found = set(session.execute(plan.found_query()).scalars())
+            session.rollback()
+            plan.drop_unlogged(found)
+        events = plan.messages()
+        for event in events:
+            notify = event_bus.notify_statement(event)
+            if notify is not None:
+                session.execute(notify)
+        with stage_timer("batch_commit"):
+            session.commit()
+        plan.record_stats()
+        plan.write_through()
+        for event in events:
+            event_bus.publish(event)
+        logger.info("Applied event batch: %s plants, %s devices", len(plan.plant_updates), len(plan.pump_updates))
+    except Exception as e:
+        session.rollback()
+        logger.error("Failed to apply event batch: %s", e)
+        raise
+    return plan.results
+
+async def apply_event_batch_async(session: AsyncSession, items) -> list:
+    """Async variant of apply_event_batch."""
+    plan = EventBatchPlan(items)
+    try:
+        while True:
+            with stage_timer("batch_update"):
+                for kind, event_id, stmt in plan.update_statements():
+                    plan.record_update(kind, event_id, (await session.execute(stmt)).first() is not None)
+            plan.resolve_unmatched({kind: set((await session.execute(query)).scalars()) for kind, query in plan.unmatched_queries()})
+            log_stmt = plan.log_statement()
+            if log_stmt is None:
+                break
+            with stage_timer("batch_log"):
+                inserted = (await session.execute(log_stmt)).rowcount
+            if plan.logged_all(inserted):
+                break
+            # An update without a plant/device snapshot would commit with no log row:
+            # report it, undo the transaction and apply the rest again
+            found = set((await session.execute(plan.found_query())).scalars())
+            await session.rollback()
+            plan.drop_unlogged(found)
+        events = plan.messages()
+        for event in events:
+            notify = event_bus.notify_statement(event)
+            if notify is not None:
+                await session.execute(notify)
+        with stage_timer("batch_commit"):
+            await session.commit()
+        plan.record_stats()
+        plan.write_through()
+        for event in events:
+            event_bus.publish(event)
+        logger.info("Applied event batch: %s plants, %s devices", len(plan.plant_updates), len(plan.pump_updates))
+    except Exception as e:
+        await session.rollback()
+        logger.error("Failed to apply event batch: %s", e)
+        raise
+    return plan.results
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from time import sleep
+from sqlalchemy import select, func, bindparam, Text
+from sqlalchemy.dialects.postgresql import ARRAY
+from utils.db import listen
+
+logger = logging.getLogger(__name__)
+
+# Event push settings
+EVENT_STREAM_QUEUE_SIZE = int(os.getenv("event_stream_queue_size", 100))
+EVENT_STREAM_NOTIFY = os.getenv("event_stream_notify", "false").lower() == "true"
+
+# Channel used to share events between workers (event_stream_notify=true)
+EVENT_CHANNEL = "plant_events"
+
+
+def plant_event_message(plant_id: int, values: dict, plant_event_id: int = None) -> dict:
+    """`plant_event_id` defaults to the plant id, as the single and batch event services use it."""
+    return {"type": "plant", "plant_id": plant_id, "plant_event_id": plant_event_id if plant_event_id is not None else plant_id,
+            "values": values, "updated_at": datetime.now(timezone.utc).isoformat()}
+
+def pump_event_message(iot_dev_id: int, pump_event: bool) -> dict:
+    return {"type": "pump", "iot_dev_id": iot_dev_id, "values": {"pump_event": pump_event}, "updated_at": datetime.now(timezone.utc).isoformat()}
+
+
+class Subscription:
+    """Bounded queue of events for one client; the oldest event is dropped when it is full."""
+
+    def __init__(self, bus, key, queue_size: int):
+        self.bus = bus
+        self.key = key
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def put(self, event: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """In-process fan-out of committed PlantEvent/IotDevEvent changes.
+
+    Subscribers are indexed by plant or device, so a publish only touches
+    the clients that asked for it. Events are delivered on the event loop
+    bound at startup, whichever thread publishes them. With
+    event_stream_notify=true every event goes through Postgres NOTIFY
+    instead, and each worker's listener delivers it to its own clients.
+    """
+
+    def __init__(self, queue_size: int = EVENT_STREAM_QUEUE_SIZE, notify: bool = EVENT_STREAM_NOTIFY):
+        self.queue_size = queue_size
+        self.notify = notify
+        self._subscribers = {}  # None (everything), ("plant", id) or ("pump", id) -> set of Subscription
+        self._loop = None
+        self._stop_listening = threading.Event()
+        self._listener = None
+        self._callbacks = []  # called with every event delivered in this worker
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def subscribe(self, plant_id: int = None, iot_dev_id: int = None) -> Subscription:
+        """Subscribe to one plant, one device, or (with neither) every event."""
+        key = ("plant", plant_id) if plant_id is not None else ("pump", iot_dev_id) if iot_dev_id is not None else None
+        subscription = Subscription(self, key, self.queue_size)
+        self._subscribers.setdefault(key, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._subscribers.get(subscription.key)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.key]
+        self.dropped += subscription.dropped
+
+    def add_callback(self, callback):
+        """Call `callback(event)` on the event loop for every event delivered in this worker."""
+        self._callbacks.append(callback)
+
+    def notify_statement(self, event: dict):
+        """pg_notify SELECT to run inside the committing transaction, or None when not bridged."""
+        if not self.notify:
+            return None
+        return select(func.pg_notify(EVENT_CHANNEL, json.dumps(event)))
+
+    def notify_many_statement(self, events: list):
+        """One pg_notify SELECT for a list of events (a row per event), or None when not bridged."""
+        if not self.notify or not events:
+            return None
+        payloads = bindparam("payloads", [json.dumps(event) for event in events], type_=ARRAY(Text))
+        return select(func.pg_notify(EVENT_CHANNEL, func.unnest(payloads)))
+
+    def publish(self, event: dict):
+        """Deliver a committed event to local subscribers (unless NOTIFY carries it)."""
+        if not self.notify:
+            self._dispatch(event)
+
+    def _dispatch(self, event: dict):
+        if self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._fan_out, event)
+
+    def _fan_out(self, event: dict):
+        self.published += 1
+        for callback in self._callbacks:
+            callback(event)
+        id_field = "plant_id" if event["type"] == "plant" else "iot_dev_id"
+        for key in (None, (event["type"], event[id_field])):
+            for subscription in self._subscribers.get(key, ()):
+                subscription.put(event)
+                self.delivered += 1
+
+    def _on_notify(self, channel: str, payload: str):
+        try:
+            self._dispatch(json.loads(payload))
+        except (ValueError, KeyError) as e:
+            logger.warning("Ignoring malformed event notification: %s", e)
+
+    def _listen(self):
+        while not self._stop_listening.is_set():
+            try:
+                listen([EVENT_CHANNEL], self._on_notify, self._stop_listening)
+            except Exception as e:
+                logger.warning("Event listener disconnected: %s", e)
+                sleep(5)
+
+    def start_listener(self):
+        if self._listener is None:
+            self._stop_listening.clear()
+            self._listener = threading.Thread(target=self._listen, name="event-listener", daemon=True)
+            self._listener.start()
+
+    def stop_listener(self):
+        self._stop_listening.set()
+        self._listener = None
+
+    def stats(self) -> dict:
+        subscriptions = [subscription for subscribers in self._subscribers.values() for subscription in subscribers]
+        return {
+            "notify": self.notify,
+            "listening": self._listener is not None,
+            "subscribers": len(subscriptions),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped + sum(subscription.dropped for subscription in subscriptions),
+            "queue_size": self.queue_size,
+        }
+
+
+event_bus = EventBus()
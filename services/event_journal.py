@@ -0,0 +1,351 @@
+"""Store-and-forward journal for event writes while the database is unreachable.
+
+When an event update fails because the database cannot be reached (or is
+too slow), the event is appended to a local SQLite journal and the request
+gets a 202. While the journal holds events, new events are appended behind
+them instead of going to the database, so they are applied in order. A
+background thread replays the journal through services.batch_service in
+batches of `event_journal_replay_batch` events, oldest first, pausing
+`event_journal_replay_pause_ms` between batches; updates to the same plant
+in a batch are merged into one UPDATE and one log row. Replayed events that
+are rejected (e.g. a plant that no longer exists) are dropped and counted.
+A batch that fails for any reason other than the database being
+unavailable is replayed event by event, and the events that still fail
+are moved to the dead_letter table, so one bad event cannot block the
+journal.
+
+The journal runs in WAL mode with synchronous=NORMAL: an accepted event
+survives a crash of the process, and fsyncs are batched at checkpoints.
+Workers of one deployment can share the file; a lease row makes sure only
+one of them replays at a time.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from time import monotonic, time
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from models.batchModels import BatchEventItem
+from services.batch_service import apply_event_batch
+from services.event_service import update_plant_event, update_device_event, update_plant_event_async, update_device_event_async
+from services.log_service import insert_new_log_plant, insert_new_log_iotDev, insert_new_log_plant_async, insert_new_log_iotDev_async
+from utils.db import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Store-and-forward settings
+EVENT_JOURNAL = os.getenv("event_journal", "false").lower() == "true"
+EVENT_JOURNAL_PATH = os.getenv("event_journal_path", "event_journal.db")
+EVENT_JOURNAL_MAX_EVENTS = int(os.getenv("event_journal_max_events", 100000))
+EVENT_JOURNAL_REPLAY_BATCH = int(os.getenv("event_journal_replay_batch", 200))
+EVENT_JOURNAL_REPLAY_PAUSE_MS = int(os.getenv("event_journal_replay_pause_ms", 50))
+EVENT_JOURNAL_RETRY_SECONDS = float(os.getenv("event_journal_retry_seconds", 5))
+
+# Failures that mean the database is unreachable or overloaded, not that the event is invalid
+DATABASE_UNAVAILABLE = (OperationalError, InterfaceError, PoolTimeoutError, OSError)
+
+# A replaying worker that stops renewing its lease loses it after this long
+REPLAY_LEASE_SECONDS = 30
+
+JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    received_at REAL NOT NULL,
+    item TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS replay_lease (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    holder TEXT,
+    expires_at REAL NOT NULL
+);
+INSERT OR IGNORE INTO replay_lease (id, holder, expires_at) VALUES (1, NULL, 0);
+CREATE TABLE IF NOT EXISTS dead_letter (
+    seq INTEGER PRIMARY KEY,
+    received_at REAL NOT NULL,
+    item TEXT NOT NULL,
+    error TEXT NOT NULL,
+    failed_at REAL NOT NULL
+);
+"""
+
+
+class EventJournal:
+    """Append-only SQLite journal of events accepted while the database was unreachable."""
+
+    def __init__(self, path: str = EVENT_JOURNAL_PATH, session_factory=SessionLocal,
+                 max_events: int = EVENT_JOURNAL_MAX_EVENTS, replay_batch: int = EVENT_JOURNAL_REPLAY_BATCH,
+                 replay_pause_ms: int = EVENT_JOURNAL_REPLAY_PAUSE_MS, retry_seconds: float = EVENT_JOURNAL_RETRY_SECONDS):
+        self.path = path
+        self.session_factory = session_factory
+        self.max_events = max_events
+        self.replay_batch = replay_batch
+        self.replay_pause = replay_pause_ms / 1000
+        self.retry_seconds = retry_seconds
+        self.holder = f"{os.getpid()}-{id(self)}"
+        self._connection = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.journaled = 0
+        self.replayed = 0
+        self.rejected = 0
+        self.dead_lettered = 0
+        self.replay_batches = 0
+        self.failed_replays = 0
+        self.replay_rate = 0.0
+        self.last_error = None
+
+    def _db(self) -> sqlite3.Connection:
+        # Called with self._lock held
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(JOURNAL_SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def backlog(self) -> int:
+        with self._lock:
+            return self._db().execute("SELECT count(*) FROM journal").fetchone()[0]
+
+    def has_backlog(self) -> bool:
+        with self._lock:
+            return self._db().execute("SELECT EXISTS (SELECT 1 FROM journal)").fetchone()[0] == 1
+
+    def append(self, items: list):
+        """Journal `items` (BatchEventItem) in order; 503 when the journal is full."""
+        with self._lock:
+            db = self._db()
+            if db.execute("SELECT count(*) FROM journal").fetchone()[0] + len(items) > self.max_events:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Database unavailable and the event journal is full, retry later.",
+                    headers={"Retry-After": str(max(1, round(self.retry_seconds)))}
+                )
+            now = time()
+            with db:
+                db.executemany("INSERT INTO journal (received_at, item) VALUES (?, ?)",
+                               [(now, item.model_dump_json(exclude_none=True)) for item in items])
+            self.journaled += len(items)
+
+    def _acquire_lease(self) -> bool:
+        now = time()
+        with self._lock, self._db() as db:
+            cursor = db.execute(
+                "UPDATE replay_lease SET holder = ?, expires_at = ? WHERE id = 1 AND (holder = ? OR expires_at < ?)",
+                (self.holder, now + REPLAY_LEASE_SECONDS, self.holder, now),
+            )
+            return cursor.rowcount == 1
+
+    def _release_lease(self):
+        with self._lock, self._db() as db:
+            db.execute("UPDATE replay_lease SET holder = NULL, expires_at = 0 WHERE id = 1 AND holder = ?", (self.holder,))
+
+    def _apply(self, items: list):
+        with self.session_factory() as session:
+            results = apply_event_batch(session, items)
+        for result in results:
+            if result["status_code"] != 200:
+                self.rejected += 1
+                logger.warning("Dropped replayed event: %s", result["detail"])
+
+    def _replay_row(self, seq: int, received_at: float, item: str):
+        """Replay one event; a failure other than DATABASE_UNAVAILABLE dead-letters it."""
+        try:
+            self._apply([BatchEventItem(**json.loads(item))])
+        except DATABASE_UNAVAILABLE:
+            raise
+        except Exception as e:
+            self.dead_lettered += 1
+            logger.error("Moved journaled event %s to the dead letters: %s", seq, e)
+            with self._lock, self._db() as db:
+                db.execute("INSERT OR REPLACE INTO dead_letter (seq, received_at, item, error, failed_at) VALUES (?, ?, ?, ?, ?)",
+                           (seq, received_at, item, str(e), time()))
+                db.execute("DELETE FROM journal WHERE seq = ?", (seq,))
+            return
+        with self._lock, self._db() as db:
+            db.execute("DELETE FROM journal WHERE seq = ?", (seq,))
+        self.replayed += 1
+
+    def replay_once(self) -> int:
+        """Apply the oldest batch and remove it from the journal; returns the events handled.
+
+        DATABASE_UNAVAILABLE errors propagate and leave the batch in the
+        journal. Any other failure replays the batch event by event.
+        """
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT seq, received_at, item FROM journal ORDER BY seq LIMIT ?", (self.replay_batch,)
+            ).fetchall()
+        if not rows:
+            return 0
+        try:
+            self._apply([BatchEventItem(**json.loads(item)) for _, _, item in rows])
+        except DATABASE_UNAVAILABLE:
+            raise
+        except Exception as e:
+            logger.warning("Replaying a journaled batch of %s events one by one: %s", len(rows), e)
+            for row in rows:
+                self._replay_row(*row)
+        else:
+            with self._lock, self._db() as db:
+                db.execute("DELETE FROM journal WHERE seq <= ?", (rows[-1][0],))
+            self.replayed += len(rows)
+        self.replay_batches += 1
+        return len(rows)
+
+    def replay(self) -> int:
+        """Replay until the journal is empty, the database fails or the lease is lost; returns the events handled."""
+        if not self._acquire_lease():
+            return 0
+        total = 0
+        started = monotonic()
+        try:
+            while not self._stop.is_set():
+                replayed = self.replay_once()
+                if not replayed:
+                    break
+                total += replayed
+                if not self._acquire_lease():  # renew
+                    logger.warning("Lost the event journal replay lease after %s events", total)
+                    break
+                self._stop.wait(self.replay_pause)
+        except Exception as e:
+            self.failed_replays += 1
+            self.last_error = str(e)
+            logger.warning("Event journal replay stopped after %s events: %s", total, e)
+        finally:
+            self._release_lease()
+        if total:
+            self.replay_rate = total / (monotonic() - started)
+            logger.info("Replayed %s journaled events (%.0f/s)", total, self.replay_rate)
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.has_backlog():
+                self.replay()
+            self._stop.wait(self.retry_seconds)
+
+    def start(self):
+        with self._lock:
+            self._db()
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="event-journal-replay", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = None):
+        """Stop replaying; journaled events stay on disk for the next start."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def stats(self) -> dict:
+        if not EVENT_JOURNAL and self._connection is None:
+            return {"enabled": False}
+        with self._lock:
+            backlog, oldest = self._db().execute("SELECT count(*), min(received_at) FROM journal").fetchone()
+            dead_letters = self._db().execute("SELECT count(*) FROM dead_letter").fetchone()[0]
+        return {
+            "enabled": EVENT_JOURNAL,
+            "path": self.path,
+            "backlog": backlog,
+            "oldest_age_seconds": round(time() - oldest, 1) if oldest else None,
+            "journaled": self.journaled,
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+            "dead_lettered": self.dead_lettered,
+            "dead_letters": dead_letters,
+            "replay_batches": self.replay_batches,
+            "failed_replays": self.failed_replays,
+            "replay_rate": round(self.replay_rate, 1),
+            "last_error": self.last_error,
+        }
+
+
+event_journal = EventJournal()
+
+
+def _journal(item: BatchEventItem, error: Exception = None) -> bool:
+    if error is not None:
+        logger.warning("Database unavailable, journaling %s event: %s", item.type, error)
+    event_journal.append([item])
+    return False
+
+def _plant_item(event_type: str, event_value, plant_id: int) -> BatchEventItem:
+    return BatchEventItem(type="plant", plant_id=plant_id, **{event_type: event_value})
+
+def _pump_item(event_value: bool, iot_dev_id: int) -> BatchEventItem:
+    return BatchEventItem(type="pump", iot_dev_id=iot_dev_id, pump_event=event_value)
+
+def write_plant_event(session, event_type: str, event_value, plant_id: int) -> bool:
+    """Update a plant event and write its log row; False when it was journaled instead.
+
+    Only a failed update is journaled. Once the update is committed, a
+    failure of the log insert is raised: journaling the event then would
+    apply it a second time on replay.
+    """
+    if EVENT_JOURNAL and event_journal.has_backlog():
+        return _journal(_plant_item(event_type, event_value, plant_id))
+    try:
+        updated = update_plant_event(session, event_type, event_value, plant_id)
+    except DATABASE_UNAVAILABLE as e:
+        if not EVENT_JOURNAL:
+            raise
+        return _journal(_plant_item(event_type, event_value, plant_id), e)
+    if updated:
+        insert_new_log_plant(session, plant_id)
+    return True
+
+def write_device_event(session, event_value: bool, iot_dev_id: int) -> bool:
+    """Update a pump event and write its log row; False when it was journaled instead (see write_plant_event)."""
+    if EVENT_JOURNAL and event_journal.has_backlog():
+        return _journal(_pump_item(event_value, iot_dev_id))
+    try:
+        updated = update_device_event(session, event_value, iot_dev_id)
+    except DATABASE_UNAVAILABLE as e:
+        if not EVENT_JOURNAL:
+            raise
+        return _journal(_pump_item(event_value, iot_dev_id), e)
+    if updated:
+        insert_new_log_iotDev(session, iot_dev_id)
+    return True
+
+# The journal is a blocking SQLite file: the async variants reach it through the threadpool
+
+async def write_plant_event_async(session, event_type: str, event_value, plant_id: int) -> bool:
+    if EVENT_JOURNAL and await run_in_threadpool(event_journal.has_backlog):
+        return await run_in_threadpool(_journal, _plant_item(event_type, event_value, plant_id))
+    try:
+        updated = await update_plant_event_async(session, event_type, event_value, plant_id)
+    except DATABASE_UNAVAILABLE as e:
+        if not EVENT_JOURNAL:
+            raise
+        return await run_in_threadpool(_journal, _plant_item(event_type, event_value, plant_id), e)
+    if updated:
+        await insert_new_log_plant_async(session, plant_id)
+    return True
+
+async def write_device_event_async(session, event_value: bool, iot_dev_id: int) -> bool:
+    if EVENT_JOURNAL and await run_in_threadpool(event_journal.has_backlog):
+        return await run_in_threadpool(_journal, _pump_item(event_value, iot_dev_id))
+    try:
+        updated = await update_device_event_async(session, event_value, iot_dev_id)
+    except DATABASE_UNAVAILABLE as e:
+        if not EVENT_JOURNAL:
+            raise
+        return await run_in_threadpool(_journal, _pump_item(event_value, iot_dev_id), e)
+    if updated:
+        await insert_new_log_iotDev_async(session, iot_dev_id)
+    return True
@@ -1,26 +1,179 @@
+import logging
+import os
+import threading
 from sqlalchemy.orm import Session
-from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import update, select, or_
 from datetime import datetime, timezone
 from models.schema import PlantEvent, IotDevEvent
+from services.state_cache import state_cache
+from services.event_bus import event_bus, plant_event_message, pump_event_message
+from utils.request_validation import event_not_found
+from utils.metrics import stage_timer
 
-def update_plant_event(session: Session, event_type: str, event_value, event_id: int):
+logger = logging.getLogger(__name__)
+
+# Skip updates that would store the value already there (no commit, log row or push)
+EVENT_SKIP_UNCHANGED = os.getenv("event_skip_unchanged", "false").lower() == "true"
+
+
+class EventWriteStats:
+    """Counts of event updates written and skipped as unchanged."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.updated = 0
+        self.unchanged = 0
+
+    def record(self, changed: bool):
+        with self._lock:
+            if changed:
+                self.updated += 1
+            else:
+                self.unchanged += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"skip_unchanged": EVENT_SKIP_UNCHANGED, "updated": self.updated, "unchanged": self.unchanged}
+
+
+write_stats = EventWriteStats()
+
+
+def plant_event_update_stmt(values: dict, event_id: int, only_changed: bool = EVENT_SKIP_UNCHANGED):
+    return plant_events_update_stmt(values, PlantEvent.id == event_id, only_changed)
+
+def plant_events_update_stmt(values: dict, condition, only_changed: bool = EVENT_SKIP_UNCHANGED):
+    """Set-based UPDATE of every PlantEvent matching `condition`, returning the updated ids."""
     stmt = (
         update(PlantEvent)
-        .where(PlantEvent.id == event_id)
-        .values({event_type: event_value, "last_updated": datetime.now(timezone.utc)})
+        .where(condition)
+        .values({**values, "last_updated": datetime.now(timezone.utc)})
+        .returning(PlantEvent.id)
     )
-    session.execute(stmt)
-    print(f"Updating {event_type} for plant ID {event_id} to {event_value}")
-    session.commit()
-    print(f"Updated {event_type} for plant ID {event_id} to {event_value}")
+    if only_changed:
+        # Matches no row when every value is already stored
+        stmt = stmt.where(or_(*(getattr(PlantEvent, column).is_distinct_from(value) for column, value in values.items())))
+    return stmt
 
-def update_device_event(session: Session, event_value: bool, event_id: int):
+def device_event_update_stmt(event_value: bool, event_id: int, only_changed: bool = EVENT_SKIP_UNCHANGED):
     stmt = (
         update(IotDevEvent)
         .where(IotDevEvent.id == event_id)
         .values(pump_event=event_value, last_updated=datetime.now(timezone.utc))
+        .returning(IotDevEvent.id)
     )
-    session.execute(stmt)
-    print(f"Updating pump event for device ID {event_id} to {event_value}")
-    session.commit()
-    print(f"Updated pump event for device ID {event_id} to {event_value}")
+    if only_changed:
+        stmt = stmt.where(IotDevEvent.pump_event.is_distinct_from(event_value))
+    return stmt
+
+def _event_exists_stmt(model, event_id: int):
+    return select(model.id).where(model.id == event_id)
+
+def update_plant_event(session: Session, event_type: str, event_value, event_id: int):
+    stmt = plant_event_update_stmt({event_type: event_value}, event_id)
+    event = plant_event_message(event_id, {event_type: event_value})
+    # UPDATE ... RETURNING: existence and update share one round trip
+    with stage_timer("event_update"):
+        row = session.execute(stmt).first()
+    if row is None:
+        # No row: the event does not exist, or it already holds the value (skip mode only)
+        exists = EVENT_SKIP_UNCHANGED and session.execute(_event_exists_stmt(PlantEvent, event_id)).first() is not None
+        session.commit()
+        if not exists:
+            raise event_not_found("PlantEvent", event_id)
+        write_stats.record(False)
+        logger.info("Unchanged %s for plant ID %s: already %s", event_type, event_id, event_value, extra={"plant_id": event_id})
+        return False
+    write_stats.record(True)
+    notify = event_bus.notify_statement(event)
+    if notify is not None:
+        session.execute(notify)
+    logger.debug("Updating %s for plant ID %s to %s", event_type, event_id, event_value, extra={"plant_id": event_id})
+    with stage_timer("event_commit"):
+        session.commit()
+    state_cache.update_plant_event(event_id, {event_type: event_value})
+    event_bus.publish(event)
+    logger.info("Updated %s for plant ID %s to %s", event_type, event_id, event_value, extra={"plant_id": event_id})
+    return True
+
+def update_device_event(session: Session, event_value: bool, event_id: int):
+    stmt = device_event_update_stmt(event_value, event_id)
+    event = pump_event_message(event_id, event_value)
+    # UPDATE ... RETURNING: existence and update share one round trip
+    with stage_timer("event_update"):
+        row = session.execute(stmt).first()
+    if row is None:
+        # No row: the event does not exist, or it already holds the value (skip mode only)
+        exists = EVENT_SKIP_UNCHANGED and session.execute(_event_exists_stmt(IotDevEvent, event_id)).first() is not None
+        session.commit()
+        if not exists:
+            raise event_not_found("IotDevEvent", event_id)
+        write_stats.record(False)
+        logger.info("Unchanged pump event for device ID %s: already %s", event_id, event_value, extra={"iot_dev_id": event_id})
+        return False
+    write_stats.record(True)
+    notify = event_bus.notify_statement(event)
+    if notify is not None:
+        session.execute(notify)
+    logger.debug("Updating pump event for device ID %s to %s", event_id, event_value, extra={"iot_dev_id": event_id})
+    with stage_timer("event_commit"):
+        session.commit()
+    state_cache.update_device_event(event_id, event_value)
+    event_bus.publish(event)
+    logger.info("Updated pump event for device ID %s to %s", event_id, event_value, extra={"iot_dev_id": event_id})
+    return True
+
+async def update_plant_event_async(session: AsyncSession, event_type: str, event_value, event_id: int):
+    stmt = plant_event_update_stmt({event_type: event_value}, event_id)
+    event = plant_event_message(event_id, {event_type: event_value})
+    # UPDATE ... RETURNING: existence and update share one round trip
+    with stage_timer("event_update"):
+        row = (await session.execute(stmt)).first()
+    if row is None:
+        # No row: the event does not exist, or it already holds the value (skip mode only)
+        exists = EVENT_SKIP_UNCHANGED and (await session.execute(_event_exists_stmt(PlantEvent, event_id))).first() is not None
+        await session.commit()
+        if not exists:
+            raise event_not_found("PlantEvent", event_id)
+        write_stats.record(False)
+        logger.info("Unchanged %s for plant ID %s: already %s", event_type, event_id, event_value, extra={"plant_id": event_id})
+        return False
+    write_stats.record(True)
+    notify = event_bus.notify_statement(event)
+    if notify is not None:
+        await session.execute(notify)
+    logger.debug("Updating %s for plant ID %s to %s", event_type, event_id, event_value, extra={"plant_id": event_id})
+    with stage_timer("event_commit"):
+        await session.commit()
+    state_cache.update_plant_event(event_id, {event_type: event_value})
+    event_bus.publish(event)
+    logger.info("Updated %s for plant ID %s to %s", event_type, event_id, event_value, extra={"plant_id": event_id})
+    return True
+
+async def update_device_event_async(session: AsyncSession, event_value: bool, event_id: int):
+    stmt = device_event_update_stmt(event_value, event_id)
+    event = pump_event_message(event_id, event_value)
+    # UPDATE ... RETURNING: existence and update share one round trip
+    with stage_timer("event_update"):
+        row = (await session.execute(stmt)).first()
+    if row is None:
+        # No row: the event does not exist, or it already holds the value (skip mode only)
+        exists = EVENT_SKIP_UNCHANGED and (await session.execute(_event_exists_stmt(IotDevEvent, event_id))).first() is not None
+        await session.commit()
+        if not exists:
+            raise event_not_found("IotDevEvent", event_id)
+        write_stats.record(False)
+        logger.info("Unchanged pump event for device ID %s: already %s", event_id, event_value, extra={"iot_dev_id": event_id})
+        return False
+    write_stats.record(True)
+    notify = event_bus.notify_statement(event)
+    if notify is not None:
+        await session.execute(notify)
+    logger.debug("Updating pump event for device ID %s to %s", event_id, event_value, extra={"iot_dev_id": event_id})
+    with stage_timer("event_commit"):
+        await session.commit()
+    state_cache.update_device_event(event_id, event_value)
+    event_bus.publish(event)
+    logger.info("Updated pump event for device ID %s to %s", event_id, event_value, extra={"iot_dev_id": event_id})
+    return True
@@ -0,0 +1,142 @@
+import logging
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from models.schema import Plant, PlantEvent
+from services.event_service import plant_events_update_stmt, write_stats
+from services.log_service import plants_log_insert
+from services.state_cache import state_cache
+from services.event_bus import event_bus, plant_event_message
+from utils.request_validation import validate_fleet_control
+from utils.metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+class FleetControlPlan:
+    """Set-based view of a fleet control request.
+
+    The same values go to every selected plant, so the whole request is
+    one SELECT of the plants, one UPDATE of their PlantEvent rows and one
+    INSERT ... SELECT of their log rows, whatever the number of plants.
+    """
+
+    def __init__(self, data):
+        self.values = validate_fleet_control(data)
+        self.plant_ids = list(dict.fromkeys(data.plant_ids)) if data.plant_ids is not None else None
+        self.iot_dev_id = data.iot_dev_id
+        self.plants = {}   # plant_id -> plant_event_id of the selected plants that exist
+        self.updated = []  # plant ids whose PlantEvent was written
+
+    def plants_query(self):
+        query = select(Plant.id, Plant.plant_event_id)
+        if self.plant_ids is not None:
+            return query.where(Plant.id.in_(self.plant_ids))
+        return query.where(Plant.iot_dev_id == self.iot_dev_id).order_by(Plant.id)
+
+    def set_plants(self, rows):
+        self.plants = {plant_id: event_id for plant_id, event_id in rows}
+        if self.iot_dev_id is not None and not self.plants:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No plants found for IoT device ID {self.iot_dev_id}."
+            )
+
+    def update_statement(self):
+        """One UPDATE ... RETURNING over every selected PlantEvent, or None when none exists."""
+        if not self.plants:
+            return None
+        return plant_events_update_stmt(self.values, PlantEvent.id.in_(set(self.plants.values())))
+
+    def record_updated(self, event_ids):
+        """Note which PlantEvent rows the UPDATE returned; the others already held the values."""
+        event_ids = set(event_ids)
+        self.updated = [plant_id for plant_id, event_id in self.plants.items() if event_id in event_ids]
+        for plant_id in self.plants:
+            write_stats.record(plant_id in self.updated)
+
+    def log_statement(self):
+        return plants_log_insert(self.updated) if self.updated else None
+
+    def messages(self) -> list:
+        return [plant_event_message(plant_id, self.values, self.plants[plant_id]) for plant_id in self.updated]
+
+    def write_through(self):
+        for plant_id in self.updated:
+            state_cache.update_plant_event(self.plants[plant_id], self.values)
+
+    def results(self) -> list:
+        """A status_code and detail for every selected plant, in request order."""
+        updated = set(self.updated)
+        results = []
+        for plant_id in self.plant_ids if self.plant_ids is not None else self.plants:
+            if plant_id in updated:
+                result = {"status_code": status.HTTP_200_OK, "detail": "updated"}
+            elif plant_id in self.plants:
+                result = {"status_code": status.HTTP_200_OK, "detail": "unchanged"}
+            else:
+                result = {"status_code": status.HTTP_404_NOT_FOUND, "detail": f"Plant with ID {plant_id} does not exist."}
+            results.append({"plant_id": plant_id, **result})
+        return results
+
+def apply_fleet_control(session: Session, data) -> list:
+    """Apply the same event values to a set of plants in one transaction."""
+    plan = FleetControlPlan(data)
+    try:
+        plan.set_plants(session.execute(plan.plants_query()).all())
+        stmt = plan.update_statement()
+        if stmt is not None:
+            with stage_timer("fleet_update"):
+                plan.record_updated(session.execute(stmt).scalars())
+        log_stmt = plan.log_statement()
+        if log_stmt is not None:
+            with stage_timer("fleet_log"):
+                session.execute(log_stmt)
+        events = plan.messages()
+        notify = event_bus.notify_many_statement(events)
+        if notify is not None:
+            session.execute(notify)
+        with stage_timer("fleet_commit"):
+            session.commit()
+        plan.write_through()
+        for event in events:
+            event_bus.publish(event)
+        logger.info("Applied fleet control: %s of %s plants updated", len(plan.updated), len(plan.plants))
+    except HTTPException:
+        raise
+    except Exception as e:
+        session.rollback()
+        logger.error("Failed to apply fleet control: %s", e)
+        raise
+    return plan.results()
+
+async def apply_fleet_control_async(session: AsyncSession, data) -> list:
+    """Async variant of apply_fleet_control."""
+    plan = FleetControlPlan(data)
+    try:
+        plan.set_plants((await session.execute(plan.plants_query())).all())
+        stmt = plan.update_statement()
+        if stmt is not None:
+            with stage_timer("fleet_update"):
+                plan.record_updated((await session.execute(stmt)).scalars())
+        log_stmt = plan.log_statement()
+        if log_stmt is not None:
+            with stage_timer("fleet_log"):
+                await session.execute(log_stmt)
+        events = plan.messages()
+        notify = event_bus.notify_many_statement(events)
+        if notify is not None:
+            await session.execute(notify)
+        with stage_timer("fleet_commit"):
+            await session.commit()
+        plan.write_through()
+        for event in events:
+            event_bus.publish(event)
+        logger.info("Applied fleet control: %s of %s plants updated", len(plan.updated), len(plan.plants))
+    except HTTPException:
+        raise
+    except Exception as e:
+        await session.rollback()
+        logger.error("Failed to apply fleet control: %s", e)
+        raise
+    return plan.results()
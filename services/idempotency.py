@@ -0,0 +1,281 @@
+"""Idempotency-Key replay for event writes.
+
+With the default idempotency_backend=memory the keys live in each worker,
+so a retry only finds the first response when it reaches the same worker:
+under gunicorn with web_concurrency > 1 a retry routed to another worker
+runs the write again. idempotency_backend=sqlite keeps the keys and
+responses in the SQLite file `idempotency_path`, shared by the workers of
+a host, so retries are deduplicated whichever worker gets them.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from time import monotonic, time
+from fastapi import Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
+
+logger = logging.getLogger(__name__)
+
+# Idempotency-Key settings (0 disables replay)
+IDEMPOTENCY_TTL = float(os.getenv("idempotency_ttl", 0))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("idempotency_max_keys", 100000))
+IDEMPOTENCY_BACKEND = os.getenv("idempotency_backend", "memory").lower()  # "memory" or "sqlite"
+IDEMPOTENCY_PATH = os.getenv("idempotency_path", "idempotency.db")
+
+# Only writes under these prefixes are deduplicated
+IDEMPOTENT_PATHS = ("/events",)
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    status_code INTEGER,
+    headers TEXT,
+    body BLOB
+) WITHOUT ROWID
+"""
+# A claim (a request still running, status_code NULL) left by a worker that died is taken over after this long
+SQLITE_CLAIM_SECONDS = 60
+# How often a retry checks whether a request running in another worker has finished
+SQLITE_POLL_SECONDS = 0.05
+# Seconds between removals of expired keys from the SQLite file
+SQLITE_PRUNE_SECONDS = 10
+
+
+class SqliteEntries:
+    """Claims and stored responses in a SQLite file shared by the workers of a host.
+
+    Blocking: called in the threadpool. A SQLite error lets the request
+    run without deduplication.
+    """
+
+    def __init__(self, path: str = IDEMPOTENCY_PATH, max_keys: int = IDEMPOTENCY_MAX_KEYS):
+        self.path = path
+        self.max_keys = max_keys
+        self._connection = None
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+        self.errors = 0
+
+    def _db(self) -> sqlite3.Connection:
+        # Called with self._lock held
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False, timeout=1, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(SQLITE_SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _prune(self, db: sqlite3.Connection, now: float):
+        db.execute("DELETE FROM idempotency WHERE expires_at <= ?", (now,))
+        excess = db.execute("SELECT count(*) FROM idempotency").fetchone()[0] - self.max_keys
+        if excess > 0:
+            db.execute("DELETE FROM idempotency WHERE key IN (SELECT key FROM idempotency ORDER BY expires_at LIMIT ?)", (excess,))
+        self._next_prune = now + SQLITE_PRUNE_SECONDS
+
+    def claim(self, key: str, fingerprint: str) -> tuple:
+        """Claim `key` for a new request.
+
+        Returns ("claimed", None), ("running", fingerprint) while another
+        request holds it, or ("stored", (fingerprint, status_code, headers, body)).
+        """
+        now = time()
+        try:
+            with self._lock:
+                db = self._db()
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    if now >= self._next_prune:
+                        self._prune(db, now)
+                    row = db.execute(
+                        "SELECT fingerprint, status_code, headers, body FROM idempotency WHERE key = ? AND expires_at > ?",
+                        (key, now),
+                    ).fetchone()
+                    if row is None:
+                        db.execute(
+                            "INSERT OR REPLACE INTO idempotency (key, fingerprint, expires_at) VALUES (?, ?, ?)",
+                            (key, fingerprint, now + SQLITE_CLAIM_SECONDS),
+                        )
+                    db.execute("COMMIT")
+                except BaseException:
+                    if db.in_transaction:
+                        db.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning("Idempotency keys unavailable, running the request: %s", e)
+            return "claimed", None
+        if row is None:
+            return "claimed", None
+        stored_fingerprint, status_code, headers, body = row
+        if status_code is None:
+            return "running", stored_fingerprint
+        return "stored", (stored_fingerprint, status_code, json.loads(headers), body)
+
+    def finish(self, key: str, ttl: float, status_code: int = None, headers: dict = None, body: bytes = None):
+        """Store a successful response for `ttl` seconds, or release the claim."""
+        try:
+            with self._lock:
+                if status_code is not None and 200 <= status_code < 300:
+                    self._db().execute(
+                        "UPDATE idempotency SET expires_at = ?, status_code = ?, headers = ?, body = ? WHERE key = ?",
+                        (time() + ttl, status_code, json.dumps(headers), body, key),
+                    )
+                else:
+                    self._db().execute("DELETE FROM idempotency WHERE key = ? AND status_code IS NULL", (key,))
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning("Could not store the idempotent response: %s", e)
+
+    def keys(self) -> int:
+        try:
+            with self._lock:
+                return self._db().execute("SELECT count(*) FROM idempotency WHERE status_code IS NOT NULL").fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class IdempotencyStore:
+    """Responses of recent writes, keyed by method, path and Idempotency-Key.
+
+    A retry with the same key within `ttl` seconds gets the stored response
+    without running the handler again. A retry that arrives while the first
+    request is still running waits for it. Reusing a key with a different
+    body is rejected with a 422. Only successful responses are stored, so a
+    failed request can be retried. Used from the event loop only.
+
+    With backend="sqlite" the responses and claims are kept in SqliteEntries
+    instead of `_entries`; waiting on a request of the same worker still
+    uses `_pending`, while a request running in another worker is polled.
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, max_keys: int = IDEMPOTENCY_MAX_KEYS,
+                 backend: str = IDEMPOTENCY_BACKEND):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.backend = backend
+        self.shared = SqliteEntries(max_keys=max_keys) if backend == "sqlite" else None
+        self._entries = OrderedDict()  # key -> (expires_at, fingerprint, status_code, headers, body)
+        self._pending = {}  # key -> (fingerprint, asyncio.Event)
+        self.stored = 0
+        self.replayed = 0
+        self.conflicts = 0
+
+    def _evict(self):
+        now = monotonic()
+        # Every entry lives for the same ttl, so the oldest expire first
+        while self._entries and (next(iter(self._entries.values()))[0] <= now or len(self._entries) > self.max_keys):
+            self._entries.popitem(last=False)
+
+    def _conflict(self) -> Response:
+        self.conflicts += 1
+        return JSONResponse(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            content={"detail": "Idempotency-Key was already used with a different request body."}
+        )
+
+    def _replay(self, fingerprint: str, stored_fingerprint: str, status_code: int, headers: dict, body: bytes) -> Response:
+        if stored_fingerprint != fingerprint:
+            return self._conflict()
+        self.replayed += 1
+        return Response(body, status_code=status_code, headers={**headers, "Idempotent-Replayed": "true"})
+
+    async def begin(self, key: str, fingerprint: str):
+        """Return the stored response for a retry, or None after claiming the key."""
+        while True:
+            self._evict()
+            entry = self._entries.get(key)
+            if entry is not None:
+                return self._replay(fingerprint, *entry[1:])
+            pending = self._pending.get(key)
+            if pending is not None:
+                if pending[0] != fingerprint:
+                    return self._conflict()
+                await pending[1].wait()
+                continue
+            if self.shared is None:
+                self._pending[key] = (fingerprint, asyncio.Event())
+                return None
+            state, found = await run_in_threadpool(self.shared.claim, key, fingerprint)
+            if state == "stored":
+                return self._replay(fingerprint, *found)
+            if state == "running":
+                if found != fingerprint:
+                    return self._conflict()
+                await asyncio.sleep(SQLITE_POLL_SECONDS)
+                continue
+            if key in self._pending:
+                # Another request of this worker got the key too (SQLite failed open): wait for it
+                continue
+            self._pending[key] = (fingerprint, asyncio.Event())
+            return None
+
+    async def finish(self, key: str, status_code: int = None, headers: dict = None, body: bytes = None):
+        """Release the key, storing the response when it succeeded."""
+        fingerprint, done = self._pending.pop(key)
+        succeeded = status_code is not None and 200 <= status_code < 300
+        try:
+            if self.shared is not None:
+                await run_in_threadpool(self.shared.finish, key, self.ttl, status_code, headers, body)
+            elif succeeded:
+                self._entries[key] = (monotonic() + self.ttl, fingerprint, status_code, headers, body)
+                self._evict()
+            if succeeded:
+                self.stored += 1
+        finally:
+            done.set()
+
+    def close(self):
+        if self.shared is not None:
+            self.shared.close()
+
+    def stats(self) -> dict:
+        return {
+            "ttl": self.ttl,
+            "backend": self.backend,
+            "keys": self.shared.keys() if self.shared is not None else len(self._entries),
+            "errors": self.shared.errors if self.shared is not None else 0,
+            "in_flight": len(self._pending),
+            "stored": self.stored,
+            "replayed": self.replayed,
+            "conflicts": self.conflicts,
+        }
+
+
+idempotency_store = IdempotencyStore()
+
+
+async def idempotency_middleware(request: Request, call_next):
+    key = request.headers.get("Idempotency-Key")
+    if (not IDEMPOTENCY_TTL or key is None or request.method not in ("PUT", "POST")
+            or not request.url.path.startswith(IDEMPOTENT_PATHS)):
+        return await call_next(request)
+
+    scoped_key = f"{request.method} {request.url.path} {key}"
+    fingerprint = hashlib.sha256(await request.body()).hexdigest()
+    replay = await idempotency_store.begin(scoped_key, fingerprint)
+    if replay is not None:
+        return replay
+
+    status_code = headers = body = None
+    try:
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        status_code, headers = response.status_code, dict(response.headers)
+    finally:
+        await idempotency_store.finish(scoped_key, status_code, headers, body)
+    return Response(body, status_code=status_code, headers=headers)
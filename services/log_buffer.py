@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+from time import monotonic, perf_counter, sleep
+from fastapi import HTTPException, status
+from sqlalchemy import insert
+from models.schema import Log
+from utils.db import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Write-behind settings
+LOG_WRITE_BEHIND = os.getenv("log_write_behind", "false").lower() == "true"
+LOG_QUEUE_SIZE = int(os.getenv("log_queue_size", 10000))
+LOG_FLUSH_INTERVAL_MS = int(os.getenv("log_flush_interval_ms", 200))
+LOG_FLUSH_MAX_ROWS = int(os.getenv("log_flush_max_rows", 500))
+LOG_ENQUEUE_TIMEOUT = float(os.getenv("log_enqueue_timeout", 1.0))
+
+# Flush attempts per batch once shutdown has started
+SHUTDOWN_FLUSH_ATTEMPTS = 3
+
+
+class LogBuffer:
+    """Bounded in-memory queue of Log rows flushed in bulk by a background thread.
+
+    Rows are flushed every `flush_interval_ms` or as soon as `flush_max_rows`
+    are waiting, whichever comes first. When the queue is full, `enqueue`
+    waits up to `enqueue_timeout` seconds and then rejects the row with a
+    503. A failed flush keeps its rows and retries them, and `stop` drains
+    the queue before returning.
+    """
+
+    def __init__(self, session_factory=SessionLocal, maxsize: int = LOG_QUEUE_SIZE,
+                 flush_interval_ms: int = LOG_FLUSH_INTERVAL_MS, flush_max_rows: int = LOG_FLUSH_MAX_ROWS,
+                 enqueue_timeout: float = LOG_ENQUEUE_TIMEOUT):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max_rows = flush_max_rows
+        self.enqueue_timeout = enqueue_timeout
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.enqueued = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self._total_flush_seconds = 0.0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="log-buffer-flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = None):
+        """Stop the flush loop once every queued row has been written."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def enqueue(self, row: dict):
+        try:
+            self._queue.put(row, timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Log buffer is full, retry later.",
+                headers={"Retry-After": str(max(1, round(self.flush_interval)))}
+            )
+        with self._lock:
+            self.enqueued += 1
+
+    async def enqueue_async(self, row: dict):
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # Wait for room off the event loop
+            await asyncio.to_thread(self.enqueue, row)
+            return
+        with self._lock:
+            self.enqueued += 1
+
+    def _collect(self) -> list:
+        rows = []
+        deadline = monotonic() + self.flush_interval
+        while len(rows) < self.flush_max_rows:
+            remaining = deadline - monotonic()
+            try:
+                if remaining <= 0:
+                    rows.append(self._queue.get_nowait())
+                else:
+                    rows.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return rows
+
+    def _flush(self, rows: list) -> bool:
+        start = perf_counter()
+        session = self.session_factory()
+        try:
+            # executemany: batched into multi-row INSERTs by the driver
+            session.execute(insert(Log), rows)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            with self._lock:
+                self.failed_flushes += 1
+            logger.error("Failed to flush %s log entries: %s", len(rows), e)
+            return False
+        finally:
+            session.close()
+
+        elapsed = perf_counter() - start
+        with self._lock:
+            self.flushed += len(rows)
+            self.flushes += 1
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            self._total_flush_seconds += elapsed
+        return True
+
+    def _run(self):
+        pending = []
+        shutdown_attempts = 0
+        while True:
+            stopping = self._stopping.is_set()
+            if not pending:
+                pending = self._collect()
+            if pending:
+                if self._flush(pending):
+                    pending = []
+                    continue
+                if stopping:
+                    shutdown_attempts += 1
+                    if shutdown_attempts >= SHUTDOWN_FLUSH_ATTEMPTS:
+                        # The database is still failing and the process is exiting
+                        logger.error("Dropping %s log entries on shutdown", len(pending))
+                        with self._lock:
+                            self.dropped += len(pending)
+                        pending = []
+                        shutdown_attempts = 0
+                        continue
+                # Back off before retrying the same rows
+                sleep(self.flush_interval)
+            elif stopping and self._queue.empty():
+                return
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": LOG_WRITE_BEHIND,
+                "depth": self._queue.qsize(),
+                "capacity": self._queue.maxsize,
+                "enqueued": self.enqueued,
+                "rejected": self.rejected,
+                "flushed": self.flushed,
+                "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes,
+                "dropped": self.dropped,
+                "last_flush_seconds": self.last_flush_seconds,
+                "max_flush_seconds": self.max_flush_seconds,
+                "avg_flush_seconds": self._total_flush_seconds / self.flushes if self.flushes else 0.0,
+            }
+
+
+log_buffer = LogBuffer()
@@ -0,0 +1,94 @@
+import logging
+import os
+import threading
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+# Trailing log debounce window (0 writes one log row per update)
+LOG_DEBOUNCE_MS = int(os.getenv("log_debounce_ms", 0))
+
+
+class LogDebouncer:
+    """Coalesce the log rows of rapid successive updates to the same plant or device.
+
+    The first update schedules a log row `window_ms` later; updates arriving
+    before then are folded into it. The row is written by `write(plant_id,
+    iot_dev_id)` from a background thread and snapshots the values current
+    at that moment, so it reflects the last update of the burst. `stop`
+    writes every pending row before returning.
+    """
+
+    def __init__(self, write, window_ms: int = LOG_DEBOUNCE_MS):
+        self.write = write
+        self.window = window_ms / 1000
+        self._pending = {}  # (plant_id, iot_dev_id) -> monotonic time the row is due
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+        self.scheduled = 0
+        self.coalesced = 0
+        self.written = 0
+        self.failed = 0
+
+    def schedule(self, plant_id: int, iot_dev_id: int = None):
+        with self._condition:
+            key = (plant_id, iot_dev_id)
+            if key in self._pending:
+                self.coalesced += 1
+                return
+            self._pending[key] = monotonic() + self.window
+            self.scheduled += 1
+            self._condition.notify()
+
+    def _due(self) -> list:
+        """Wait for the next due rows (all of them once stopping)."""
+        with self._condition:
+            while True:
+                now = monotonic()
+                due = [key for key, due_at in self._pending.items() if self._stopping or due_at <= now]
+                if due or (self._stopping and not self._pending):
+                    for key in due:
+                        del self._pending[key]
+                    return due
+                timeout = min(self._pending.values()) - now if self._pending else None
+                self._condition.wait(timeout)
+
+    def _run(self):
+        while True:
+            due = self._due()
+            if not due:
+                return
+            for plant_id, iot_dev_id in due:
+                try:
+                    self.write(plant_id, iot_dev_id)
+                    self.written += 1
+                except Exception as e:
+                    self.failed += 1
+                    logger.error("Failed to write debounced log entry for plant ID %s: %s", plant_id, e, extra={"plant_id": plant_id})
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="log-debouncer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = None):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "window_ms": self.window * 1000,
+                "pending": len(self._pending),
+                "scheduled": self.scheduled,
+                "coalesced": self.coalesced,
+                "written": self.written,
+                "failed": self.failed,
+            }
@@ -0,0 +1,168 @@
+"""Streaming export of Log history as CSV, NDJSON or Parquet.
+
+Also usable from the command line:
+
+    python -m services.log_export --format csv --plant-id 1 --start 2025-01-01 --output logs.csv
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+from fastapi import HTTPException, status
+from sqlalchemy import select
+from models.schema import Log
+from utils.db import SessionLocal, init_engines
+from utils.log_config import setup_logging
+from utils.request_validation import as_utc
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_COLUMNS = [column.name for column in Log.__table__.columns]
+EXPORT_BATCH_SIZE = 5000
+
+def validate_export_format(export_format: str):
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Format must be one of: {', '.join(EXPORT_FORMATS)}."
+        )
+    if export_format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="Parquet export requires the pyarrow package."
+            )
+
+def export_select(plant_id: int = None, start: datetime = None, end: datetime = None):
+    stmt = select(*(getattr(Log, name) for name in EXPORT_COLUMNS)).order_by(Log.id)
+    if plant_id is not None:
+        stmt = stmt.where(Log.plant_id == plant_id)
+    if start is not None:
+        stmt = stmt.where(Log.entry_creation_time >= as_utc(start))
+    if end is not None:
+        stmt = stmt.where(Log.entry_creation_time < as_utc(end))
+    return stmt
+
+def iter_log_batches(plant_id: int = None, start: datetime = None, end: datetime = None,
+                     batch_size: int = EXPORT_BATCH_SIZE, session_factory=SessionLocal):
+    """Yield lists of Log rows read through a server-side cursor.
+
+    Only one batch is held in memory at a time, whatever the result size.
+    """
+    with session_factory() as session:
+        stmt = export_select(plant_id, start, end).execution_options(stream_results=True, yield_per=batch_size)
+        for batch in session.execute(stmt).partitions():
+            yield batch
+
+def _csv_chunks(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def drain() -> str:
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    # The header goes out on its own, so an export without rows is still a CSV file
+    writer.writerow(EXPORT_COLUMNS)
+    yield drain()
+    for batch in batches:
+        writer.writerows(batch)
+        yield drain()
+
+def _ndjson_chunks(batches):
+    for batch in batches:
+        yield "".join(json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=str) + "\n" for row in batch)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet_type(column):
+    import pyarrow as pa
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return pa.timestamp("us")
+    return {bool: pa.bool_(), int: pa.int64(), float: pa.float64()}.get(python_type, pa.string())
+
+def parquet_schema():
+    """One schema from the Log columns, so a batch with an all-null column cannot change it."""
+    import pyarrow as pa
+    return pa.schema([
+        pa.field(column.name, _parquet_type(column), nullable=column.nullable)
+        for column in Log.__table__.columns
+    ])
+
+def _parquet_chunks(batches):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for batch in batches:
+        # One row group per batch
+        writer.write_table(pa.Table.from_pylist([dict(zip(EXPORT_COLUMNS, row)) for row in batch], schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def export_chunks(export_format: str, batches):
+    """Encode row batches as a stream of str (CSV/NDJSON) or bytes (Parquet) chunks."""
+    encoders = {"csv": _csv_chunks, "ndjson": _ndjson_chunks, "parquet": _parquet_chunks}
+    return encoders[export_format](batches)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export Log history.")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--plant-id", type=int)
+    parser.add_argument("--start", type=datetime.fromisoformat)
+    parser.add_argument("--end", type=datetime.fromisoformat)
+    parser.add_argument("--output", help="File to write (default: stdout)")
+    args = parser.parse_args(argv)
+
+    try:
+        validate_export_format(args.format)
+    except HTTPException as e:
+        parser.error(e.detail)
+
+    setup_logging()
+    init_engines()
+    binary = args.format == "parquet"
+    if args.output:
+        output = open(args.output, "wb") if binary else open(args.output, "w", newline="")
+    else:
+        output = sys.stdout.buffer if binary else sys.stdout
+    try:
+        for chunk in export_chunks(args.format, iter_log_batches(args.plant_id, args.start, args.end)):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""Monthly range partitioning and retention for the Log table (PostgreSQL).
+
+    python -m services.log_partitions migrate     # convert an existing Log table
+    python -m services.log_partitions maintain    # create upcoming partitions, apply retention
+
+`migrate` renames the current table to "Log_legacy", creates a partitioned
+"Log" with the same columns, sequence, keys and indexes, creates one
+partition per month of existing data and copies the rows month by month,
+all in one transaction. "Log_legacy" is kept until it is dropped by hand.
+"""
+import argparse
+import logging
+import os
+import threading
+from datetime import date, datetime, timezone, timedelta
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from utils.db import SessionLocal, init_engines
+from utils.log_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Partitioning settings
+LOG_PARTITIONING = os.getenv("log_partitioning", "false").lower() == "true"
+LOG_PARTITION_MONTHS_AHEAD = int(os.getenv("log_partition_months_ahead", 2))
+LOG_RETENTION_DAYS = int(os.getenv("log_retention_days", 0))  # 0 keeps everything
+LOG_RETENTION_MODE = os.getenv("log_retention_mode", "archive")  # "archive" or "drop"
+LOG_PARTITION_MAINTENANCE_SECONDS = float(os.getenv("log_partition_maintenance_seconds", 6 * 3600))
+
+ARCHIVE_SCHEMA = "log_archive"
+LEGACY_TABLE = "Log_legacy"
+DEFAULT_PARTITION = "Log_default"
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+def next_month(value: date) -> date:
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+def partition_name(month: date) -> str:
+    return f"Log_{month.year:04d}_{month.month:02d}"
+
+def is_partitioned(session: Session) -> bool:
+    return session.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p "
+        "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'Log')"
+    )).scalar()
+
+def list_partitions(session: Session) -> list:
+    """Monthly partitions attached to "Log" as (month, name), oldest first."""
+    names = session.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = 'Log'"
+    )).scalars()
+    partitions = []
+    for name in names:
+        parts = name.split("_")
+        if len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+            partitions.append((date(int(parts[1]), int(parts[2]), 1), name))
+    return sorted(partitions)
+
+def has_default_partition(session: Session) -> bool:
+    return session.execute(text(f"""SELECT to_regclass('"{DEFAULT_PARTITION}"') IS NOT NULL""")).scalar()
+
+def create_partition(session: Session, month: date):
+    """Create the partition of `month`, moving its rows out of "Log_default" first.
+
+    PostgreSQL refuses to create a partition while the default partition
+    holds rows in its range (e.g. written ahead of time by a device with a
+    wrong clock), so the default partition is detached, those rows are
+    re-inserted through "Log" into the new partition and it is attached
+    again, all in the caller's transaction.
+    """
+    bounds = {"start": month, "end": next_month(month)}
+    create = text(
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(month)}" PARTITION OF "Log" '
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+    )
+    stranded = session.execute(text(
+        f'SELECT EXISTS (SELECT 1 FROM "{DEFAULT_PARTITION}" '
+        "WHERE entry_creation_time >= :start AND entry_creation_time < :end)"
+    ), bounds).scalar() if has_default_partition(session) else False
+    if not stranded:
+        session.execute(create)
+        return
+    session.execute(text(f'ALTER TABLE "Log" DETACH PARTITION "{DEFAULT_PARTITION}"'))
+    session.execute(create)
+    session.execute(text(
+        f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" '
+        "WHERE entry_creation_time >= :start AND entry_creation_time < :end RETURNING *) "
+        'INSERT INTO "Log" OVERRIDING SYSTEM VALUE SELECT * FROM moved'
+    ), bounds)
+    session.execute(text(f'ALTER TABLE "Log" ATTACH PARTITION "{DEFAULT_PARTITION}" DEFAULT'))
+    logger.info("Moved rows of %s out of %s", partition_name(month), DEFAULT_PARTITION)
+
+def create_default_partition(session: Session):
+    # Catches rows outside every monthly range (e.g. a device with a wrong clock)
+    session.execute(text(f'CREATE TABLE IF NOT EXISTS "{DEFAULT_PARTITION}" PARTITION OF "Log" DEFAULT'))
+
+def ensure_partitions(session: Session, months_ahead: int = LOG_PARTITION_MONTHS_AHEAD, today: date = None) -> list:
+    """Create the partitions for the current month and `months_ahead` months after it."""
+    month = month_start(today or datetime.now(timezone.utc))
+    create_default_partition(session)
+    created = []
+    for _ in range(months_ahead + 1):
+        create_partition(session, month)
+        created.append(partition_name(month))
+        month = next_month(month)
+    session.commit()
+    return created
+
+def apply_retention(session: Session, days: int = LOG_RETENTION_DAYS, mode: str = LOG_RETENTION_MODE, today: date = None) -> list:
+    """Drop or archive every partition whose whole month is older than `days`.
+
+    Archiving detaches the partition and moves it to the log_archive
+    schema, where it can be exported and dropped later. Rows of
+    "Log_default" older than the cutoff are deleted, or moved to
+    log_archive."Log_default" when archiving.
+    """
+    if days <= 0:
+        return []
+    cutoff = (today or datetime.now(timezone.utc).date()) - timedelta(days=days)
+    expired = [name for month, name in list_partitions(session) if next_month(month) <= cutoff]
+    if mode != "drop":
+        session.execute(text(f'CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}'))
+    for name in expired:
+        session.execute(text(f'ALTER TABLE "Log" DETACH PARTITION "{name}"'))
+        if mode == "drop":
+            session.execute(text(f'DROP TABLE "{name}"'))
+        else:
+            session.execute(text(f'ALTER TABLE "{name}" SET SCHEMA {ARCHIVE_SCHEMA}'))
+    if has_default_partition(session) and _expire_default_rows(session, cutoff, mode):
+        expired.append(DEFAULT_PARTITION)
+    session.commit()
+    return expired
+
+def _expire_default_rows(session: Session, cutoff: date, mode: str) -> int:
+    """Delete (or archive) the rows of "Log_default" older than `cutoff`; returns how many."""
+    expired_rows = f'DELETE FROM "{DEFAULT_PARTITION}" WHERE entry_creation_time < :cutoff'
+    if mode == "drop":
+        return session.execute(text(expired_rows), {"cutoff": cutoff}).rowcount
+    archive = f'{ARCHIVE_SCHEMA}."{DEFAULT_PARTITION}"'
+    session.execute(text(f'CREATE TABLE IF NOT EXISTS {archive} (LIKE "Log")'))
+    return session.execute(text(
+        f"WITH moved AS ({expired_rows} RETURNING *), archived AS (INSERT INTO {archive} SELECT * FROM moved RETURNING 1) "
+        "SELECT count(*) FROM archived"
+    ), {"cutoff": cutoff}).scalar()
+
+def migrate_to_partitioned(session: Session, months_ahead: int = LOG_PARTITION_MONTHS_AHEAD):
+    """Convert the plain Log table into a monthly-partitioned one, keeping ids."""
+    if is_partitioned(session):
+        logger.info("Log is already partitioned")
+        return
+
+    session.execute(text(f'ALTER TABLE "Log" RENAME TO "{LEGACY_TABLE}"'))
+    for index in ("ix_log_plant_id_id", "ix_log_plant_id_entry_creation_time"):
+        session.execute(text(f"ALTER INDEX IF EXISTS {index} RENAME TO {index}_legacy"))
+
+    session.execute(text(
+        f'CREATE TABLE "Log" (LIKE "{LEGACY_TABLE}" INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS) '
+        "PARTITION BY RANGE (entry_creation_time)"
+    ))
+    # The partition key must be part of the primary key; the legacy table keeps "Log_pkey"
+    session.execute(text('ALTER TABLE "Log" ADD CONSTRAINT "Log_partitioned_pkey" PRIMARY KEY (id, entry_creation_time)'))
+    session.execute(text('ALTER TABLE "Log" ADD FOREIGN KEY (plant_id) REFERENCES "Plant" (id)'))
+    session.execute(text('CREATE INDEX ix_log_plant_id_id ON "Log" (plant_id, id)'))
+    session.execute(text('CREATE INDEX ix_log_plant_id_entry_creation_time ON "Log" (plant_id, entry_creation_time)'))
+    # A serial id shares the legacy sequence: keep it alive when the legacy table is dropped
+    session.execute(text(
+        f"""DO $$ DECLARE seq text := pg_get_serial_sequence('"{LEGACY_TABLE}"', 'id');
+        BEGIN IF seq IS NOT NULL THEN EXECUTE format('ALTER SEQUENCE %s OWNED BY "Log".id', seq); END IF; END $$"""
+    ))
+    create_default_partition(session)
+
+    first, last = session.execute(text(
+        f'SELECT min(entry_creation_time), max(entry_creation_time) FROM "{LEGACY_TABLE}"'
+    )).one()
+    month = month_start(first) if first is not None else month_start(datetime.now(timezone.utc))
+    last_month = max(month_start(last) if last is not None else month, month_start(datetime.now(timezone.utc)))
+    while month <= last_month:
+        create_partition(session, month)
+        session.execute(text(
+            f'INSERT INTO "Log" OVERRIDING SYSTEM VALUE SELECT * FROM "{LEGACY_TABLE}" '
+            "WHERE entry_creation_time >= :start AND entry_creation_time < :end"
+        ), {"start": month, "end": next_month(month)})
+        month = next_month(month)
+    # An identity id gets a fresh sequence: move it past the copied ids
+    session.execute(text(
+        """SELECT setval(pg_get_serial_sequence('"Log"', 'id'), max(id)) FROM "Log" HAVING max(id) IS NOT NULL"""
+    ))
+    session.commit()
+    ensure_partitions(session, months_ahead)
+
+
+class PartitionMaintainer:
+    """Background thread that creates upcoming partitions and applies retention."""
+
+    def __init__(self, session_factory=SessionLocal, interval: float = LOG_PARTITION_MAINTENANCE_SECONDS):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def maintain_once(self):
+        with self.session_factory() as session:
+            if not is_partitioned(session):
+                logger.warning("Log is not partitioned; run 'python -m services.log_partitions migrate'")
+                return
+            try:
+                ensure_partitions(session)
+            except Exception as e:
+                # Retention still runs: it does not depend on the upcoming partitions
+                session.rollback()
+                logger.error("Failed to create Log partitions: %s", e)
+            expired = apply_retention(session)
+            if expired:
+                logger.info("Retention applied to Log partitions: %s", ", ".join(expired))
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.maintain_once()
+            except Exception as e:
+                logger.error("Failed to maintain Log partitions: %s", e)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="log-partitions", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+
+partition_maintainer = PartitionMaintainer()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage Log table partitions.")
+    parser.add_argument("command", choices=("migrate", "maintain"))
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    init_engines()
+    if args.command == "migrate":
+        with SessionLocal() as session:
+            migrate_to_partitioned(session)
+        print("Log table migrated to monthly partitions")
+    else:
+        partition_maintainer.maintain_once()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+from datetime import datetime
+from sqlalchemy import select, func, DateTime
+from sqlalchemy.orm import Session
+from models.schema import Log
+from utils.request_validation import as_utc, validate_time_window
+from services.rollup_service import LOG_ROLLUPS, choose_rollup, rollup_series_select, rollup_watermark
+
+# Log columns aggregated in every bucket
+SERIES_COLUMNS = ("temperature", "luminosity_state", "humidity_state")
+
+def log_series_select(plant_id: int, start: datetime, end: datetime, bucket: str, limit: int, cursor: datetime = None):
+    """Aggregate Log rows of a plant into min/avg/max per time bucket.
+
+    The range filter on (plant_id, entry_creation_time) is served by
+    ix_log_plant_id_entry_creation_time. `cursor` is the last bucket of the
+    previous page (keyset pagination).
+    """
+    bucket_start = func.date_trunc(bucket, Log.entry_creation_time, type_=DateTime).label("bucket")
+    aggregates = []
+    for name in SERIES_COLUMNS:
+        column = getattr(Log, name)
+        aggregates += [
+            func.min(column).label(f"{name}_min"),
+            func.avg(column).label(f"{name}_avg"),
+            func.max(column).label(f"{name}_max"),
+        ]
+
+    stmt = (
+        select(bucket_start, func.count().label("count"), *aggregates)
+        .where(
+            Log.plant_id == plant_id,
+            Log.entry_creation_time >= start,
+            Log.entry_creation_time < end,
+        )
+        .group_by(bucket_start)
+        .order_by(bucket_start)
+        .limit(limit)
+    )
+    if cursor is not None:
+        # Rows of later buckets are all after the cursor, so this bound also prunes the index scan
+        stmt = stmt.where(Log.entry_creation_time > cursor, bucket_start > cursor)
+    return stmt
+
+def get_log_series(session: Session, plant_id: int, start: datetime, end: datetime, bucket: str,
+                   limit: int, cursor: datetime = None) -> dict:
+    start, end, cursor = as_utc(start), as_utc(end), as_utc(cursor)
+    validate_time_window(start, end, bucket)
+    rollup = choose_rollup(start, end, bucket) if LOG_ROLLUPS else None
+    if rollup is not None:
+        # Pre-aggregated up to the watermark, plus the Log rows written since
+        stmt = rollup_series_select(rollup, plant_id, start, end, bucket, limit + 1, cursor, rollup_watermark(session))
+    else:
+        stmt = log_series_select(plant_id, start, end, bucket, limit + 1, cursor)
+    rows = session.execute(stmt).mappings().all()
+    page = rows[:limit]
+    return {
+        "plant_id": plant_id,
+        "bucket": bucket,
+        "source": f"{rollup.__tablename__}+Log" if rollup is not None else "Log",
+        "series": [dict(row) for row in page],
+        "next_cursor": page[-1]["bucket"] if len(rows) > limit else None,
+    }
@@ -1,184 +1,260 @@
+import logging
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, insert, func, literal, union_all
 from datetime import datetime, timezone
 from models.schema import Log, PlantState, PlantEvent, IotDevState, IotDevEvent, Plant
+from services.log_buffer import log_buffer, LOG_WRITE_BEHIND
+from services.topology_cache import topology_cache, TOPOLOGY_CACHE
+from services.state_cache import state_cache, STATE_CACHE
+from services.log_debounce import LogDebouncer, LOG_DEBOUNCE_MS
+from utils.db import SessionLocal
+from utils.metrics import stage_timer
 
-def insert_new_log_plant(session: Session, plant_id: int):
-    try:
-        # Get the current time
-        now = datetime.now(timezone.utc)
-
-        # Fetch the last temperature value from the Log table
-        last_temperature = session.execute(
-            select(Log.temperature)
-            .where(Log.plant_id == plant_id)
-            .order_by(Log.id.desc())
-            .limit(1)  # Ensure only one result is returned
-        ).scalar_one_or_none()
-        print(f"Last temperature for plant ID {plant_id}: {last_temperature}")  
-        
-        # Fetch the PlantState values for the given plant_id
-        plant_state = session.execute(
-            select(
-                PlantState.luminosity_state,
-                PlantState.humidity_state,
-                PlantState.valve_state,
-                PlantState.led_intensity_state,
-                PlantState.mode
-            ).where(PlantState.id == session.execute(
-                select(Plant.plant_state_id).where(Plant.id == plant_id).limit(1)
-            ).scalar_one())
-        ).first()
-        
-        print(f"Plant state for plant ID {plant_id}: {plant_state}")
-
-        # Fetch the PlantEvent values for the given plant_id
-        plant_event = session.execute(
-            select(
-                PlantEvent.luminosity_event,
-                PlantEvent.humidity_event,
-                PlantEvent.valve_event,
-                PlantEvent.led_intensity_event, 
-                PlantEvent.mode
-            ).where(PlantEvent.id == session.execute(
-                select(Plant.plant_event_id).where(Plant.id == plant_id).limit(1)
-            ).scalar_one())
-        ).first()
-
-        print(f"Plant event for plant ID {plant_id}: {plant_event}")
-        
-        # Fetch the IotDevState values for the IoT device associated with the plant
-        iot_dev_state = session.execute(
-            select(IotDevState.pump_state)
-            .where(IotDevState.id == session.execute(
-                select(Plant.iot_dev_id).where(Plant.id == plant_id).limit(1)
-            ).scalar_one())
-        ).scalar_one_or_none()
-
-        print(f"IoT device state for plant ID {plant_id}: {iot_dev_state}")
-        
-        # Fetch the IotDevEvent values for the IoT device associated with the plant
-        iot_dev_event = session.execute(
-            select(IotDevEvent.pump_event)
-            .where(IotDevEvent.id == session.execute(
-                select(Plant.iot_dev_id).where(Plant.id == plant_id).limit(1)
-            ).scalar_one())
-        ).scalar_one_or_none()
-        print(f"IoT device event for plant ID {plant_id}: {iot_dev_event}")
-        
-        # Insert the new log entry
-        new_log = Log(
-            entry_creation_time=now,
-            entry_store_time=now,
-            temperature=last_temperature if last_temperature is not None else 0.0,
-            luminosity_state=plant_state.luminosity_state,
-            humidity_state=plant_state.humidity_state,
-            valve_state=plant_state.valve_state,
-            led_intensity_state=plant_state.led_intensity_state,
-            luminosity_event=plant_event.luminosity_event,
-            humidity_event=plant_event.humidity_event,
-            valve_event=plant_event.valve_event,
-            led_intensity_event=plant_event.led_intensity_event,
-            pump_state=iot_dev_state,
-            pump_event=iot_dev_event,
-            plant_id=plant_id,
-            mode_event=plant_event.mode,
-            mode_state=plant_state.mode
+logger = logging.getLogger(__name__)
+
+# Columns written by every log snapshot, in the same order as the SELECT below
+LOG_SNAPSHOT_COLUMNS = [
+    "entry_creation_time",
+    "entry_store_time",
+    "temperature",
+    "luminosity_state",
+    "humidity_state",
+    "valve_state",
+    "led_intensity_state",
+    "luminosity_event",
+    "humidity_event",
+    "valve_event",
+    "led_intensity_event",
+    "pump_state",
+    "pump_event",
+    "plant_id",
+    "mode_event",
+    "mode_state",
+]
+
+def log_snapshot_select(plant_id: int, iot_dev_id: int = None, now: datetime = None, topology=None):
+    """Build the SELECT that gathers a full Log row for a plant in one query.
+
+    The plant's state and event come through the Plant row, or straight from
+    the ids in `topology` (a cached PlantTopology) when one is given. The
+    pump values come from `iot_dev_id` when given, otherwise from the
+    plant's own `iot_dev_id` (matching how the log was built before). The
+    last temperature is read with a correlated subquery on the Log table.
+    """
+    now = now or datetime.now(timezone.utc)
+    if iot_dev_id is not None:
+        dev_id = literal(iot_dev_id)
+    elif topology is not None:
+        dev_id = literal(topology.iot_dev_id)
+    else:
+        dev_id = Plant.iot_dev_id
+    plant_ref = literal(plant_id) if topology is not None else Plant.id
+    columns = _log_snapshot_columns(plant_ref, now)
+
+    if topology is not None:
+        # Ids already known: read the four rows by primary key, no Plant lookup
+        return (
+            columns
+            .select_from(PlantState)
+            .join(PlantEvent, PlantEvent.id == topology.plant_event_id)
+            .join(IotDevState, IotDevState.id == dev_id)
+            .join(IotDevEvent, IotDevEvent.id == dev_id)
+            .where(PlantState.id == topology.plant_state_id)
         )
 
-        session.add(new_log)
+    return _join_plant_rows(columns, dev_id).where(Plant.id == plant_id)
+
+def _log_snapshot_columns(plant_ref, now: datetime):
+    last_temperature = (
+        select(Log.temperature)
+        .where(Log.plant_id == plant_ref)
+        .order_by(Log.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    return select(
+        literal(now).label("entry_creation_time"),
+        literal(now).label("entry_store_time"),
+        func.coalesce(last_temperature, 0.0).label("temperature"),
+        PlantState.luminosity_state,
+        PlantState.humidity_state,
+        PlantState.valve_state,
+        PlantState.led_intensity_state,
+        PlantEvent.luminosity_event,
+        PlantEvent.humidity_event,
+        PlantEvent.valve_event,
+        PlantEvent.led_intensity_event,
+        IotDevState.pump_state,
+        IotDevEvent.pump_event,
+        plant_ref.label("plant_id"),
+        PlantEvent.mode.label("mode_event"),
+        PlantState.mode.label("mode_state"),
+    )
+
+def _join_plant_rows(columns, dev_id):
+    return (
+        columns
+        .select_from(Plant)
+        .join(PlantState, PlantState.id == Plant.plant_state_id)
+        .join(PlantEvent, PlantEvent.id == Plant.plant_event_id)
+        .join(IotDevState, IotDevState.id == dev_id)
+        .join(IotDevEvent, IotDevEvent.id == dev_id)
+    )
+
+def plants_log_insert(plant_ids: list):
+    """One INSERT ... SELECT writing a log row for every plant in `plant_ids`.
+
+    Each row takes the pump values of the plant's own device, as
+    insert_new_log_plant does.
+    """
+    snapshot = _join_plant_rows(_log_snapshot_columns(Plant.id, datetime.now(timezone.utc)), Plant.iot_dev_id)
+    return insert(Log).from_select(LOG_SNAPSHOT_COLUMNS, snapshot.where(Plant.id.in_(plant_ids)))
+
+def _log_snapshot_insert(snapshot):
+    # INSERT ... SELECT: the snapshot is read and written in a single round trip
+    return insert(Log).from_select(LOG_SNAPSHOT_COLUMNS, snapshot)
+
+def log_snapshots_insert(snapshots: list):
+    """Build one multi-row INSERT ... SELECT for a list of (plant_id, iot_dev_id) pairs."""
+    now = datetime.now(timezone.utc)
+    selects = [log_snapshot_select(plant_id, iot_dev_id, now) for plant_id, iot_dev_id in snapshots]
+    source = selects[0] if len(selects) == 1 else union_all(*selects)
+    return insert(Log).from_select(LOG_SNAPSHOT_COLUMNS, source)
+
+def log_snapshots_found(snapshots: list):
+    """SELECT of the indexes of the (plant_id, iot_dev_id) pairs that have a complete snapshot."""
+    now = datetime.now(timezone.utc)
+    selects = [
+        select(literal(index).label("index")).select_from(log_snapshot_select(plant_id, iot_dev_id, now).subquery())
+        for index, (plant_id, iot_dev_id) in enumerate(snapshots)
+    ]
+    return selects[0] if len(selects) == 1 else union_all(*selects)
+
+def _check_log_inserted(result, plant_id: int):
+    if result.rowcount == 0:
+        raise ValueError(f"No plant/device snapshot found for plant ID {plant_id}")
+
+def _check_log_snapshot(row, plant_id: int):
+    if row is None:
+        raise ValueError(f"No plant/device snapshot found for plant ID {plant_id}")
+    return dict(row)
+
+def _cached_topology(topology, plant_id: int):
+    if topology is None:
+        raise ValueError(f"No plant/device snapshot found for plant ID {plant_id}")
+    return topology
+
+def _insert_log_snapshot(session: Session, plant_id: int, iot_dev_id: int = None):
+    topology = None
+    if TOPOLOGY_CACHE or STATE_CACHE:
+        topology = _cached_topology(topology_cache.get(session, plant_id), plant_id)
+    row = state_cache.log_row(topology, plant_id, iot_dev_id) if STATE_CACHE else None
+    if row is not None:
+        # Built from the state cache: only the INSERT reaches the database
+        if LOG_WRITE_BEHIND:
+            log_buffer.enqueue(row)
+        else:
+            session.execute(insert(Log).values(row))
+        return
+
+    snapshot = log_snapshot_select(plant_id, iot_dev_id, topology=topology)
+    if LOG_WRITE_BEHIND:
+        # Read the snapshot now, let the buffer write it in bulk later
+        row = session.execute(snapshot).mappings().first()
+        log_buffer.enqueue(_check_log_snapshot(row, plant_id))
+        return
+    result = session.execute(_log_snapshot_insert(snapshot))
+    _check_log_inserted(result, plant_id)
+
+def _write_debounced_log(plant_id: int, iot_dev_id: int = None):
+    with SessionLocal() as session:
+        _insert_log_snapshot(session, plant_id, iot_dev_id)
         session.commit()
-        print(f"New log entry created for plant ID {plant_id}")
+    logger.debug("New log entry %s for plant ID %s", "queued" if LOG_WRITE_BEHIND else "created", plant_id, extra={"plant_id": plant_id})
+
+log_debouncer = LogDebouncer(_write_debounced_log)
+
+def insert_new_log_plant(session: Session, plant_id: int):
+    if LOG_DEBOUNCE_MS:
+        log_debouncer.schedule(plant_id)
+        return
+    try:
+        with stage_timer("log_snapshot"):
+            _insert_log_snapshot(session, plant_id)
+        with stage_timer("log_commit"):
+            session.commit()
+        logger.debug("New log entry %s for plant ID %s", "queued" if LOG_WRITE_BEHIND else "created", plant_id, extra={"plant_id": plant_id})
 
     except Exception as e:
         session.rollback()
-        print(f"Failed to insert new log entry: {e}")
+        logger.error("Failed to insert new log entry for plant ID %s: %s", plant_id, e, extra={"plant_id": plant_id})
         raise
-    
+
 def insert_new_log_iotDev(session: Session, iot_dev_id: int = None, plant_id: int = 1):
+    if LOG_DEBOUNCE_MS:
+        log_debouncer.schedule(plant_id, iot_dev_id)
+        return
     try:
-        # Get the current time
-        now = datetime.now(timezone.utc)
-
-        # Fetch the last temperature value from the Log table
-        last_temperature = session.execute(
-            select(Log.temperature)
-            .where(Log.plant_id == plant_id)
-            .order_by(Log.id.desc())
-            .limit(1)  # Ensure only one result is returned
-        ).scalar_one_or_none()
-        print(f"Last temperature for plant ID {plant_id}: {last_temperature}")  
-        
-        # Fetch the PlantState values for the given plant_id
-        plant_state = session.execute(
-            select(
-                PlantState.luminosity_state,
-                PlantState.humidity_state,
-                PlantState.valve_state,
-                PlantState.led_intensity_state,
-                PlantState.mode
-            ).where(PlantState.id == session.execute(
-                select(Plant.plant_state_id).where(Plant.id == plant_id).limit(1)
-            ).scalar_one())
-        ).first()
-        
-        print(f"Plant state for plant ID {plant_id}: {plant_state}")
-
-        # Fetch the PlantEvent values for the given plant_id
-        plant_event = session.execute(
-            select(
-                PlantEvent.luminosity_event,
-                PlantEvent.humidity_event,
-                PlantEvent.valve_event,
-                PlantEvent.led_intensity_event,
-                PlantEvent.mode
-            ).where(PlantEvent.id == session.execute(
-                select(Plant.plant_event_id).where(Plant.id == plant_id).limit(1)
-            ).scalar_one())
-        ).first()
-
-        print(f"Plant event for plant ID {plant_id}: {plant_event}")
-        
-        # Fetch the IotDevState values for the IoT device from id
-        iot_dev_state = session.execute(
-            select(IotDevState.pump_state)
-            .where(IotDevState.id == iot_dev_id)
-        ).scalar_one_or_none()
-
-        print(f"IoT device state ID {plant_id}: {iot_dev_state}")
-        
-        # Fetch the IotDevEvent values for the IoT device from id
-        iot_dev_event = session.execute(
-            select(IotDevEvent.pump_event)
-            .where(IotDevEvent.id == iot_dev_id)
-        ).scalar_one_or_none()
-        print(f"IoT device event ID {plant_id}: {iot_dev_event}")
-        
-        # Insert the new log entry
-        new_log = Log(
-            entry_creation_time=now,
-            entry_store_time=now,
-            temperature=last_temperature if last_temperature is not None else 0.0,
-            luminosity_state=plant_state.luminosity_state,
-            humidity_state=plant_state.humidity_state,
-            valve_state=plant_state.valve_state,
-            led_intensity_state=plant_state.led_intensity_state,
-            luminosity_event=plant_event.luminosity_event,
-            humidity_event=plant_event.humidity_event,
-            valve_event=plant_event.valve_event,
-            led_intensity_event=plant_event.led_intensity_event,
-            pump_state=iot_dev_state,
-            pump_event=iot_dev_event,
-            plant_id=plant_id,
-            mode_event=plant_event.mode,
-            mode_state=plant_state.mode
-        )
-
-        session.add(new_log)
-        session.commit()
-        print(f"New log entry created for plant ID {plant_id}")
+        with stage_timer("log_snapshot"):
+            _insert_log_snapshot(session, plant_id, iot_dev_id)
+        with stage_timer("log_commit"):
+            session.commit()
+        logger.debug("New log entry %s for plant ID %s", "queued" if LOG_WRITE_BEHIND else "created", plant_id, extra={"plant_id": plant_id})
 
     except Exception as e:
         session.rollback()
-        print(f"Failed to insert new log entry: {e}")
-        raise
\ No newline at end of file
+        logger.error("Failed to insert new log entry for plant ID %s: %s", plant_id, e, extra={"plant_id": plant_id})
+        raise
+
+async def _insert_log_snapshot_async(session: AsyncSession, plant_id: int, iot_dev_id: int = None):
+    topology = None
+    if TOPOLOGY_CACHE or STATE_CACHE:
+        topology = _cached_topology(await topology_cache.get_async(session, plant_id), plant_id)
+    row = state_cache.log_row(topology, plant_id, iot_dev_id) if STATE_CACHE else None
+    if row is not None:
+        if LOG_WRITE_BEHIND:
+            await log_buffer.enqueue_async(row)
+        else:
+            await session.execute(insert(Log).values(row))
+        return
+
+    snapshot = log_snapshot_select(plant_id, iot_dev_id, topology=topology)
+    if LOG_WRITE_BEHIND:
+        row = (await session.execute(snapshot)).mappings().first()
+        await log_buffer.enqueue_async(_check_log_snapshot(row, plant_id))
+        return
+    result = await session.execute(_log_snapshot_insert(snapshot))
+    _check_log_inserted(result, plant_id)
+
+async def insert_new_log_plant_async(session: AsyncSession, plant_id: int):
+    if LOG_DEBOUNCE_MS:
+        log_debouncer.schedule(plant_id)
+        return
+    try:
+        with stage_timer("log_snapshot"):
+            await _insert_log_snapshot_async(session, plant_id)
+        with stage_timer("log_commit"):
+            await session.commit()
+        logger.debug("New log entry %s for plant ID %s", "queued" if LOG_WRITE_BEHIND else "created", plant_id, extra={"plant_id": plant_id})
+
+    except Exception as e:
+        await session.rollback()
+        logger.error("Failed to insert new log entry for plant ID %s: %s", plant_id, e, extra={"plant_id": plant_id})
+        raise
+
+async def insert_new_log_iotDev_async(session: AsyncSession, iot_dev_id: int = None, plant_id: int = 1):
+    if LOG_DEBOUNCE_MS:
+        log_debouncer.schedule(plant_id, iot_dev_id)
+        return
+    try:
+        with stage_timer("log_snapshot"):
+            await _insert_log_snapshot_async(session, plant_id, iot_dev_id)
+        with stage_timer("log_commit"):
+            await session.commit()
+        logger.debug("New log entry %s for plant ID %s", "queued" if LOG_WRITE_BEHIND else "created", plant_id, extra={"plant_id": plant_id})
+
+    except Exception as e:
+        await session.rollback()
+        logger.error("Failed to insert new log entry for plant ID %s: %s", plant_id, e, extra={"plant_id": plant_id})
+        raise
@@ -0,0 +1,270 @@
+"""MQTT front-end for the event services.
+
+Subscribes to
+
+    {prefix}/plant/{plant_id}/{luminosity|humidity|valve|led|mode}
+    {prefix}/device/{iot_dev_id}/pump
+
+with the new value as payload (`42.5`, `true`, `3`, or any JSON value) and
+applies the messages in micro-batches through services.batch_service, so
+they get the same validation, merging, log rows and push events as
+POST /events/batch. Runs inside the API (mqtt_ingest=true) or on its own:
+
+    python -m services.mqtt_ingest
+"""
+import json
+import logging
+import os
+import queue
+import threading
+from time import monotonic
+from fastapi import HTTPException
+from pydantic import ValidationError
+from models.batchModels import BatchEventItem
+from services.batch_service import apply_event_batch
+from services.event_journal import event_journal, EVENT_JOURNAL, DATABASE_UNAVAILABLE
+from utils.db import SessionLocal, init_engines
+from utils.log_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# MQTT ingestion settings
+MQTT_INGEST = os.getenv("mqtt_ingest", "false").lower() == "true"
+MQTT_HOST = os.getenv("mqtt_host", "localhost")
+MQTT_PORT = int(os.getenv("mqtt_port", 1883))
+MQTT_USERNAME = os.getenv("mqtt_username")
+MQTT_PASSWORD = os.getenv("mqtt_password")
+MQTT_TLS = os.getenv("mqtt_tls", "false").lower() == "true"
+MQTT_TOPIC_PREFIX = os.getenv("mqtt_topic_prefix", "greenhouse")
+MQTT_QOS = int(os.getenv("mqtt_qos", 1))
+MQTT_BATCH_SIZE = int(os.getenv("mqtt_batch_size", 200))
+MQTT_BATCH_INTERVAL_MS = int(os.getenv("mqtt_batch_interval_ms", 100))
+MQTT_QUEUE_SIZE = int(os.getenv("mqtt_queue_size", 10000))
+
+# Topic suffix -> BatchEventItem field
+PLANT_TOPIC_FIELDS = {
+    "luminosity": "luminosity_event",
+    "humidity": "humidity_event",
+    "valve": "valve_event",
+    "led": "led_intensity_event",
+    "mode": "mode",
+}
+DEVICE_TOPIC_FIELDS = {"pump": "pump_event"}
+
+
+def parse_message(topic: str, payload: bytes, prefix: str = MQTT_TOPIC_PREFIX) -> BatchEventItem:
+    """Turn one MQTT message into a batch item; raises ValueError for unknown topics or payloads."""
+    parts = topic.split("/")
+    if len(parts) != 4 or parts[0] != prefix or not parts[2].isdigit():
+        raise ValueError(f"Unexpected topic {topic}")
+    kind, entity_id, name = parts[1], int(parts[2]), parts[3]
+    if kind == "plant" and name in PLANT_TOPIC_FIELDS:
+        item = {"type": "plant", "plant_id": entity_id}
+        field = PLANT_TOPIC_FIELDS[name]
+    elif kind == "device" and name in DEVICE_TOPIC_FIELDS:
+        item = {"type": "pump", "iot_dev_id": entity_id}
+        field = DEVICE_TOPIC_FIELDS[name]
+    else:
+        raise ValueError(f"Unexpected topic {topic}")
+
+    text = payload.decode("utf-8").strip()
+    try:
+        item[field] = json.loads(text)
+    except ValueError:
+        item[field] = text
+    try:
+        return BatchEventItem(**item)
+    except ValidationError as e:
+        raise ValueError(f"Invalid payload {text!r} on {topic}: {e.errors()[0]['msg']}")
+
+
+class MqttIngestor:
+    """Queue MQTT messages and apply them in micro-batches from a worker thread.
+
+    A batch is applied every `batch_interval_ms` or as soon as `batch_size`
+    messages are waiting. `handle_message` is the MQTT callback entry point,
+    so the ingestor can be driven without a broker.
+    """
+
+    def __init__(self, session_factory=SessionLocal, batch_size: int = MQTT_BATCH_SIZE,
+                 batch_interval_ms: int = MQTT_BATCH_INTERVAL_MS, queue_size: int = MQTT_QUEUE_SIZE,
+                 prefix: str = MQTT_TOPIC_PREFIX):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval_ms / 1000
+        self.prefix = prefix
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stopping = threading.Event()
+        self._thread = None
+        self._client = None
+
+        self.received = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.applied = 0
+        self.journaled = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.lost = 0  # messages acknowledged to the broker but never applied
+
+    def handle_message(self, topic: str, payload: bytes):
+        try:
+            item = parse_message(topic, payload, self.prefix)
+        except ValueError as e:
+            self.rejected += 1
+            logger.warning("Rejected MQTT message: %s", e)
+            return
+        try:
+            self._queue.put_nowait(item)
+            self.received += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def _next_batch(self) -> list:
+        try:
+            items = [self._queue.get(timeout=self.batch_interval)]
+        except queue.Empty:
+            return []
+        deadline = monotonic() + self.batch_interval
+        while len(items) < self.batch_size:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _journal(self, items: list) -> bool:
+        try:
+            event_journal.append(items)
+        except HTTPException:
+            return False
+        self.journaled += len(items)
+        return True
+
+    def _apply_batch(self, items: list):
+        with self.session_factory() as session:
+            results = apply_event_batch(session, items)
+        for result in results:
+            if result["status_code"] == 200:
+                self.applied += 1
+            else:
+                self.rejected += 1
+                logger.warning("Rejected MQTT message: %s", result["detail"])
+
+    def _unavailable(self, items: list, error: Exception):
+        """Journal messages the database could not take, or count them lost."""
+        if EVENT_JOURNAL and self._journal(items):
+            logger.warning("Database unavailable, journaled MQTT batch of %s messages: %s", len(items), error)
+            return
+        # QoS 1 messages are acknowledged on receipt, so the broker will not redeliver them
+        self.lost += len(items)
+        logger.error("Failed to apply MQTT batch of %s messages, dropping them: %s", len(items), error)
+
+    def apply(self, items: list):
+        """Apply one micro-batch; item errors are reported, not raised.
+
+        A batch that fails for a reason other than DATABASE_UNAVAILABLE is
+        applied again message by message, so only the messages that still
+        fail are dropped.
+        """
+        # Keep the order of events already waiting in the journal
+        if EVENT_JOURNAL and event_journal.has_backlog() and self._journal(items):
+            return
+        try:
+            self._apply_batch(items)
+        except DATABASE_UNAVAILABLE as e:
+            self.failed_batches += 1
+            self._unavailable(items, e)
+            return
+        except Exception as e:
+            self.failed_batches += 1
+            logger.warning("Applying a failed MQTT batch of %s messages one by one: %s", len(items), e)
+            for index, item in enumerate(items):
+                try:
+                    self._apply_batch([item])
+                except DATABASE_UNAVAILABLE as e:
+                    self._unavailable(items[index:], e)
+                    return
+                except Exception as e:
+                    self.lost += 1
+                    logger.error("Dropped MQTT message %s: %s", item.model_dump(exclude_none=True), e)
+            return
+        self.batches += 1
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            items = self._next_batch()
+            if items:
+                self.apply(items)
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties=None):
+        # Subscriptions are renewed on every reconnect
+        client.subscribe([(f"{self.prefix}/plant/+/+", MQTT_QOS), (f"{self.prefix}/device/+/+", MQTT_QOS)])
+        logger.info("Connected to MQTT broker %s:%s", MQTT_HOST, MQTT_PORT)
+
+    def _on_message(self, client, userdata, message):
+        self.handle_message(message.topic, message.payload)
+
+    def connect(self):
+        import paho.mqtt.client as mqtt
+
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        if MQTT_USERNAME:
+            client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
+        if MQTT_TLS:
+            client.tls_set()
+        client.on_connect = self._on_connect
+        client.on_message = self._on_message
+        client.connect_async(MQTT_HOST, MQTT_PORT)
+        client.loop_start()
+        self._client = client
+
+    def start(self, connect: bool = True):
+        if connect and self._client is None:
+            self.connect()
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="mqtt-ingest", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = None):
+        """Disconnect from the broker and apply every queued message."""
+        if self._client is not None:
+            self._client.loop_stop()
+            self._client.disconnect()
+            self._client = None
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": MQTT_INGEST,
+            "connected": self._client is not None and self._client.is_connected(),
+            "queued": self._queue.qsize(),
+            "received": self.received,
+            "applied": self.applied,
+            "journaled": self.journaled,
+            "rejected": self.rejected,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "lost": self.lost,
+        }
+
+
+mqtt_ingestor = MqttIngestor()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    init_engines()
+    mqtt_ingestor.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        mqtt_ingestor.stop()
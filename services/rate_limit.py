@@ -0,0 +1,289 @@
+"""Admission control for event writes: per-device and per-client rate limits plus a concurrency cap.
+
+Every PUT/POST under /events is checked before it reaches a handler (and
+a database connection):
+
+- At most `rate_limit_max_concurrent` writes run at once in a worker. The
+  default is the worker's pool capacity (db_pool_size + db_max_overflow),
+  so a request that would only wait for a connection is turned away instead.
+- Each plant_id / iot_dev_id in the body gets `rate_limit_device_rate`
+  updates per second, with bursts of `rate_limit_device_burst`.
+- Each client address gets `rate_limit_client_rate` requests per second,
+  with bursts of `rate_limit_client_burst`.
+
+Rejected requests get a 429 with Retry-After straight away. Buckets use
+GCRA (a token bucket kept as one timestamp per key, the time at which the
+bucket would be full again), so each check is O(1) and each key costs one
+float. A request is charged to its buckets only when all of them admit it.
+Buckets are kept in memory per worker, at most `rate_limit_max_keys` of
+them. With rate_limit_backend=sqlite they live in the SQLite file
+`rate_limit_path` instead, so the gunicorn workers of a host share them;
+the file is read and written in the threadpool, and requests are admitted
+(fail open) when it cannot be.
+
+The client address is the peer of the connection unless the proxy in front
+is trusted (gunicorn's forwarded_allow_ips), see gunicorn.conf.py.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from math import ceil
+from time import time
+from fastapi import Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from utils.db import DB_POOL, DB_POOL_SIZE, DB_MAX_OVERFLOW
+
+logger = logging.getLogger(__name__)
+
+# Admission control settings
+RATE_LIMIT = os.getenv("rate_limit", "false").lower() == "true"
+RATE_LIMIT_DEVICE_RATE = float(os.getenv("rate_limit_device_rate", 5))
+RATE_LIMIT_DEVICE_BURST = int(os.getenv("rate_limit_device_burst", 10))
+RATE_LIMIT_CLIENT_RATE = float(os.getenv("rate_limit_client_rate", 50))
+RATE_LIMIT_CLIENT_BURST = int(os.getenv("rate_limit_client_burst", 100))
+RATE_LIMIT_MAX_KEYS = int(os.getenv("rate_limit_max_keys", 100000))
+RATE_LIMIT_BACKEND = os.getenv("rate_limit_backend", "memory").lower()  # "memory" or "sqlite"
+RATE_LIMIT_PATH = os.getenv("rate_limit_path", "rate_limit.db")
+# 0 disables the cap; NullPool has no capacity to derive it from
+RATE_LIMIT_MAX_CONCURRENT = int(
+    os.getenv("rate_limit_max_concurrent") or (DB_POOL_SIZE + DB_MAX_OVERFLOW if DB_POOL == "queue" else 0)
+)
+
+# Only writes under these prefixes are admitted through the limiter
+RATE_LIMITED_PATHS = ("/events",)
+
+SQLITE_SCHEMA = "CREATE TABLE IF NOT EXISTS rate_limit (key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID"
+# Seconds between removals of full buckets from the SQLite file
+SQLITE_PRUNE_SECONDS = 10
+
+
+def _gcra(tat, now: float, interval: float, window: float) -> tuple:
+    """The bucket's next `tat` after one more request, and the seconds to wait before it fits (0 when it does)."""
+    tat = max(tat if tat is not None else now, now) + interval
+    return tat, max(0.0, tat - now - window)
+
+
+class MemoryBuckets:
+    """GCRA buckets in a bounded dict; the least recently used key is dropped first."""
+
+    errors = 0  # nothing to fail, unlike SqliteBuckets
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._tat = OrderedDict()  # key -> time at which the bucket is full again
+
+    def acquire(self, limits: list, now: float) -> tuple:
+        """Take one request from every (key, interval, window) bucket, or from none.
+
+        Returns (None, 0) when allowed, otherwise the first full key and
+        the seconds until it would allow the request.
+        """
+        charged = []
+        for key, interval, window in limits:
+            tat, wait = _gcra(self._tat.get(key), now, interval, window)
+            if wait:
+                return key, wait
+            charged.append((key, tat))
+        for key, tat in charged:
+            self._tat[key] = tat
+            self._tat.move_to_end(key)
+        # A dropped key only loses the requests counted against it
+        while len(self._tat) > self.max_keys:
+            self._tat.popitem(last=False)
+        return None, 0.0
+
+    def keys(self) -> int:
+        return len(self._tat)
+
+    def close(self):
+        self._tat.clear()
+
+
+class SqliteBuckets:
+    """GCRA buckets in a SQLite file shared by the workers of a host.
+
+    Buckets that are full again are deleted every SQLITE_PRUNE_SECONDS, and
+    beyond `max_keys` the buckets closest to full go first. Any SQLite error
+    admits the request.
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_PATH, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.path = path
+        self.max_keys = max_keys
+        self._connection = None
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+        self.errors = 0
+
+    def _db(self) -> sqlite3.Connection:
+        # Called with self._lock held
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False, timeout=1, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Buckets are disposable: losing the last writes on a crash only resets some limits
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute(SQLITE_SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _acquire(self, db: sqlite3.Connection, limits: list, now: float) -> tuple:
+        keys = [key for key, _, _ in limits]
+        stored = dict(db.execute(
+            f"SELECT key, tat FROM rate_limit WHERE key IN ({', '.join('?' * len(keys))})", keys
+        ).fetchall())
+        charged = []
+        for key, interval, window in limits:
+            tat, wait = _gcra(stored.get(key), now, interval, window)
+            if wait:
+                return key, wait
+            charged.append((key, tat))
+        db.executemany("INSERT INTO rate_limit (key, tat) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET tat = excluded.tat", charged)
+        if now >= self._next_prune:
+            self._prune(db, now)
+        return None, 0.0
+
+    def _prune(self, db: sqlite3.Connection, now: float):
+        # A bucket whose tat has passed is full: its row holds nothing a missing row would not
+        db.execute("DELETE FROM rate_limit WHERE tat < ?", (now,))
+        excess = db.execute("SELECT count(*) FROM rate_limit").fetchone()[0] - self.max_keys
+        if excess > 0:
+            db.execute("DELETE FROM rate_limit WHERE key IN (SELECT key FROM rate_limit ORDER BY tat LIMIT ?)", (excess,))
+        self._next_prune = now + SQLITE_PRUNE_SECONDS
+
+    def acquire(self, limits: list, now: float) -> tuple:
+        """Same as MemoryBuckets.acquire, in one write transaction. Blocks: call it off the event loop."""
+        try:
+            with self._lock:
+                db = self._db()
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    result = self._acquire(db, limits, now)
+                except BaseException:
+                    if db.in_transaction:
+                        db.execute("ROLLBACK")
+                    raise
+                db.execute("COMMIT")
+                return result
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning("Rate limit buckets unavailable, admitting the request: %s", e)
+            return None, 0.0
+
+    def keys(self) -> int:
+        try:
+            with self._lock:
+                return self._db().execute("SELECT count(*) FROM rate_limit").fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class RateLimiter:
+    """Concurrency cap and per-device/per-client buckets for event writes. Used from the event loop."""
+
+    def __init__(self, backend: str = RATE_LIMIT_BACKEND, max_concurrent: int = RATE_LIMIT_MAX_CONCURRENT,
+                 device_rate: float = RATE_LIMIT_DEVICE_RATE, device_burst: int = RATE_LIMIT_DEVICE_BURST,
+                 client_rate: float = RATE_LIMIT_CLIENT_RATE, client_burst: int = RATE_LIMIT_CLIENT_BURST):
+        self.backend = backend
+        self.buckets = SqliteBuckets() if backend == "sqlite" else MemoryBuckets()
+        self.max_concurrent = max_concurrent
+        # (interval between requests, window a burst may use); rate 0 disables a limit
+        self.device_limit = (1 / device_rate, device_burst / device_rate) if device_rate > 0 else None
+        self.client_limit = (1 / client_rate, client_burst / client_rate) if client_rate > 0 else None
+        self.in_flight = 0
+        self.admitted = 0
+        self.limited = {"concurrency": 0, "device": 0, "client": 0}
+
+    def _reject(self, reason: str, retry_after: float, detail: str) -> JSONResponse:
+        self.limited[reason] += 1
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content={"detail": detail},
+            headers={"Retry-After": str(max(1, ceil(retry_after)))}
+        )
+
+    async def admit(self, client: str, devices: list):
+        """Return a 429 response, or None after counting the request in flight (see release)."""
+        if self.max_concurrent and self.in_flight >= self.max_concurrent:
+            return self._reject("concurrency", 1, "Too many concurrent event writes, retry later.")
+        # Hold the slot while the buckets are checked, so requests admitted meanwhile see it
+        self.in_flight += 1
+        limits = []
+        if self.device_limit is not None:
+            limits += [(device, *self.device_limit) for device in devices]
+        if self.client_limit is not None:
+            limits.append((f"client:{client}", *self.client_limit))
+        if limits:
+            if self.backend == "sqlite":
+                key, wait = await run_in_threadpool(self.buckets.acquire, limits, time())
+            else:
+                key, wait = self.buckets.acquire(limits, time())
+            if key is not None:
+                self.in_flight -= 1
+                if key.startswith("client:"):
+                    return self._reject("client", wait, "Too many requests from this client, retry later.")
+                return self._reject("device", wait, f"Too many updates for {key.replace(':', ' ')}, retry later.")
+        self.admitted += 1
+        return None
+
+    def release(self):
+        self.in_flight -= 1
+
+    def close(self):
+        self.buckets.close()
+
+    def stats(self) -> dict:
+        if not RATE_LIMIT:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "backend": self.backend,
+            "keys": self.buckets.keys(),
+            "errors": self.buckets.errors,
+            "max_concurrent": self.max_concurrent,
+            "in_flight": self.in_flight,
+            "admitted": self.admitted,
+            "limited": dict(self.limited),
+        }
+
+
+rate_limiter = RateLimiter()
+
+
+def _device_keys(body: bytes) -> list:
+    # Single-event bodies name one plant or device; batch and fleet requests only count against the client
+    try:
+        data = json.loads(body) if body else None
+    except ValueError:
+        return []
+    if not isinstance(data, dict):
+        return []
+    keys = []
+    if isinstance(data.get("plant_id"), int):
+        keys.append(f"plant:{data['plant_id']}")
+    if isinstance(data.get("iot_dev_id"), int):
+        keys.append(f"device:{data['iot_dev_id']}")
+    return keys
+
+
+async def rate_limit_middleware(request: Request, call_next):
+    if not RATE_LIMIT or request.method not in ("PUT", "POST") or not request.url.path.startswith(RATE_LIMITED_PATHS):
+        return await call_next(request)
+
+    client = request.client.host if request.client else "unknown"
+    rejected = await rate_limiter.admit(client, _device_keys(await request.body()))
+    if rejected is not None:
+        return rejected
+    try:
+        return await call_next(request)
+    finally:
+        rate_limiter.release()
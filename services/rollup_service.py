@@ -0,0 +1,255 @@
+"""Incremental per-minute and per-hour rollups of the Log table.
+
+New Log rows are folded into LogRollupMinute and LogRollupHour in id order,
+using the `last_log_id` high-water mark in RollupWatermark so no row is
+aggregated twice and the Log table is never rescanned.
+
+    python -m services.rollup_service refresh    # catch up from the watermark
+    python -m services.rollup_service backfill   # rebuild the rollups from scratch
+"""
+import argparse
+import logging
+import os
+import threading
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import select, func, delete, case, union_all, DateTime
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from models.schema import Base, Log, LogRollupMinute, LogRollupHour, RollupWatermark
+from utils.db import SessionLocal, init_engines
+from utils.log_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Rollup settings
+LOG_ROLLUPS = os.getenv("log_rollups", "false").lower() == "true"
+ROLLUP_REFRESH_SECONDS = float(os.getenv("rollup_refresh_seconds", 60))
+ROLLUP_BATCH_SIZE = int(os.getenv("rollup_batch_size", 50000))
+
+WATERMARK_NAME = "log_rollups"
+
+# Finest first; each entry is (date_trunc unit, table, bucket length)
+ROLLUPS = (
+    ("minute", LogRollupMinute, timedelta(minutes=1)),
+    ("hour", LogRollupHour, timedelta(hours=1)),
+)
+AGGREGATED_COLUMNS = ("temperature", "luminosity_state", "humidity_state")
+BUCKET_ORDER = ("minute", "hour", "day", "week", "month")
+
+
+def _dialect_insert(session: Session):
+    return sqlite.insert if session.get_bind().dialect.name == "sqlite" else postgresql.insert
+
+def _least(session: Session, *values):
+    # SQLite spells LEAST/GREATEST as multi-argument min()/max()
+    return func.min(*values) if session.get_bind().dialect.name == "sqlite" else func.least(*values)
+
+def _greatest(session: Session, *values):
+    return func.max(*values) if session.get_bind().dialect.name == "sqlite" else func.greatest(*values)
+
+def _aggregate_select(unit: str, after_id: int, upper_id: int = None):
+    """Aggregate Log rows with after_id < id <= upper_id (no upper bound when None) per plant and bucket."""
+    bucket = func.date_trunc(unit, Log.entry_creation_time, type_=DateTime).label("bucket")
+    columns = [Log.plant_id, bucket, func.count().label("count")]
+    for name in AGGREGATED_COLUMNS:
+        column = getattr(Log, name)
+        columns += [
+            func.sum(column).label(f"{name}_sum"),
+            func.min(column).label(f"{name}_min"),
+            func.max(column).label(f"{name}_max"),
+        ]
+    columns += [
+        func.sum(case((Log.pump_state, 1), else_=0)).label("pump_on_count"),
+        func.sum(case((Log.valve_state, 1), else_=0)).label("valve_open_count"),
+    ]
+    stmt = select(*columns).where(Log.id > after_id).group_by(Log.plant_id, bucket)
+    if upper_id is not None:
+        stmt = stmt.where(Log.id <= upper_id)
+    return stmt
+
+def _merge_statement(session: Session, table, unit: str, after_id: int, upper_id: int):
+    """INSERT ... SELECT the new aggregates, merging them into existing buckets."""
+    source = _aggregate_select(unit, after_id, upper_id)
+    stmt = _dialect_insert(session)(table).from_select([column.name for column in source.selected_columns], source)
+    current, new = table.__table__.c, stmt.excluded
+    merged = {
+        "count": current.count + new.count,
+        "pump_on_count": current.pump_on_count + new.pump_on_count,
+        "valve_open_count": current.valve_open_count + new.valve_open_count,
+    }
+    for name in AGGREGATED_COLUMNS:
+        merged[f"{name}_sum"] = current[f"{name}_sum"] + new[f"{name}_sum"]
+        merged[f"{name}_min"] = _least(session, current[f"{name}_min"], new[f"{name}_min"])
+        merged[f"{name}_max"] = _greatest(session, current[f"{name}_max"], new[f"{name}_max"])
+    return stmt.on_conflict_do_update(index_elements=["plant_id", "bucket"], set_=merged)
+
+def rollup_watermark(session: Session) -> int:
+    """The highest Log id folded into the rollups."""
+    stmt = select(RollupWatermark.last_log_id).where(RollupWatermark.name == WATERMARK_NAME)
+    return session.execute(stmt).scalar() or 0
+
+def _watermark(session: Session) -> RollupWatermark:
+    watermark = session.get(RollupWatermark, WATERMARK_NAME, with_for_update=True)
+    if watermark is None:
+        watermark = RollupWatermark(name=WATERMARK_NAME, last_log_id=0)
+        session.add(watermark)
+        session.flush()
+    return watermark
+
+def refresh_rollups(session: Session, upper_id: int = None, batch_size: int = ROLLUP_BATCH_SIZE) -> int:
+    """Fold Log rows above the watermark (up to `upper_id`) into every rollup.
+
+    Each batch of `batch_size` ids is merged and its watermark advanced in
+    one transaction. Returns the number of ids covered.
+    """
+    if upper_id is None:
+        upper_id = session.execute(select(func.max(Log.id))).scalar() or 0
+
+    covered = 0
+    while True:
+        watermark = _watermark(session)
+        after_id = watermark.last_log_id
+        if after_id >= upper_id:
+            session.commit()
+            return covered
+        batch_upper = min(after_id + batch_size, upper_id)
+        for unit, table, _ in ROLLUPS:
+            session.execute(_merge_statement(session, table, unit, after_id, batch_upper))
+        watermark.last_log_id = batch_upper
+        watermark.last_updated = datetime.now(timezone.utc)
+        session.commit()
+        covered += batch_upper - after_id
+
+def create_rollup_tables(session: Session):
+    tables = [table.__table__ for _, table, _ in ROLLUPS] + [RollupWatermark.__table__]
+    Base.metadata.create_all(session.get_bind(), tables=tables, checkfirst=True)
+
+def backfill_rollups(session: Session, batch_size: int = ROLLUP_BATCH_SIZE) -> int:
+    """Rebuild every rollup from the whole Log table."""
+    create_rollup_tables(session)
+    for _, table, _ in ROLLUPS:
+        session.execute(delete(table))
+    _watermark(session).last_log_id = 0
+    session.commit()
+    return refresh_rollups(session, batch_size=batch_size)
+
+
+class RollupRefresher:
+    """Background thread that keeps the rollups current.
+
+    Each cycle only folds ids up to the highest id seen on the previous
+    cycle, so rows from transactions still in flight (which can commit
+    lower ids late) are picked up once they are visible.
+    """
+
+    def __init__(self, session_factory=SessionLocal, interval: float = ROLLUP_REFRESH_SECONDS):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._settled_id = None
+
+    def refresh_once(self):
+        with self.session_factory() as session:
+            latest_id = session.execute(select(func.max(Log.id))).scalar() or 0
+            if self._settled_id is not None:
+                refresh_rollups(session, upper_id=self._settled_id)
+            self._settled_id = latest_id
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh_once()
+            except Exception as e:
+                logger.error("Failed to refresh log rollups: %s", e)
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="rollup-refresher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+
+rollup_refresher = RollupRefresher()
+
+
+def _is_aligned(value: datetime, step: timedelta) -> bool:
+    epoch = datetime(1970, 1, 1, tzinfo=value.tzinfo)
+    return (value - epoch) % step == timedelta(0)
+
+def choose_rollup(start: datetime, end: datetime, bucket: str):
+    """Return the coarsest rollup table whose buckets fit the query, or None.
+
+    A rollup fits when its unit is no coarser than the requested bucket and
+    the window starts and ends on its bucket boundaries.
+    """
+    for unit, table, step in reversed(ROLLUPS):
+        if BUCKET_ORDER.index(unit) <= BUCKET_ORDER.index(bucket) and _is_aligned(start, step) and _is_aligned(end, step):
+            return table
+    return None
+
+def rollup_series_select(table, plant_id: int, start: datetime, end: datetime, bucket: str, limit: int,
+                         cursor: datetime = None, after_id: int = 0):
+    """Same result shape as log_series_select, re-aggregated from a rollup table.
+
+    The rollup holds the Log rows up to `after_id` (its watermark); the rows
+    written since are aggregated from Log at the rollup's unit and merged
+    in, so the series is exact without waiting for the next refresh.
+    """
+    unit = next(rollup_unit for rollup_unit, rollup_table, _ in ROLLUPS if rollup_table is table)
+    rollup = table.__table__.c
+    tail = _aggregate_select(unit, after_id).where(
+        Log.plant_id == plant_id, Log.entry_creation_time >= start, Log.entry_creation_time < end
+    )
+    folded = select(*(rollup[column.name] for column in tail.selected_columns)).where(
+        rollup.plant_id == plant_id, rollup.bucket >= start, rollup.bucket < end
+    )
+    if cursor is not None:
+        tail = tail.where(Log.entry_creation_time > cursor)
+        folded = folded.where(rollup.bucket > cursor)
+    rows = union_all(folded, tail).subquery()
+
+    bucket_start = func.date_trunc(bucket, rows.c.bucket, type_=DateTime).label("bucket")
+    count = func.sum(rows.c["count"])
+    aggregates = []
+    for name in AGGREGATED_COLUMNS:
+        aggregates += [
+            func.min(rows.c[f"{name}_min"]).label(f"{name}_min"),
+            (func.sum(rows.c[f"{name}_sum"]) / count).label(f"{name}_avg"),
+            func.max(rows.c[f"{name}_max"]).label(f"{name}_max"),
+        ]
+
+    stmt = (
+        select(bucket_start, count.label("count"), *aggregates)
+        .group_by(bucket_start)
+        .order_by(bucket_start)
+        .limit(limit)
+    )
+    if cursor is not None:
+        stmt = stmt.where(bucket_start > cursor)
+    return stmt
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the Log rollup tables.")
+    parser.add_argument("command", choices=("refresh", "backfill"))
+    parser.add_argument("--batch-size", type=int, default=ROLLUP_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    init_engines()
+    with SessionLocal() as session:
+        if args.command == "backfill":
+            covered = backfill_rollups(session, batch_size=args.batch_size)
+        else:
+            create_rollup_tables(session)
+            covered = refresh_rollups(session, batch_size=args.batch_size)
+    print(f"Rolled up {covered} log ids")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from time import monotonic
+from sqlalchemy import select
+from models.schema import Log, Plant, PlantState, PlantEvent, IotDevState, IotDevEvent
+from services.topology_cache import topology_cache
+from utils.db import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Last-known-state cache settings
+STATE_CACHE = os.getenv("state_cache", "false").lower() == "true"
+STATE_CACHE_REFRESH = float(os.getenv("state_cache_refresh", 10))
+# With NOTIFY every worker receives every committed event, so refreshes skip the event tables
+STATE_CACHE_REFRESH_EVENTS = os.getenv("event_stream_notify", "false").lower() != "true"
+
+PLANT_STATE_FIELDS = ("luminosity_state", "humidity_state", "valve_state", "led_intensity_state", "mode")
+PLANT_EVENT_FIELDS = ("luminosity_event", "humidity_event", "valve_event", "led_intensity_event", "mode")
+
+
+def _last_temperatures():
+    # Driven from Plant: one backward probe of ix_log_plant_id_id per plant instead of scanning Log
+    last_temperature = (
+        select(Log.temperature)
+        .where(Log.plant_id == Plant.id)
+        .order_by(Log.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    return select(Plant.id, last_temperature)
+
+
+class StateCache:
+    """Current PlantState/PlantEvent/IotDevState/IotDevEvent values and last temperatures.
+
+    Everything is loaded once at startup. Event rows are then written
+    through by the event services after each commit, and by `on_event` for
+    events committed in other workers (event_stream_notify=true). State
+    rows and temperatures are written by the firmware, so they are
+    re-read every `refresh_seconds`, the temperatures with one indexed
+    lookup per plant. Without NOTIFY the event rows are re-read too, since
+    other workers' writes do not reach this one. A refresh never
+    overwrites a value written through after it started.
+    """
+
+    def __init__(self, session_factory=SessionLocal, refresh_seconds: float = STATE_CACHE_REFRESH,
+                 refresh_events: bool = STATE_CACHE_REFRESH_EVENTS):
+        self.session_factory = session_factory
+        self.refresh_seconds = refresh_seconds
+        self.refresh_events = refresh_events
+        self._lock = threading.Lock()
+        self._tables = {"plant_state": {}, "plant_event": {}, "dev_state": {}, "dev_event": {}, "temperature": {}}
+        self._written_at = {}  # (table, id) -> monotonic time of the last write-through
+        self._stop = threading.Event()
+        self._thread = None
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.last_reload_seconds = 0.0
+
+    def _write(self, table: str, key: int, value, reload_started: float = None):
+        if reload_started is not None and self._written_at.get((table, key), 0) > reload_started:
+            return
+        current = self._tables[table].get(key)
+        if isinstance(value, dict) and isinstance(current, dict):
+            current.update(value)
+        else:
+            self._tables[table][key] = value
+        if reload_started is None:
+            self._written_at[(table, key)] = monotonic()
+
+    def update_plant_event(self, event_id: int, values: dict):
+        with self._lock:
+            if event_id in self._tables["plant_event"]:
+                self._write("plant_event", event_id, dict(values))
+
+    def update_device_event(self, iot_dev_id: int, pump_event: bool):
+        with self._lock:
+            if iot_dev_id in self._tables["dev_event"]:
+                self._write("dev_event", iot_dev_id, pump_event)
+
+    def on_event(self, event: dict):
+        """Apply an event message from the event bus, keyed like the local write-through."""
+        if event["type"] == "plant":
+            self.update_plant_event(event.get("plant_event_id", event["plant_id"]), event["values"])
+        else:
+            self.update_device_event(event["iot_dev_id"], event["values"]["pump_event"])
+
+    def reload(self, events: bool = True):
+        """Read the state rows, the last temperature of every plant and, with `events`, the event rows.
+
+        The full reload (startup) also loads the topology cache.
+        """
+        started = monotonic()
+        plant_events = dev_events = ()
+        with self.session_factory() as session:
+            if events:
+                topology_cache.load_all(session)
+                plant_events = session.execute(select(PlantEvent.id, *(getattr(PlantEvent, f) for f in PLANT_EVENT_FIELDS))).all()
+                dev_events = session.execute(select(IotDevEvent.id, IotDevEvent.pump_event)).all()
+            plant_states = session.execute(select(PlantState.id, *(getattr(PlantState, f) for f in PLANT_STATE_FIELDS))).all()
+            dev_states = session.execute(select(IotDevState.id, IotDevState.pump_state)).all()
+            temperatures = session.execute(_last_temperatures()).all()
+
+        with self._lock:
+            for row in plant_states:
+                self._write("plant_state", row[0], dict(zip(PLANT_STATE_FIELDS, row[1:])), started)
+            for row in plant_events:
+                self._write("plant_event", row[0], dict(zip(PLANT_EVENT_FIELDS, row[1:])), started)
+            for dev_id, pump_state in dev_states:
+                self._write("dev_state", dev_id, pump_state, started)
+            for dev_id, pump_event in dev_events:
+                self._write("dev_event", dev_id, pump_event, started)
+            for plant_id, temperature in temperatures:
+                if temperature is not None:
+                    self._write("temperature", plant_id, temperature, started)
+            self.loaded = self.loaded or events
+            self.last_reload_seconds = monotonic() - started
+
+    def refresh(self):
+        """Periodic refresh; until a full reload succeeds the event rows are still missing."""
+        self.reload(events=self.refresh_events or not self.loaded)
+
+    def _run(self):
+        while not self._stop.wait(self.refresh_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning("Failed to refresh the state cache: %s", e)
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="state-cache-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def plant_snapshot(self, topology, plant_id: int, iot_dev_id: int = None):
+        """Current values for a plant (and its device, or `iot_dev_id`), or None on a miss."""
+        with self._lock:
+            if topology is None or not self.loaded:
+                self.misses += 1
+                return None
+            dev_id = iot_dev_id if iot_dev_id is not None else topology.iot_dev_id
+            state = self._tables["plant_state"].get(topology.plant_state_id)
+            event = self._tables["plant_event"].get(topology.plant_event_id)
+            pump_state = self._tables["dev_state"].get(dev_id)
+            pump_event = self._tables["dev_event"].get(dev_id)
+            if state is None or event is None or pump_state is None or pump_event is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return {
+                "plant_id": plant_id,
+                "iot_dev_id": dev_id,
+                "temperature": self._tables["temperature"].get(plant_id),
+                "state": dict(state),
+                "event": dict(event),
+                "pump_state": pump_state,
+                "pump_event": pump_event,
+            }
+
+    def log_row(self, topology, plant_id: int, iot_dev_id: int = None):
+        """Build the Log row from memory, or return None so the caller reads the database."""
+        snapshot = self.plant_snapshot(topology, plant_id, iot_dev_id)
+        if snapshot is None:
+            return None
+        now = datetime.now(timezone.utc)
+        state, event = snapshot["state"], snapshot["event"]
+        return {
+            "entry_creation_time": now,
+            "entry_store_time": now,
+            "temperature": snapshot["temperature"] if snapshot["temperature"] is not None else 0.0,
+            "luminosity_state": state["luminosity_state"],
+            "humidity_state": state["humidity_state"],
+            "valve_state": state["valve_state"],
+            "led_intensity_state": state["led_intensity_state"],
+            "luminosity_event": event["luminosity_event"],
+            "humidity_event": event["humidity_event"],
+            "valve_event": event["valve_event"],
+            "led_intensity_event": event["led_intensity_event"],
+            "pump_state": snapshot["pump_state"],
+            "pump_event": snapshot["pump_event"],
+            "plant_id": plant_id,
+            "mode_event": event["mode"],
+            "mode_state": state["mode"],
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": STATE_CACHE,
+                "loaded": self.loaded,
+                "plants_with_temperature": len(self._tables["temperature"]),
+                "plant_events": len(self._tables["plant_event"]),
+                "device_events": len(self._tables["dev_event"]),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "refresh_seconds": self.refresh_seconds,
+                "refresh_events": self.refresh_events,
+                "last_reload_seconds": self.last_reload_seconds,
+            }
+
+
+def snapshot_from_log_row(row: dict, iot_dev_id: int = None) -> dict:
+    """Shape a log snapshot row read from the database like `plant_snapshot`."""
+    return {
+        "plant_id": row["plant_id"],
+        "iot_dev_id": iot_dev_id,
+        "temperature": row["temperature"],
+        "state": {field: row["mode_state" if field == "mode" else field] for field in PLANT_STATE_FIELDS},
+        "event": {field: row["mode_event" if field == "mode" else field] for field in PLANT_EVENT_FIELDS},
+        "pump_state": row["pump_state"],
+        "pump_event": row["pump_event"],
+    }
+
+
+state_cache = StateCache()
@@ -0,0 +1,145 @@
+import logging
+import os
+import threading
+from collections import namedtuple
+from time import monotonic, sleep
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.schema import Plant
+from utils.db import listen
+
+logger = logging.getLogger(__name__)
+
+# Topology cache settings
+TOPOLOGY_CACHE = os.getenv("topology_cache", "false").lower() == "true"
+TOPOLOGY_CACHE_TTL = float(os.getenv("topology_cache_ttl", 300))
+TOPOLOGY_LISTEN = os.getenv("topology_listen", "false").lower() == "true"
+
+# Channel notified by the trigger below with the changed plant id as payload
+TOPOLOGY_CHANNEL = "plant_topology"
+
+# Run once on the database to enable push invalidation (topology_listen=true)
+NOTIFY_TRIGGER_SQL = f"""
+CREATE OR REPLACE FUNCTION notify_plant_topology() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('{TOPOLOGY_CHANNEL}', COALESCE(NEW.id, OLD.id)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS plant_topology_notify ON "Plant";
+CREATE TRIGGER plant_topology_notify
+AFTER INSERT OR UPDATE OF plant_state_id, plant_event_id, iot_dev_id OR DELETE ON "Plant"
+FOR EACH ROW EXECUTE FUNCTION notify_plant_topology();
+"""
+
+PlantTopology = namedtuple("PlantTopology", ["plant_state_id", "plant_event_id", "iot_dev_id"])
+
+_TOPOLOGY_COLUMNS = (Plant.id, Plant.plant_state_id, Plant.plant_event_id, Plant.iot_dev_id)
+
+
+class TopologyCache:
+    """In-process map of plant id -> (plant_state_id, plant_event_id, iot_dev_id).
+
+    Entries expire after `ttl` seconds and can be dropped with `invalidate`,
+    either directly or from Postgres NOTIFY messages on `plant_topology`.
+    """
+
+    def __init__(self, ttl: float = TOPOLOGY_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}  # plant_id -> (PlantTopology, loaded_at)
+        self._lock = threading.Lock()
+        self._stop_listening = threading.Event()
+        self._listener = None
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, plant_id: int):
+        with self._lock:
+            entry = self._entries.get(plant_id)
+            if entry is not None and monotonic() - entry[1] < self.ttl:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def _store(self, rows):
+        now = monotonic()
+        with self._lock:
+            for plant_id, plant_state_id, plant_event_id, iot_dev_id in rows:
+                self._entries[plant_id] = (PlantTopology(plant_state_id, plant_event_id, iot_dev_id), now)
+
+    def get(self, session: Session, plant_id: int):
+        """Return the plant's topology, reading the Plant row only on a miss."""
+        topology = self._lookup(plant_id)
+        if topology is None:
+            row = session.execute(select(*_TOPOLOGY_COLUMNS).where(Plant.id == plant_id)).first()
+            if row is None:
+                return None
+            self._store([row])
+            topology = PlantTopology(*row[1:])
+        return topology
+
+    async def get_async(self, session: AsyncSession, plant_id: int):
+        topology = self._lookup(plant_id)
+        if topology is None:
+            row = (await session.execute(select(*_TOPOLOGY_COLUMNS).where(Plant.id == plant_id))).first()
+            if row is None:
+                return None
+            self._store([row])
+            topology = PlantTopology(*row[1:])
+        return topology
+
+    def load_all(self, session: Session):
+        """Load every plant in one query (used at startup)."""
+        rows = session.execute(select(*_TOPOLOGY_COLUMNS)).all()
+        self._store(rows)
+        return len(rows)
+
+    def invalidate(self, plant_id: int = None):
+        """Drop one plant's entry, or every entry when `plant_id` is None."""
+        with self._lock:
+            if plant_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(plant_id, None)
+
+    def _on_notify(self, channel: str, payload: str):
+        self.invalidate(int(payload) if payload else None)
+
+    def _listen(self):
+        while not self._stop_listening.is_set():
+            try:
+                listen([TOPOLOGY_CHANNEL], self._on_notify, self._stop_listening)
+            except Exception as e:
+                logger.warning("Topology listener disconnected: %s", e)
+                # Notifications may have been missed while disconnected
+                self.invalidate()
+                sleep(5)
+
+    def start_listener(self):
+        if self._listener is None:
+            self._stop_listening.clear()
+            self._listener = threading.Thread(target=self._listen, name="topology-listener", daemon=True)
+            self._listener.start()
+
+    def stop_listener(self):
+        self._stop_listening.set()
+        self._listener = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": TOPOLOGY_CACHE,
+                "entries": len(self._entries),
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "listening": self._listener is not None,
+            }
+
+
+topology_cache = TopologyCache()
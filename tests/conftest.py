@@ -0,0 +1,85 @@
+"""Shared fixtures: the app's engine pointed at a scratch SQLite file, seeded with a small fleet."""
+import os
+import sys
+import tempfile
+
+# Must be set before utils.db is imported (database_url overrides the Postgres settings)
+TEST_DB = os.path.join(tempfile.mkdtemp(prefix="greenhouse-tests-"), "test.db")
+os.environ["database_url"] = f"sqlite:///{TEST_DB}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import pytest
+from sqlalchemy import event, func, insert, select
+from models.schema import Base, Plant, PlantState, PlantEvent, IotDev, IotDevState, IotDevEvent, Log
+import utils.db as db
+
+
+def seed_fleet(session, plants: int = 3):
+    """One device per plant, every id equal to the plant id, and one Log row for plant 1."""
+    for i in range(1, plants + 1):
+        session.add(PlantState(id=i, luminosity_state=10.0 * i, humidity_state=20.0, valve_state=False,
+                               led_intensity_state=30, mode=1))
+        session.add(PlantEvent(id=i, luminosity_event=40.0, humidity_event=50.0, valve_event=True,
+                               led_intensity_event=60, mode=2))
+        session.add(IotDevState(id=i, pump_state=True))
+        session.add(IotDevEvent(id=i, pump_event=False))
+        session.add(IotDev(id=i, online_status=True, dev_state_id=i, dev_event_id=i))
+        session.add(Plant(id=i, error=False, plant_state_id=i, plant_event_id=i, iot_dev_id=i))
+    session.flush()
+    session.add(Log(entry_creation_time=datetime.now(timezone.utc), temperature=21.5, luminosity_state=0,
+                    humidity_state=0, luminosity_event=0, humidity_event=0, plant_id=1, valve_state=False,
+                    pump_state=False, led_intensity_state=0, valve_event=False, pump_event=False,
+                    led_intensity_event=0))
+    session.commit()
+
+
+@pytest.fixture
+def engine():
+    """A freshly created and seeded schema on the app's engine."""
+    engine = db.init_engines()
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with db.SessionLocal() as session:
+        seed_fleet(session)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    with db.SessionLocal() as session:
+        yield session
+
+
+@contextmanager
+def count_statements(engine):
+    """Collect the SQL statements sent to `engine` inside the block."""
+    statements = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def log_count(engine, plant_id: int = None) -> int:
+    query = select(func.count()).select_from(Log)
+    if plant_id is not None:
+        query = query.where(Log.plant_id == plant_id)
+    with engine.connect() as connection:
+        return connection.execute(query).scalar()
+
+
+def add_log(session, plant_id: int, temperature: float):
+    """Insert a Log row as the firmware would (not committed)."""
+    session.execute(insert(Log).values(
+        entry_creation_time=datetime.now(timezone.utc), temperature=temperature, luminosity_state=0,
+        humidity_state=0, luminosity_event=0, humidity_event=0, plant_id=plant_id, valve_state=False,
+        pump_state=False, led_intensity_state=0, valve_event=False, pump_event=False, led_intensity_event=0,
+    ))
@@ -0,0 +1,47 @@
+from sqlalchemy import delete, select
+from conftest import count_statements, log_count
+from models.batchModels import BatchEventItem
+from models.schema import Plant, PlantEvent
+from services.batch_service import apply_event_batch
+
+
+def items(*updates):
+    return [BatchEventItem(**update) for update in updates]
+
+
+def test_batch_is_one_update_per_plant_and_one_log_insert(engine, session):
+    batch = items(
+        {"type": "plant", "plant_id": 1, "humidity_event": 11.0},
+        {"type": "plant", "plant_id": 1, "mode": 3},
+        {"type": "plant", "plant_id": 2, "mode": 4},
+        {"type": "pump", "iot_dev_id": 3, "pump_event": True},
+    )
+    with count_statements(engine) as statements:
+        results = apply_event_batch(session, batch)
+    assert [result["detail"] for result in results] == ["updated"] * 4
+    inserts = [statement for statement in statements if statement.lstrip().upper().startswith("INSERT")]
+    assert len(statements) == 4 and len(inserts) == 1
+    assert log_count(engine) == 1 + 3
+
+
+def test_event_without_plant_is_reported_and_rolled_back(engine, session):
+    # PlantEvent 3 stays, but no Plant points at it any more: no snapshot can be logged
+    session.execute(delete(Plant).where(Plant.id == 3))
+    session.commit()
+
+    results = apply_event_batch(session, items(
+        {"type": "plant", "plant_id": 2, "mode": 4},
+        {"type": "plant", "plant_id": 3, "mode": 4},
+        {"type": "plant", "plant_id": 9, "mode": 4},
+    ))
+
+    assert [(result["status_code"], result["detail"]) for result in results] == [
+        (200, "updated"),
+        (404, "No plant/device snapshot found for plant ID 3"),
+        (404, "PlantEvent with ID 9 does not exist."),
+    ]
+    assert log_count(engine, 2) == 1
+    assert log_count(engine, 3) == 0
+    # The update of the unlogged event was undone with the rest of the first attempt
+    modes = dict(session.execute(select(PlantEvent.id, PlantEvent.mode)).all())
+    assert modes[2] == 4 and modes[3] == 2
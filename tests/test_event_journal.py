@@ -0,0 +1,103 @@
+"""Store-and-forward: events journaled during an outage are replayed in order."""
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+from models.schema import PlantEvent
+import services.event_journal as event_journal_module
+import utils.db as db
+from routers.events import build_router
+from services.event_journal import EventJournal
+from conftest import log_count
+
+
+def database_down(*args, **kwargs):
+    raise OperationalError("UPDATE", {}, ConnectionRefusedError("connection refused"))
+
+
+@pytest.fixture
+def journal(monkeypatch, tmp_path, engine):
+    journal = EventJournal(path=str(tmp_path / "journal.db"), session_factory=db.SessionLocal, replay_pause_ms=0)
+    monkeypatch.setattr(event_journal_module, "EVENT_JOURNAL", True)
+    monkeypatch.setattr(event_journal_module, "event_journal", journal)
+    yield journal
+    journal.stop()
+
+
+@pytest.fixture
+def client(engine):
+    app = FastAPI()
+    app.include_router(build_router(asynchronous=False))
+    with TestClient(app) as client:
+        yield client
+
+
+def plant_mode(session, plant_id: int) -> int:
+    session.expire_all()
+    return session.execute(select(PlantEvent.mode).where(PlantEvent.id == plant_id)).scalar()
+
+
+def journal_rows(journal) -> list:
+    with journal._lock:
+        return [json.loads(item) for item, in journal._db().execute("SELECT item FROM journal ORDER BY seq")]
+
+
+def test_outage_is_accepted_then_replayed_in_order(monkeypatch, journal, client, engine, session):
+    with monkeypatch.context() as outage:
+        outage.setattr(event_journal_module, "update_plant_event", database_down)
+        assert client.put("/events/plant/mode", json={"plant_id": 2, "mode": 3}).status_code == 202
+    # The database is back, but the backlog keeps later events behind the journaled one
+    assert client.put("/events/plant/mode", json={"plant_id": 2, "mode": 4}).status_code == 202
+    assert client.put("/events/plant/mode", json={"plant_id": 3, "mode": 1}).status_code == 202
+    assert [item["mode"] for item in journal_rows(journal)] == [3, 4, 1]
+    assert plant_mode(session, 2) == 2
+
+    assert journal.replay() == 3
+    assert (plant_mode(session, 2), plant_mode(session, 3)) == (4, 1)
+    assert log_count(engine, 2) == 1 and log_count(engine, 3) == 1
+    assert journal.stats()["backlog"] == 0
+    assert client.put("/events/plant/mode", json={"plant_id": 2, "mode": 1}).status_code == 200
+
+
+def test_replay_keeps_the_batch_while_the_database_is_down(monkeypatch, journal, session):
+    journal.append([event_journal_module._plant_item("mode", 3, 2)])
+    with monkeypatch.context() as outage:
+        outage.setattr(event_journal_module, "apply_event_batch", database_down)
+        assert journal.replay() == 0
+    assert journal.stats()["backlog"] == 1 and journal.failed_replays == 1
+    assert journal.replay() == 1
+    assert plant_mode(session, 2) == 3
+
+
+def test_failing_events_are_dead_lettered(journal, session):
+    journal.append([event_journal_module._plant_item("mode", 3, 2)])
+    with journal._lock, journal._db() as connection:
+        connection.execute("INSERT INTO journal (received_at, item) VALUES (0, ?)", ('{"type": "plant"',))
+    journal.append([event_journal_module._plant_item("mode", 4, 3)])
+
+    assert journal.replay() == 3
+    assert (plant_mode(session, 2), plant_mode(session, 3)) == (3, 4)
+    stats = journal.stats()
+    assert (stats["backlog"], stats["replayed"], stats["dead_lettered"], stats["dead_letters"]) == (0, 2, 1, 1)
+
+
+def test_replay_stops_when_the_lease_is_lost(monkeypatch, journal):
+    journal.replay_batch = 1
+    journal.append([event_journal_module._plant_item("mode", mode, 2) for mode in (3, 4)])
+    renewals = iter([True, False])
+    monkeypatch.setattr(journal, "_acquire_lease", lambda: next(renewals))
+    assert journal.replay() == 1
+    assert journal.stats()["backlog"] == 1
+
+
+def test_failed_log_insert_is_not_journaled(monkeypatch, journal, engine, session):
+    monkeypatch.setattr(event_journal_module, "insert_new_log_plant", database_down)
+    app = FastAPI()
+    app.include_router(build_router(asynchronous=False))
+    with TestClient(app, raise_server_exceptions=False) as client:
+        assert client.put("/events/plant/mode", json={"plant_id": 2, "mode": 3}).status_code == 500
+    # The update was committed: journaling it would apply it again on replay
+    assert plant_mode(session, 2) == 3
+    assert journal_rows(journal) == [] and journal.stats()["backlog"] == 0
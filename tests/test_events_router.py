@@ -0,0 +1,53 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from conftest import TEST_DB, log_count
+from routers.events import build_router, PLANT_EVENT_ENDPOINTS
+from utils.db import get_async_session
+
+
+@pytest.fixture(params=[False, True], ids=["sync", "async"])
+def client(request, engine):
+    app = FastAPI()
+    app.include_router(build_router(asynchronous=request.param))
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{TEST_DB}")
+    sessions = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    async def get_test_async_session():
+        async with sessions() as session:
+            yield session
+
+    app.dependency_overrides[get_async_session] = get_test_async_session
+    with TestClient(app) as client:
+        yield client
+
+
+def test_sync_and_async_routes_match():
+    routes = lambda router: sorted((route.path, route.name, tuple(route.methods)) for route in router.routes)
+    assert routes(build_router(asynchronous=False)) == routes(build_router(asynchronous=True))
+
+
+@pytest.mark.parametrize("path", list(PLANT_EVENT_ENDPOINTS))
+def test_plant_event_endpoints(client, engine, path):
+    column = PLANT_EVENT_ENDPOINTS[path][0]
+    value = 3 if column == "mode" else False if column == "valve_event" else 77
+    response = client.put(f"/events{path}", json={"plant_id": 2, column: value})
+    assert response.status_code == 200
+    assert response.json() == {"message": f"{PLANT_EVENT_ENDPOINTS[path][2]} updated", "plant_id": 2, column: value}
+    assert log_count(engine, 2) == 1
+
+
+def test_missing_value_and_unknown_plant(client):
+    response = client.put("/events/plant/humidity", json={"plant_id": 2})
+    assert response.status_code == 400
+    response = client.put("/events/plant/humidity", json={"plant_id": 99, "humidity_event": 5})
+    assert response.status_code == 404
+
+
+def test_pump_batch_and_fleet(client, engine):
+    assert client.put("/events/device/pump", json={"iot_dev_id": 3, "pump_event": True}).status_code == 200
+    response = client.post("/events/batch", json={"items": [{"type": "plant", "plant_id": 3, "mode": 4}]})
+    assert response.json()["results"][0]["detail"] == "updated"
+    response = client.post("/events/fleet", json={"plant_ids": [1, 2], "mode": 4})
+    assert [result["detail"] for result in response.json()["results"]] == ["updated", "updated"]
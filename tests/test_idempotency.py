@@ -0,0 +1,76 @@
+"""Idempotency-Key replay, within a worker and across workers sharing the SQLite backend."""
+import asyncio
+import pytest
+from services.idempotency import IdempotencyStore, SqliteEntries
+
+
+@pytest.fixture
+def workers(tmp_path):
+    """Two stores on one SQLite file, as two gunicorn workers of a host."""
+    stores = []
+    for _ in range(2):
+        store = IdempotencyStore(ttl=60, backend="sqlite")
+        store.shared = SqliteEntries(str(tmp_path / "idempotency.db"))
+        stores.append(store)
+    yield stores
+    for store in stores:
+        store.close()
+
+
+def test_memory_store_replays_within_the_worker():
+    async def scenario():
+        store = IdempotencyStore(ttl=60, backend="memory")
+        assert await store.begin("PUT /events/plant/mode k1", "body") is None
+        await store.finish("PUT /events/plant/mode k1", 200, {"content-type": "application/json"}, b"{}")
+        replay = await store.begin("PUT /events/plant/mode k1", "body")
+        return store, replay
+
+    store, replay = asyncio.run(scenario())
+    assert replay.headers["Idempotent-Replayed"] == "true" and replay.body == b"{}"
+    assert store.stats()["replayed"] == 1
+
+
+def test_retry_on_another_worker_gets_the_stored_response(workers):
+    first, second = workers
+
+    async def scenario():
+        assert await first.begin("k1", "body") is None
+        # The retry reaches the other worker while the first request is still running
+        retry = asyncio.create_task(second.begin("k1", "body"))
+        await asyncio.sleep(0.2)
+        assert not retry.done()
+        await first.finish("k1", 200, {"content-type": "application/json"}, b'{"ok": true}')
+        return await retry
+
+    replay = asyncio.run(scenario())
+    assert replay.status_code == 200 and replay.body == b'{"ok": true}'
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert second.stats()["replayed"] == 1 and first.stats()["keys"] == 1
+
+
+def test_failed_request_releases_the_key_and_bodies_must_match(workers):
+    first, second = workers
+
+    async def scenario():
+        assert await first.begin("k1", "body") is None
+        await first.finish("k1", 500, {}, b"")
+        # Nothing was stored, so the retry runs on the other worker
+        assert await second.begin("k1", "body") is None
+        await second.finish("k1", 200, {}, b"{}")
+        return await first.begin("k1", "another body")
+
+    conflict = asyncio.run(scenario())
+    assert conflict.status_code == 422 and first.stats()["conflicts"] == 1
+
+
+def test_sqlite_errors_run_the_request(tmp_path):
+    store = IdempotencyStore(ttl=60, backend="sqlite")
+    store.shared = SqliteEntries(str(tmp_path))  # a directory: SQLite cannot open it
+
+    async def scenario():
+        claimed = await store.begin("k1", "body")
+        await store.finish("k1", 200, {}, b"{}")
+        return claimed
+
+    assert asyncio.run(scenario()) is None
+    assert store.stats()["errors"] == 2
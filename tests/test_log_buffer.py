@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+import pytest
+from fastapi import HTTPException
+from conftest import log_count
+from services.log_buffer import LogBuffer, SHUTDOWN_FLUSH_ATTEMPTS
+import utils.db as db
+
+
+def log_row(plant_id: int = 2) -> dict:
+    return {"entry_creation_time": datetime.now(timezone.utc), "temperature": 20.0, "luminosity_state": 1.0,
+            "humidity_state": 2.0, "luminosity_event": 3.0, "humidity_event": 4.0, "plant_id": plant_id,
+            "valve_state": False, "pump_state": False, "led_intensity_state": 5, "valve_event": False,
+            "pump_event": False, "led_intensity_event": 6, "mode_event": 1, "mode_state": 1}
+
+
+class FailingSessions:
+    """Session factory whose first `failures` flushes raise, like a database that is down."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+
+    def __call__(self):
+        session = db.SessionLocal()
+        if self.failures:
+            self.failures -= 1
+            def fail(*args, **kwargs):
+                raise ConnectionError("database unreachable")
+            session.execute = fail
+        return session
+
+
+def buffer(failures: int) -> LogBuffer:
+    return LogBuffer(session_factory=FailingSessions(failures), flush_interval_ms=10, flush_max_rows=20)
+
+
+def test_failed_flush_keeps_rows_until_stop(engine):
+    log_buffer = buffer(failures=2)
+    log_buffer.start()
+    for _ in range(50):
+        log_buffer.enqueue(log_row())
+    log_buffer.stop(timeout=10)
+
+    stats = log_buffer.stats()
+    assert stats["failed_flushes"] == 2
+    assert stats["flushed"] == 50 and stats["dropped"] == 0
+    assert log_count(engine, 2) == 50
+
+
+def test_rows_dropped_after_failed_shutdown_attempts(engine):
+    log_buffer = buffer(failures=10**6)
+    for _ in range(30):
+        log_buffer.enqueue(log_row())
+    log_buffer.start()
+    log_buffer.stop(timeout=10)
+
+    stats = log_buffer.stats()
+    assert stats["dropped"] == 30 and stats["flushed"] == 0
+    # Each batch gets SHUTDOWN_FLUSH_ATTEMPTS tries once stop() is called (plus one if it started before)
+    assert 2 * SHUTDOWN_FLUSH_ATTEMPTS <= stats["failed_flushes"] <= 2 * SHUTDOWN_FLUSH_ATTEMPTS + 1
+    assert log_count(engine, 2) == 0
+
+
+def test_full_queue_rejects_with_503(engine):
+    log_buffer = LogBuffer(maxsize=1, enqueue_timeout=0.01)
+    log_buffer.enqueue(log_row())
+    with pytest.raises(HTTPException) as error:
+        log_buffer.enqueue(log_row())
+    assert error.value.status_code == 503
+    assert log_buffer.stats()["rejected"] == 1
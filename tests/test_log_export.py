@@ -0,0 +1,47 @@
+import io
+import pytest
+from sqlalchemy import update
+from conftest import add_log
+from models.schema import Log
+from services.log_export import export_chunks, iter_log_batches, EXPORT_COLUMNS
+
+def parquet_export(batch_size: int):
+    pq = pytest.importorskip("pyarrow.parquet")
+    chunks = export_chunks("parquet", iter_log_batches(batch_size=batch_size))
+    return pq.read_table(io.BytesIO(b"".join(chunks)))
+
+
+def test_all_null_column_in_first_batch(engine, session):
+    # Row 1 (seeded) and row 2 have no entry_store_time, later rows do
+    for temperature in (18.0, 19.0, 20.0):
+        add_log(session, 2, temperature)
+    session.execute(update(Log).where(Log.id <= 2).values(entry_store_time=None))
+    session.commit()
+
+    table = parquet_export(batch_size=2)
+    assert table.column_names == EXPORT_COLUMNS
+    assert table.num_rows == 4
+    assert table.column("entry_store_time").null_count == 2
+    assert table.column("temperature").to_pylist() == [21.5, 18.0, 19.0, 20.0]
+
+
+def test_empty_export_is_a_valid_file(engine, session):
+    session.execute(Log.__table__.delete())
+    session.commit()
+    table = parquet_export(batch_size=2)
+    assert table.num_rows == 0 and table.column_names == EXPORT_COLUMNS
+
+
+def test_empty_csv_export_has_the_header(engine, session):
+    assert "".join(export_chunks("csv", iter([]))) == ",".join(EXPORT_COLUMNS) + "\r\n"
+    session.execute(Log.__table__.delete())
+    session.commit()
+    body = "".join(export_chunks("csv", iter_log_batches(batch_size=2)))
+    assert body.splitlines() == [",".join(EXPORT_COLUMNS)]
+
+
+def test_csv_export_rows_follow_the_header(engine, session):
+    add_log(session, 2, 18.0)
+    session.commit()
+    lines = "".join(export_chunks("csv", iter_log_batches(batch_size=1))).splitlines()
+    assert lines[0] == ",".join(EXPORT_COLUMNS) and len(lines) == 3
@@ -0,0 +1,83 @@
+"""/logs series: rollups plus the Log rows written after the rollup watermark."""
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import insert
+from models.schema import Log
+import services.log_query_service as log_query_service
+from services.rollup_service import refresh_rollups, rollup_watermark
+
+START = datetime(2026, 3, 2, tzinfo=timezone.utc)
+
+
+def add_logs_at(session, plant_id: int, temperatures_by_minute: dict):
+    """Commit one Log row per {minutes after START: temperature}."""
+    for minute, temperature in temperatures_by_minute.items():
+        session.execute(insert(Log).values(
+            entry_creation_time=START + timedelta(minutes=minute), temperature=temperature, luminosity_state=0,
+            humidity_state=0, luminosity_event=0, humidity_event=0, plant_id=plant_id, valve_state=False,
+            pump_state=False, led_intensity_state=0, valve_event=False, pump_event=False, led_intensity_event=0,
+        ))
+    session.commit()
+
+
+def series(session, bucket: str, limit: int = 10, cursor=None) -> dict:
+    return log_query_service.get_log_series(session, 2, START, START + timedelta(days=1), bucket, limit, cursor)
+
+
+@pytest.fixture
+def rollups(monkeypatch):
+    monkeypatch.setattr(log_query_service, "LOG_ROLLUPS", True)
+
+
+def test_raw_series_buckets_on_sqlite(session):
+    add_logs_at(session, 2, {0: 10.0, 30: 20.0, 90: 30.0})
+    result = series(session, "hour")
+    assert result["source"] == "Log"
+    assert [(row["bucket"], row["count"], row["temperature_avg"]) for row in result["series"]] == [
+        (datetime(2026, 3, 2, 0), 2, 15.0),
+        (datetime(2026, 3, 2, 1), 1, 30.0),
+    ]
+
+
+def test_rollup_series_includes_rows_after_the_watermark(session, rollups):
+    add_logs_at(session, 2, {0: 10.0, 30: 20.0})
+    refresh_rollups(session)
+    watermark = rollup_watermark(session)
+    # Written after the refresh: only in Log, one in a folded bucket and one in a new bucket
+    add_logs_at(session, 2, {45: 30.0, 90: 40.0})
+    assert rollup_watermark(session) == watermark
+
+    with_rollups = series(session, "hour")
+    assert with_rollups["source"] == "LogRollupHour+Log"
+    assert [(row["bucket"], row["count"], row["temperature_min"], row["temperature_avg"], row["temperature_max"])
+            for row in with_rollups["series"]] == [
+        (datetime(2026, 3, 2, 0), 3, 10.0, 20.0, 30.0),
+        (datetime(2026, 3, 2, 1), 1, 40.0, 40.0, 40.0),
+    ]
+
+
+def test_rollup_series_matches_raw_series(session, monkeypatch):
+    add_logs_at(session, 2, {minute: float(minute % 7) for minute in range(0, 600, 13)})
+    refresh_rollups(session)
+    add_logs_at(session, 2, {minute: float(minute % 5) for minute in range(3, 600, 29)})
+
+    raw = series(session, "hour")
+    monkeypatch.setattr(log_query_service, "LOG_ROLLUPS", True)
+    rolled = series(session, "hour")
+    assert rolled["source"] == "LogRollupHour+Log"
+    assert [row["count"] for row in rolled["series"]] == [row["count"] for row in raw["series"]]
+    for rolled_row, raw_row in zip(rolled["series"], raw["series"]):
+        assert rolled_row["temperature_avg"] == pytest.approx(raw_row["temperature_avg"])
+        assert rolled_row["temperature_max"] == raw_row["temperature_max"]
+
+
+def test_rollup_series_pages_with_the_cursor(session, rollups):
+    add_logs_at(session, 2, {0: 10.0, 70: 20.0})
+    refresh_rollups(session)
+    add_logs_at(session, 2, {130: 30.0})
+
+    first = series(session, "hour", limit=2)
+    assert [row["bucket"] for row in first["series"]] == [datetime(2026, 3, 2, 0), datetime(2026, 3, 2, 1)]
+    second = series(session, "hour", limit=2, cursor=first["next_cursor"])
+    assert [(row["bucket"], row["count"]) for row in second["series"]] == [(datetime(2026, 3, 2, 2), 1)]
+    assert second["next_cursor"] is None
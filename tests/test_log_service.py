@@ -0,0 +1,29 @@
+from conftest import count_statements, log_count
+from services.log_service import insert_new_log_plant, insert_new_log_iotDev
+
+
+def test_plant_log_is_one_statement(engine, session):
+    with count_statements(engine) as statements:
+        insert_new_log_plant(session, 2)
+    # Snapshot read and insert in a single INSERT ... SELECT round trip
+    assert len(statements) == 1
+    assert statements[0].lstrip().upper().startswith("INSERT")
+    assert log_count(engine, 2) == 1
+
+
+def test_device_log_is_one_statement(engine, session):
+    with count_statements(engine) as statements:
+        insert_new_log_iotDev(session, 3, plant_id=1)
+    assert len(statements) == 1
+    assert statements[0].lstrip().upper().startswith("INSERT")
+    assert log_count(engine, 1) == 2
+
+
+def test_log_row_copies_state_event_and_last_temperature(engine, session):
+    insert_new_log_plant(session, 1)
+    with engine.connect() as connection:
+        row = connection.exec_driver_sql(
+            'SELECT temperature, luminosity_state, luminosity_event, pump_state, mode_event, mode_state '
+            'FROM "Log" ORDER BY id DESC LIMIT 1'
+        ).one()
+    assert tuple(row) == (21.5, 10.0, 40.0, 1, 2, 1)
@@ -0,0 +1,65 @@
+"""MQTT ingestion: messages handled and applied in a micro-batch, without a broker."""
+from sqlalchemy import select
+from models.schema import PlantEvent, IotDevEvent
+import utils.db as db
+import services.mqtt_ingest as mqtt_ingest
+from services.mqtt_ingest import MqttIngestor
+from conftest import log_count
+
+
+def drain(ingestor: MqttIngestor):
+    """Apply everything handle_message queued, as the worker thread would."""
+    while not ingestor._queue.empty():
+        ingestor.apply(ingestor._next_batch())
+
+
+def test_messages_are_applied_as_one_batch(engine, session):
+    ingestor = MqttIngestor(session_factory=db.SessionLocal, batch_interval_ms=10)
+    ingestor.handle_message("greenhouse/plant/1/mode", b"3")
+    ingestor.handle_message("greenhouse/plant/2/luminosity", b" 55.5 ")
+    ingestor.handle_message("greenhouse/device/3/pump", b"true")
+    ingestor.handle_message("greenhouse/plant/9/mode", b"1")    # no such plant
+    ingestor.handle_message("greenhouse/plant/1/color", b"1")   # unknown topic
+    ingestor.handle_message("greenhouse/device/3/pump", b"{}")  # invalid payload
+    drain(ingestor)
+
+    assert session.execute(select(PlantEvent.mode).where(PlantEvent.id == 1)).scalar() == 3
+    assert session.execute(select(PlantEvent.luminosity_event).where(PlantEvent.id == 2)).scalar() == 55.5
+    assert session.execute(select(IotDevEvent.pump_event).where(IotDevEvent.id == 3)).scalar() is True
+    assert log_count(engine) == 1 + 3
+    stats = ingestor.stats()
+    assert (stats["received"], stats["applied"], stats["rejected"], stats["batches"]) == (4, 3, 3, 1)
+    assert (stats["failed_batches"], stats["lost"]) == (0, 0)
+
+
+def test_failed_batches_count_lost_messages(engine):
+    def broken_sessions():
+        raise RuntimeError("boom")
+
+    ingestor = MqttIngestor(session_factory=broken_sessions, batch_interval_ms=10)
+    ingestor.handle_message("greenhouse/plant/1/mode", b"3")
+    ingestor.handle_message("greenhouse/plant/2/mode", b"3")
+    drain(ingestor)
+
+    stats = ingestor.stats()
+    assert (stats["applied"], stats["failed_batches"], stats["lost"]) == (0, 1, 2)
+
+
+def test_one_bad_message_does_not_lose_its_batch(monkeypatch, engine, session):
+    apply_event_batch = mqtt_ingest.apply_event_batch
+
+    def failing_on_plant_3(session, items):
+        if any(item.plant_id == 3 for item in items):
+            raise ValueError("cannot apply plant 3")
+        return apply_event_batch(session, items)
+
+    monkeypatch.setattr(mqtt_ingest, "apply_event_batch", failing_on_plant_3)
+    ingestor = MqttIngestor(session_factory=db.SessionLocal, batch_interval_ms=10)
+    for plant_id in (1, 3, 2):
+        ingestor.handle_message(f"greenhouse/plant/{plant_id}/mode", b"4")
+    drain(ingestor)
+
+    modes = dict(session.execute(select(PlantEvent.id, PlantEvent.mode)).all())
+    assert modes == {1: 4, 2: 4, 3: 2}
+    stats = ingestor.stats()
+    assert (stats["applied"], stats["failed_batches"], stats["lost"]) == (2, 1, 1)
@@ -0,0 +1,68 @@
+"""Admission control: all-or-nothing bucket charges, and the SQLite backend's pruning and fail-open."""
+import asyncio
+import pytest
+from services.rate_limit import MemoryBuckets, SqliteBuckets, RateLimiter
+
+# (interval, window): one request per second, bursts of 2
+LIMIT = (1.0, 2.0)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def buckets(request, tmp_path):
+    buckets = MemoryBuckets() if request.param == "memory" else SqliteBuckets(str(tmp_path / "rate_limit.db"))
+    yield buckets
+    buckets.close()
+
+
+def test_full_bucket_charges_none_of_the_others(buckets):
+    assert buckets.acquire([("client:a", *LIMIT)], 100) == (None, 0.0)
+    assert buckets.acquire([("client:a", *LIMIT)], 100) == (None, 0.0)
+    key, wait = buckets.acquire([("plant:1", *LIMIT), ("client:a", *LIMIT)], 100)
+    assert (key, wait) == ("client:a", 1.0)
+    # plant:1 was not charged by the rejected request: its burst is intact
+    assert buckets.acquire([("plant:1", *LIMIT)], 100) == (None, 0.0)
+    assert buckets.acquire([("plant:1", *LIMIT)], 100) == (None, 0.0)
+    assert buckets.acquire([("plant:1", *LIMIT)], 100)[0] == "plant:1"
+
+
+def test_sqlite_prunes_full_buckets_and_caps_keys(tmp_path):
+    buckets = SqliteBuckets(str(tmp_path / "rate_limit.db"), max_keys=3)
+    slow = (100.0, 200.0)
+    for i in range(5):
+        buckets.acquire([(f"plant:{i}", *slow)], 100 + i)
+    # The next prune (every SQLITE_PRUNE_SECONDS) keeps the max_keys buckets furthest from full
+    buckets.acquire([("plant:5", *slow)], 111)
+    assert buckets.keys() == 3
+    # Every one of them is full again by then, so only the new bucket is left
+    buckets.acquire([("plant:6", *slow)], 400)
+    assert buckets.keys() == 1
+    buckets.close()
+
+
+def test_sqlite_errors_admit_the_request(tmp_path):
+    buckets = SqliteBuckets(str(tmp_path))  # a directory: SQLite cannot open it
+    assert buckets.acquire([("client:a", *LIMIT)], 100) == (None, 0.0)
+    assert buckets.errors == 1
+    assert buckets.keys() is None
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_admit_rejects_without_charging_devices(tmp_path, backend):
+    limiter = RateLimiter(backend=backend, max_concurrent=0, device_rate=1, device_burst=2, client_rate=1, client_burst=1)
+    if backend == "sqlite":
+        limiter.buckets = SqliteBuckets(str(tmp_path / "rate_limit.db"))
+
+    async def requests():
+        first = await limiter.admit("10.0.0.1", ["plant:1"])
+        limiter.release()
+        second = await limiter.admit("10.0.0.1", ["plant:1"])
+        third = await limiter.admit("10.0.0.2", ["plant:1"])
+        return first, second, third
+
+    first, second, third = asyncio.run(requests())
+    assert first is None
+    assert second.status_code == 429 and limiter.limited["client"] == 1
+    # The client rejection did not spend plant:1's second token
+    assert third is None and limiter.limited["device"] == 0
+    assert limiter.in_flight == 1
+    limiter.close()
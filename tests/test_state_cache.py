@@ -0,0 +1,74 @@
+from sqlalchemy import update
+from conftest import add_log, count_statements
+from models.fleetModels import FleetControl
+from models.schema import Plant, PlantEvent, PlantState
+import services.fleet_service as fleet_service
+from services.fleet_service import apply_fleet_control
+from services.state_cache import StateCache
+from services.topology_cache import topology_cache
+import utils.db as db
+
+
+def test_refresh_reads_state_and_last_temperatures_only(engine, session):
+    cache = StateCache(session_factory=db.SessionLocal, refresh_events=False)
+    cache.reload()
+    add_log(session, 2, 18.0)
+    add_log(session, 2, 19.5)
+    session.execute(update(PlantState).where(PlantState.id == 2).values(luminosity_state=99.0))
+    session.execute(update(PlantEvent).where(PlantEvent.id == 2).values(mode=4))
+    session.commit()
+
+    with count_statements(engine) as statements:
+        cache.refresh()
+
+    sql = " ".join(statements)
+    assert len(statements) == 3
+    assert "GROUP BY" not in sql.upper() and '"PlantEvent"' not in sql and '"IotDevEvent"' not in sql
+    snapshot = cache.plant_snapshot(topology_cache.get(session, 2), plant_id=2)
+    assert snapshot["temperature"] == 19.5
+    assert snapshot["state"]["luminosity_state"] == 99.0
+    # Event rows come from write-through / the event bus, not from the refresh
+    assert snapshot["event"]["mode"] == 2
+    assert cache.plant_snapshot(topology_cache.get(session, 1), 1)["temperature"] == 21.5
+    assert cache.plant_snapshot(topology_cache.get(session, 3), 3)["temperature"] is None
+
+
+def test_events_from_other_workers_arrive_through_the_bus(engine):
+    cache = StateCache(session_factory=db.SessionLocal, refresh_events=False)
+    cache.reload()
+    cache.on_event({"type": "plant", "plant_id": 3, "values": {"mode": 4, "valve_event": False}})
+    cache.on_event({"type": "pump", "iot_dev_id": 3, "values": {"pump_event": True}})
+    with db.SessionLocal() as session:
+        snapshot = cache.plant_snapshot(topology_cache.get(session, 3), 3)
+    assert (snapshot["event"]["mode"], snapshot["event"]["valve_event"], snapshot["pump_event"]) == (4, False, True)
+
+
+def test_failed_startup_load_is_retried_in_full(engine):
+    cache = StateCache(session_factory=db.SessionLocal, refresh_events=False)
+    cache.refresh()
+    assert cache.loaded and cache.stats()["plant_events"] == 3
+
+
+def test_fleet_events_reach_other_workers_by_plant_event_id(monkeypatch, engine, session):
+    # Plant 2 points at PlantEvent 10: its plant id and event id differ
+    session.add(PlantEvent(id=10, luminosity_event=40.0, humidity_event=50.0, valve_event=True,
+                           led_intensity_event=60, mode=2))
+    session.execute(update(Plant).where(Plant.id == 2).values(plant_event_id=10))
+    session.commit()
+    local, other = (StateCache(session_factory=db.SessionLocal, refresh_events=False) for _ in range(2))
+    local.reload()
+    other.reload()
+    published = []
+    monkeypatch.setattr(fleet_service, "state_cache", local)
+    monkeypatch.setattr(fleet_service.event_bus, "publish", published.append)
+
+    apply_fleet_control(session, FleetControl(plant_ids=[2], mode=4))
+    for event in published:
+        other.on_event(event)
+
+    topology = topology_cache.get(session, 2)
+    assert topology.plant_event_id == 10
+    assert local.plant_snapshot(topology, 2)["event"]["mode"] == 4
+    assert other.plant_snapshot(topology, 2)["event"]["mode"] == 4
+    # PlantEvent 2 belongs to no plant now and was left alone
+    assert other._tables["plant_event"][2]["mode"] == 2
@@ -0,0 +1,46 @@
+"""/ws/events: client frames do not end the subscription."""
+import asyncio
+from contextlib import asynccontextmanager
+from time import monotonic, sleep
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from routers import stream
+from services.event_bus import event_bus, plant_event_message
+
+
+@pytest.fixture
+def client():
+    @asynccontextmanager
+    async def lifespan(app):
+        event_bus.bind(asyncio.get_running_loop())
+        yield
+        event_bus.bind(None)
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(stream.router)
+    with TestClient(app) as client:
+        yield client
+
+
+def wait_for_subscriber(key):
+    deadline = monotonic() + 5
+    while not event_bus._subscribers.get(key):
+        assert monotonic() < deadline, "the websocket never subscribed"
+        sleep(0.01)
+
+
+def test_client_frames_do_not_close_the_subscription(client):
+    with client.websocket_connect("/ws/events?plant_id=1") as websocket:
+        wait_for_subscriber(("plant", 1))
+        websocket.send_text("ping")
+        websocket.send_bytes(b"ping")
+        event_bus.publish(plant_event_message(1, {"mode": 2}))
+        assert websocket.receive_json()["values"] == {"mode": 2}
+        event_bus.publish(plant_event_message(1, {"mode": 3}))
+        assert websocket.receive_json()["values"] == {"mode": 3}
+    # Leaving the block disconnects the client, which ends the subscription
+    deadline = monotonic() + 5
+    while event_bus._subscribers.get(("plant", 1)):
+        assert monotonic() < deadline, "the subscription outlived the client"
+        sleep(0.01)
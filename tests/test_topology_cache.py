@@ -0,0 +1,59 @@
+from time import sleep
+from sqlalchemy import update
+from models.schema import Plant, IotDevState
+from services.topology_cache import TopologyCache, PlantTopology
+import services.log_service as log_service
+
+
+def repoint_plant_1(session):
+    """Move plant 1 onto the state row and device of plant 2."""
+    session.execute(update(Plant).where(Plant.id == 1).values(plant_state_id=2, iot_dev_id=2))
+    session.execute(update(IotDevState).where(IotDevState.id == 2).values(pump_state=False))
+    session.commit()
+
+
+def test_stale_entry_refreshes_after_ttl(engine, session):
+    cache = TopologyCache(ttl=0.2)
+    assert cache.get(session, 1) == PlantTopology(1, 1, 1)
+    repoint_plant_1(session)
+
+    # Still served from the cache until it expires
+    assert cache.get(session, 1) == PlantTopology(1, 1, 1)
+    sleep(0.25)
+    assert cache.get(session, 1) == PlantTopology(2, 1, 2)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_invalidate_refreshes_one_or_every_entry(engine, session):
+    cache = TopologyCache(ttl=300)
+    assert cache.load_all(session) == 3
+    repoint_plant_1(session)
+    assert cache.get(session, 1) == PlantTopology(1, 1, 1)
+
+    cache.invalidate(2)
+    assert cache.get(session, 1) == PlantTopology(1, 1, 1)
+    cache.invalidate(1)
+    assert cache.get(session, 1) == PlantTopology(2, 1, 2)
+
+    session.execute(update(Plant).where(Plant.id == 3).values(iot_dev_id=1))
+    session.commit()
+    # A NOTIFY with an empty payload drops everything
+    cache._on_notify("plant_topology", "")
+    assert cache.get(session, 3) == PlantTopology(3, 3, 1)
+
+
+def test_log_rows_follow_the_refreshed_topology(engine, session, monkeypatch):
+    cache = TopologyCache(ttl=300)
+    monkeypatch.setattr(log_service, "TOPOLOGY_CACHE", True)
+    monkeypatch.setattr(log_service, "topology_cache", cache)
+    log_service.insert_new_log_plant(session, 1)
+    repoint_plant_1(session)
+    cache.invalidate(1)
+    log_service.insert_new_log_plant(session, 1)
+
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(
+            'SELECT luminosity_state, pump_state FROM "Log" WHERE plant_id = 1 ORDER BY id DESC LIMIT 2'
+        ).all()
+    # Newest first: plant 2's state row and device 2's pump, then the original ones
+    assert [tuple(row) for row in rows] == [(20.0, 0), (10.0, 1)]
@@ -1,8 +1,14 @@
-# This script connects to a PostgreSQL database using SQLAlchemy and psycopg2.       
-from sqlalchemy import create_engine
-from sqlalchemy.pool import NullPool
+# This script connects to a PostgreSQL database using SQLAlchemy and psycopg2.
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import NullPool, QueuePool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from dotenv import load_dotenv
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from datetime import datetime, timedelta
+from time import perf_counter
+import threading
+import select
 import os
 
 # Load environment variables from .env
@@ -15,12 +21,156 @@ HOST = os.getenv("host")
 PORT = os.getenv("port")
 DBNAME = os.getenv("dbname")
 
-# Construct the SQLAlchemy connection string
-DATABASE_URL = f"postgresql+psycopg2://{USER}:{PASSWORD}@{HOST}:{PORT}/{DBNAME}?sslmode=require"
+# Connection pool settings
+DB_POOL = os.getenv("db_pool", "queue").lower()  # "queue" or "null"
+DB_POOL_SIZE = int(os.getenv("db_pool_size", 5))
+DB_MAX_OVERFLOW = int(os.getenv("db_max_overflow", 10))
+DB_POOL_TIMEOUT = float(os.getenv("db_pool_timeout", 30))
+DB_POOL_RECYCLE = int(os.getenv("db_pool_recycle", 1800))
+DB_POOL_PRE_PING = os.getenv("db_pool_pre_ping", "true").lower() == "true"
+DB_POOL_WARMUP = int(os.getenv("db_pool_warmup", 0))
+# Set when connecting through a transaction pooler (PgBouncer / Supavisor on port 6543)
+DB_PGBOUNCER = os.getenv("db_pgbouncer", "false").lower() == "true"
 
-# Create the SQLAlchemy engine
-engine = create_engine(DATABASE_URL, poolclass=NullPool)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Serve the event endpoints from an asyncpg-backed AsyncEngine
+DB_ASYNC = os.getenv("db_async", "false").lower() == "true"
+
+# Construct the SQLAlchemy connection string (database_url overrides it, e.g. a
+# local sqlite:///bench.db for the benchmark suite)
+DATABASE_URL = os.getenv("database_url") or f"postgresql+psycopg2://{USER}:{PASSWORD}@{HOST}:{PORT}/{DBNAME}?sslmode=require"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{USER}:{PASSWORD}@{HOST}:{PORT}/{DBNAME}"
+
+
+class _PoolMetrics:
+    """Checkout wait times and timeouts recorded by TimedQueuePool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that measures how long each checkout waits for a connection."""
+
+    metrics = _PoolMetrics()
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record(perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record(perf_counter() - start)
+        return connection
+
+
+# (datetime field, value it is reset to), coarsest first; a unit resets the fields from its index on
+_TRUNCATED_FIELDS = (("month", 1), ("day", 1), ("hour", 0), ("minute", 0), ("second", 0), ("microsecond", 0))
+_TRUNCATE_FROM = {"month": 1, "week": 2, "day": 2, "hour": 3, "minute": 4}
+
+def _sqlite_date_trunc(unit: str, value: str):
+    """Postgres' date_trunc over the text datetimes SQLAlchemy stores in SQLite."""
+    if value is None:
+        return None
+    moment = datetime.fromisoformat(value)
+    if unit == "week":
+        moment -= timedelta(days=moment.weekday())
+    moment = moment.replace(**dict(_TRUNCATED_FIELDS[_TRUNCATE_FROM[unit]:]))
+    return moment.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+def _register_sqlite_functions(dbapi_connection, connection_record):
+    dbapi_connection.create_function("date_trunc", 2, _sqlite_date_trunc, deterministic=True)
+
+def create_db_engine(url: str = DATABASE_URL, pool: str = DB_POOL):
+    """Create the SQLAlchemy engine with the configured pooling strategy."""
+    if pool == "null":
+        engine = create_engine(url, poolclass=NullPool, pool_pre_ping=DB_POOL_PRE_PING)
+    else:
+        # psycopg2 never uses server-side prepared statements, so the app-side
+        # pool is safe to put in front of a transaction pooler. In that mode the
+        # pooler owns the server connections; keep the client pool small and
+        # never rely on session state (SET, advisory locks, LISTEN) across checkouts.
+        engine = create_engine(
+            url,
+            poolclass=TimedQueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            pool_use_lifo=True,
+        )
+    if engine.dialect.name == "sqlite":
+        # The local benchmark/test database: the log queries bucket with date_trunc
+        event.listen(engine, "connect", _register_sqlite_functions)
+    return engine
+
+def create_async_db_engine(url: str = ASYNC_DATABASE_URL):
+    """Create the asyncpg AsyncEngine with the same pool settings as the sync engine."""
+    connect_args = {"ssl": "require"}
+    if DB_PGBOUNCER:
+        # Transaction poolers hand each transaction to a different server
+        # connection, so asyncpg's named prepared statements must be disabled.
+        connect_args["statement_cache_size"] = 0
+        connect_args["prepared_statement_cache_size"] = 0
+
+    return create_async_engine(
+        url,
+        connect_args=connect_args,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+
+
+# Engines are created by init_engines() (the app's lifespan or a CLI's main),
+# never at import time; the session factories are bound to them then.
+engine = None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+async_engine = None
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+def init_engines():
+    """Create the engines and bind the session factories. Does not connect; safe to call twice."""
+    global engine, async_engine
+    if engine is None:
+        engine = create_db_engine()
+        SessionLocal.configure(bind=engine)
+    if DB_ASYNC and async_engine is None:
+        async_engine = create_async_db_engine()
+        AsyncSessionLocal.configure(bind=async_engine)
+    return engine
+
+async def dispose_engines():
+    """Close every pooled connection; init_engines() can create the engines again."""
+    global engine, async_engine
+    if async_engine is not None:
+        await async_engine.dispose()
+        async_engine = None
+    if engine is not None:
+        engine.dispose()
+        engine = None
+
+def ping_database():
+    """Run SELECT 1 on a pooled connection; raises when the database is unreachable."""
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
 
 def get_session():
     db = SessionLocal()
@@ -28,10 +178,67 @@ def get_session():
         yield db
     finally:
         db.close()
-        
-from sqlalchemy import text  # Import the text function
 
-# Test the database connection
-with engine.connect() as connection:
-    result = connection.execute(text("SELECT 1"))  # Wrap the SQL string in text()
-    print(result.fetchone())
\ No newline at end of file
+async def get_async_session():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def warm_up_pool(count: int = DB_POOL_WARMUP):
+    """Open `count` connections up front so the first requests skip the TLS handshake."""
+    count = min(count, DB_POOL_SIZE)
+    if count <= 0 or engine is None or not isinstance(engine.pool, QueuePool):
+        return 0
+    connections = [engine.pool.connect() for _ in range(count)]
+    for connection in connections:
+        connection.close()
+    return count
+
+def pool_stats():
+    """Return pool occupancy and checkout wait metrics."""
+    if engine is None:
+        return {"pool": "not initialized"}
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"pool": "null"}
+
+    metrics = TimedQueuePool.metrics
+    capacity = pool.size() + DB_MAX_OVERFLOW
+    checked_out = pool.checkedout()
+    return {
+        "pool": "queue",
+        "size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_in": pool.checkedin(),
+        "checked_out": checked_out,
+        "overflow": pool.overflow(),
+        "saturation": checked_out / capacity if capacity else 0.0,
+        "checkouts": metrics.checkouts,
+        "checkout_timeouts": metrics.timeouts,
+        "checkout_wait_avg_seconds": metrics.total_wait / metrics.checkouts if metrics.checkouts else 0.0,
+        "checkout_wait_max_seconds": metrics.max_wait,
+    }
+
+def listen(channels: list, on_notify, stop_event: threading.Event, poll_seconds: float = 5.0):
+    """Block on Postgres LISTEN for `channels`, calling `on_notify(channel, payload)`.
+
+    Uses its own direct connection because LISTEN needs a session that is
+    never handed back to the pool (and does not work through a transaction
+    pooler). Returns when `stop_event` is set; connection errors propagate so
+    the caller can decide how to reconnect.
+    """
+    connection = create_db_engine(pool="null").raw_connection()
+    try:
+        dbapi_connection = connection.driver_connection
+        dbapi_connection.autocommit = True
+        with dbapi_connection.cursor() as cursor:
+            for channel in channels:
+                cursor.execute(f'LISTEN "{channel}"')
+        while not stop_event.is_set():
+            if select.select([dbapi_connection], [], [], poll_seconds) == ([], [], []):
+                continue
+            dbapi_connection.poll()
+            while dbapi_connection.notifies:
+                notify = dbapi_connection.notifies.pop(0)
+                on_notify(notify.channel, notify.payload)
+    finally:
+        connection.close()
@@ -0,0 +1,156 @@
+"""Application logging: JSON lines written from a background thread.
+
+Records are put on a bounded queue by the calling thread and formatted and
+written to stdout by a QueueListener, so a request never waits on stdout.
+Each record carries the request id of the request that produced it (the
+X-Request-ID header, or a generated one), including the SQL statements
+logged with logging_sql=true. Below WARNING, only `logging_sample_rate` of
+the requests are logged, chosen per request so a sampled request keeps all
+of its lines.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from uuid import uuid4
+from fastapi import Request
+
+# Logging settings
+LOGGING_LEVEL = os.getenv("logging_level", "INFO").upper()
+LOGGING_FORMAT = os.getenv("logging_format", "json").lower()  # "json" or "text"
+LOGGING_SAMPLE_RATE = float(os.getenv("logging_sample_rate", 1.0))
+LOGGING_QUEUE_SIZE = int(os.getenv("logging_queue_size", 10000))
+LOGGING_SQL = os.getenv("logging_sql", "false").lower() == "true"
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id = ContextVar("request_id", default=None)
+request_sampled = ContextVar("request_sampled", default=True)
+
+# LogRecord attributes that are not `extra` fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+def is_sampled(req_id: str, rate: float = LOGGING_SAMPLE_RATE) -> bool:
+    """Whether the request's INFO and DEBUG lines are logged; stable for a given id."""
+    if rate >= 1:
+        return True
+    return zlib.crc32(req_id.encode()) % 10000 < rate * 10000
+
+
+class RequestContextFilter(logging.Filter):
+    """Tags records with the current request id and drops unsampled INFO/DEBUG lines."""
+
+    def filter(self, record):
+        record.request_id = request_id.get() or "-"
+        return record.levelno >= logging.WARNING or request_sampled.get()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.request_id != "-":
+            entry["request_id"] = record.request_id
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Merge the arguments now (they may change after the call) but keep the
+        # traceback for the formatter instead of folding it into the message.
+        # The record is updated in place: a copy costs as much as building it,
+        # and any later handler still gets the same message from getMessage().
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler = None
+_listener = None
+
+
+def setup_logging():
+    """Route the root logger through the queue; safe to call more than once."""
+    global _handler, _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    if LOGGING_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    _handler = DroppingQueueHandler(queue.Queue(maxsize=LOGGING_QUEUE_SIZE))
+    _handler.addFilter(RequestContextFilter())
+    # Neither format prints them, and looking them up is a good part of building a record
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(LOGGING_LEVEL)
+    # SQLAlchemy's INFO lines are statements and pool events (the pool subclass logs under utils.db)
+    logging.getLogger("sqlalchemy").setLevel(logging.WARNING)
+    logging.getLogger("utils.db").setLevel(logging.WARNING)
+    if LOGGING_SQL:
+        logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
+
+    _listener = logging.handlers.QueueListener(_handler.queue, output)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Write every queued record and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def logging_stats() -> dict:
+    return {
+        "level": LOGGING_LEVEL,
+        "format": LOGGING_FORMAT,
+        "sample_rate": LOGGING_SAMPLE_RATE,
+        "queued": _handler.queue.qsize() if _handler else 0,
+        "dropped": _handler.dropped if _handler else 0,
+    }
+
+
+async def request_context_middleware(request: Request, call_next):
+    req_id = request.headers.get(REQUEST_ID_HEADER)
+    if not req_id or len(req_id) > 64:
+        req_id = uuid4().hex
+    id_token = request_id.set(req_id)
+    sampled_token = request_sampled.set(is_sampled(req_id))
+    try:
+        response = await call_next(request)
+    finally:
+        request_sampled.reset(sampled_token)
+        request_id.reset(id_token)
+    response.headers[REQUEST_ID_HEADER] = req_id
+    return response
@@ -0,0 +1,146 @@
+import logging
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from fastapi import Request
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Requests slower than this are printed with their SQL (0 disables)
+SLOW_REQUEST_MS = float(os.getenv("slow_request_ms", 0))
+# Statements kept per request for the slow-request log
+SLOW_REQUEST_MAX_STATEMENTS = 50
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"]
+)
+REQUEST_SQL_QUERIES = Histogram(
+    "http_request_sql_queries", "SQL statements executed per request", ["method", "route"],
+    buckets=(0, 1, 2, 3, 4, 5, 8, 12, 20, 50),
+)
+REQUEST_SQL_SECONDS = Histogram(
+    "http_request_sql_duration_seconds", "Time spent in SQL per request", ["method", "route"]
+)
+STAGE_SECONDS = Histogram(
+    "event_stage_duration_seconds", "Time spent in each stage of the event pipeline", ["stage"]
+)
+SQL_STATEMENTS = Counter("sql_statements_total", "SQL statements executed, in and out of requests")
+
+
+class RequestStats:
+    """SQL work done while serving one request."""
+
+    def __init__(self, keep_statements: bool = False):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.statements = [] if keep_statements else None
+
+
+# Set by the metrics middleware; handler threads see the same object
+current_request = ContextVar("current_request", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = perf_counter() - conn.info["query_started"].pop()
+    SQL_STATEMENTS.inc()
+    stats = current_request.get()
+    if stats is None:
+        return
+    stats.queries += 1
+    stats.sql_seconds += elapsed
+    if stats.statements is not None and len(stats.statements) < SLOW_REQUEST_MAX_STATEMENTS:
+        stats.statements.append((elapsed, " ".join(statement.split())))
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    # after_cursor_execute does not run for a failed statement
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Record the duration of one pipeline stage (e.g. "event_update", "log_commit")."""
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(perf_counter() - start)
+
+
+def _route_template(request: Request) -> str:
+    # The path template keeps the label set small (/state/{plant_id}, not /state/42)
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+async def metrics_middleware(request: Request, call_next):
+    stats = RequestStats(keep_statements=SLOW_REQUEST_MS > 0)
+    token = current_request.set(stats)
+    start = perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        elapsed = perf_counter() - start
+        current_request.reset(token)
+        route = _route_template(request)
+        REQUEST_SECONDS.labels(request.method, route, str(status_code)).observe(elapsed)
+        REQUEST_SQL_QUERIES.labels(request.method, route).observe(stats.queries)
+        REQUEST_SQL_SECONDS.labels(request.method, route).observe(stats.sql_seconds)
+        if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+            logger.warning(
+                "Slow request: %s %s %s took %.1f ms, %s SQL statements in %.1f ms",
+                request.method, request.url.path, status_code, elapsed * 1000, stats.queries, stats.sql_seconds * 1000,
+                extra={"statements": [{"ms": round(seconds * 1000, 1), "sql": statement} for seconds, statement in stats.statements]},
+            )
+
+
+class PoolCollector:
+    """Exposes utils.db.pool_stats() as gauges at scrape time.
+
+    `labels` (e.g. {"pid": "1234"}) are added to every gauge.
+    """
+
+    def __init__(self, labels: dict = None):
+        self.labels = labels or {}
+
+    def collect(self):
+        from utils.db import pool_stats
+
+        stats = pool_stats()
+        for name in ("size", "checked_in", "checked_out", "overflow", "saturation",
+                     "checkouts", "checkout_timeouts", "checkout_wait_avg_seconds", "checkout_wait_max_seconds"):
+            if name in stats:
+                gauge = GaugeMetricFamily(f"db_pool_{name}", f"Connection pool {name.replace('_', ' ')}",
+                                          labels=list(self.labels))
+                gauge.add_metric(list(self.labels.values()), stats[name])
+                yield gauge
+
+
+REGISTRY.register(PoolCollector())
+
+
+def metrics_payload() -> bytes:
+    """Prometheus text format for this worker, or for every worker in multiprocess mode."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        # Pool gauges are live values of the worker answering the scrape, not a sum over workers
+        registry.register(PoolCollector({"pid": str(os.getpid())}))
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
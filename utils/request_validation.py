@@ -1,7 +1,8 @@
+from datetime import datetime, timezone
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import select
-from models.schema import PlantEvent, IotDevEvent
+from pydantic import ValidationError
+from models.plantModels import PlantEventUpdate
+from models.iotDevModels import IoTDevPump
 
 def validate_not_none(value, field_name: str):
     """Validate that a value is not None."""
@@ -11,52 +12,84 @@ def validate_not_none(value, field_name: str):
             detail=f"{field_name} cannot be None."
         )
 
-def validate_positive_integer(value, field_name: str):
-    """Validate that a value is a positive integer."""
-    if not isinstance(value, int) or value <= 0:
+def validation_error_detail(errors: list) -> str:
+    """One readable line from pydantic's error list, e.g. "luminosity_event: Input should be ..."."""
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'] if part != 'body')}: {error['msg']}" for error in errors
+    )
+
+# Bucket sizes accepted by date_trunc
+BUCKETS = ("minute", "hour", "day", "week", "month")
+
+def as_utc(value: datetime):
+    """Treat naive timestamps as UTC so they compare with aware ones."""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+def validate_time_window(start: datetime, end: datetime, bucket: str):
+    """Validate the bucket size and that the time window is not empty."""
+    if bucket not in BUCKETS:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"{field_name} must be a positive integer."
+            detail=f"Bucket must be one of: {', '.join(BUCKETS)}."
         )
-        
-def validate_float(value, field_name: str):
-    """Validate that a value is a float."""
-    if not isinstance(value, float):
+    if start >= end:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"{field_name} must be a float."
+            detail="Start must be before end."
         )
 
-def validate_range(value, min_value: int, max_value: int, field_name: str):
-    """Validate that a value is within a specific range."""
-    if not isinstance(value, (int, float)) or value < min_value or value > max_value:
+def validate_plant_event_fields(data) -> dict:
+    """Validate every event field set on a plant update against PlantEventUpdate.
+
+    Returns the column/value pairs to write to PlantEvent.
+    """
+    try:
+        update = PlantEventUpdate.model_validate(data, from_attributes=True)
+    except ValidationError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=validation_error_detail(e.errors()))
+    validate_not_none(update.plant_id, "Plant ID")
+
+    values = update.model_dump(exclude={"plant_id"}, exclude_none=True)
+    if not values:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"{field_name} must be between {min_value} and {max_value}."
+            detail="At least one plant event must be set."
         )
+    return values
+
+def validate_pump_event_fields(data) -> dict:
+    """Validate a device update against IoTDevPump."""
+    validate_not_none(data.pump_event, "Pump event")
+    validate_not_none(data.iot_dev_id, "IoT Device ID")
+    try:
+        update = IoTDevPump.model_validate(data, from_attributes=True)
+    except ValidationError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=validation_error_detail(e.errors()))
+    return {"pump_event": update.pump_event}
 
-def validate_boolean(value, field_name: str):
-    """Validate that a value is a boolean."""
-    if not isinstance(value, bool):
+def event_not_found(label: str, event_id: int) -> HTTPException:
+    """404 for an event UPDATE that matched no row."""
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"{label} with ID {event_id} does not exist."
+    )
+
+def validate_fleet_control(data) -> dict:
+    """Check a fleet control request has exactly one selector and at least one value.
+
+    Returns the column/value pairs to write to every selected PlantEvent.
+    """
+    if (data.plant_ids is None) == (data.iot_dev_id is None):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"{field_name} must be a boolean."
+            detail="Set either plant_ids or iot_dev_id."
         )
-
-def check_plant_event_exists(session: Session, event_id: int):
-    """Check if a PlantEvent with the given ID exists."""
-    exists = session.execute(select(PlantEvent).where(PlantEvent.id == event_id)).scalar_one_or_none()
-    if not exists:
+    values = data.model_dump(exclude={"plant_ids", "iot_dev_id"}, exclude_none=True)
+    if not values:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"PlantEvent with ID {event_id} does not exist."
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one plant event must be set."
         )
-
-def check_iot_dev_event_exists(session: Session, event_id: int):
-    """Check if an IotDevEvent with the given ID exists."""
-    exists = session.execute(select(IotDevEvent).where(IotDevEvent.id == event_id)).scalar_one_or_none()
-    if not exists:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"IotDevEvent with ID {event_id} does not exist."
-        )
\ No newline at end of file
+    return values